@@ -61,12 +61,33 @@ def create_app():
         app.register_blueprint(store_bp)
         app.register_blueprint(mirror_api_bp)
         
-        # Initialize RAG Index
+        # Initialize RAG Index (maps the shared snapshot when it is current)
         try:
             from app.services.rag_service import rag_service
-            rag_service.reload_index()
+            rag_service.load_index()
         except Exception as e:
             app.logger.warning(f"Failed to initialize RAG index: {e}")
+
+        # Initialize Semantic Cache Index
+        try:
+            from app.services.cache_service import cache_service
+            cache_service.load_index()
+        except Exception as e:
+            app.logger.warning(f"Failed to initialize semantic cache index: {e}")
+
+        # Background ingestion of knowledge-base uploads (resumes unfinished jobs)
+        try:
+            from app.services.ingestion_service import ingestion_queue
+            ingestion_queue.start(app)
+        except Exception as e:
+            app.logger.warning(f"Failed to start ingestion queue: {e}")
+
+        # Background refresh of professionals' URL content (chat only reads the cached copy)
+        try:
+            from app.services.url_refresher import url_refresher
+            url_refresher.start(app)
+        except Exception as e:
+            app.logger.warning(f"Failed to start URL refresher: {e}")
     
     return app
 
@@ -54,6 +54,7 @@ class Professional(db.Model):
     rating = db.Column(db.Float, default=0.0)
     total_reviews = db.Column(db.Integer, default=0)
     balance = db.Column(db.Integer, default=0) # Ledger balance for atomic transactions
+    content_generation = db.Column(db.Integer, default=0) # Bumped when chatbot knowledge changes (cache invalidation)
     profile_image = db.Column(db.String(255))
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -278,11 +279,14 @@ class KnowledgeBaseDocument(db.Model):
     text_content = db.Column(db.Text, nullable=True)
     file_size = db.Column(db.Integer, default=0)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set on the hidden document that holds a ProfessionalURL's scraped text (file_type 'url')
+    source_url_id = db.Column(db.Integer, db.ForeignKey('professional_urls.id'), nullable=True)
     
     # Indices for faster lookup
     __table_args__ = (
         db.Index('idx_kbdoc_professional_id', 'professional_id'),
         db.Index('idx_kbdoc_uploaded_at', 'uploaded_at'),
+        db.Index('idx_kbdoc_source_url_id', 'source_url_id'),
     )
     
     def to_dict(self):
@@ -314,6 +318,8 @@ class ProfessionalURL(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     last_fetched = db.Column(db.DateTime, nullable=True)
     cached_content = db.Column(db.Text, nullable=True)
+    etag = db.Column(db.String(255), nullable=True) # validators for conditional GET (url_refresher)
+    last_modified = db.Column(db.String(64), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -343,11 +349,39 @@ class CachedResponse(db.Model):
     professional_id = db.Column(db.Integer, db.ForeignKey('professionals.id'), nullable=False)
     query = db.Column(db.Text, nullable=False)
     response = db.Column(db.Text, nullable=False)
-    embedding = db.Column(db.PickleType, nullable=True) # Store numpy array if needed
+    embedding = db.Column(db.LargeBinary, nullable=True) # float32 bytes, see app/utils/embedding_codec.py
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, nullable=True) # LRU eviction
+    hit_count = db.Column(db.Integer, default=0)
+    generation = db.Column(db.Integer, default=0) # Professional.content_generation when answered
+    query_hash = db.Column(db.String(40), nullable=True) # sha1 of the normalized query (exact-match tier)
     
     __table_args__ = (
         db.Index('idx_cached_responses_prof_id', 'professional_id'),
+        db.Index('idx_cached_responses_prof_last_used', 'professional_id', 'last_used_at'),
+        db.Index('idx_cached_responses_prof_hash', 'professional_id', 'query_hash'),
+    )
+
+class TryOnAttempt(db.Model):
+    """One Gemini call of a virtual try-on and who paid for it (see app/services/tryon_service.py)"""
+    __tablename__ = 'tryon_attempts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tryon_id = db.Column(db.String(36), nullable=False) # groups the attempts of one try-on request
+    client_id = db.Column(db.String(100), nullable=False) # end client (free text)
+    professional_id = db.Column(db.Integer, db.ForeignKey('professionals.id'), nullable=True) # paid with this professional's credits
+    attempt = db.Column(db.Integer, nullable=False)
+    seed = db.Column(db.Integer, nullable=True)
+    status = db.Column(db.String(20), nullable=False) # passed, failed_background, api_error, error, cancelled
+    ssim = db.Column(db.Float, nullable=True)
+    speculative = db.Column(db.Boolean, default=False) # launched concurrently with an earlier attempt
+    billed_to = db.Column(db.String(20), nullable=False) # 'client' (winning attempt) or 'platform' (absorbed)
+    cost_usd = db.Column(db.Float, default=0.0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_tryon_attempts_tryon_id', 'tryon_id'),
+        db.Index('idx_tryon_attempts_client_created', 'client_id', 'created_at'),
     )
 
 class KnowledgeBaseChunk(db.Model):
@@ -356,13 +390,55 @@ class KnowledgeBaseChunk(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     document_id = db.Column(db.Integer, db.ForeignKey('knowledge_base_documents.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
-    embedding = db.Column(db.PickleType, nullable=False) # Store numpy array
+    embedding = db.Column(db.LargeBinary, nullable=False) # float32 bytes, see app/utils/embedding_codec.py
     chunk_index = db.Column(db.Integer, nullable=False)
+    # Structure metadata from app/utils/legal_chunker.py (NULL for unstructured text)
+    article = db.Column(db.String(50), nullable=True) # normalized: '5', '27 bis', 'unico'
+    page = db.Column(db.Integer, nullable=True)
+    heading = db.Column(db.String(255), nullable=True)
     
     __table_args__ = (
         db.Index('idx_kb_chunks_doc_id', 'document_id'),
+        db.Index('idx_kb_chunks_article', 'article'),
     )
 
+class IngestionJob(db.Model):
+    """Background processing of an uploaded knowledge-base file (see app/services/ingestion_service.py)"""
+    __tablename__ = 'ingestion_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    professional_id = db.Column(db.Integer, db.ForeignKey('professionals.id'), nullable=False)
+    document_id = db.Column(db.Integer, db.ForeignKey('knowledge_base_documents.id'), nullable=True)
+    file_path = db.Column(db.String(500), nullable=False)
+    file_type = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), default='queued') # queued, running, done, failed
+    stage = db.Column(db.String(20), default='queued') # extracting, chunking, embedding, indexing
+    chunks_done = db.Column(db.Integer, default=0)
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, nullable=True)
+    worker = db.Column(db.String(100), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('idx_ingestion_jobs_status', 'status'),
+        db.Index('idx_ingestion_jobs_professional_id', 'professional_id'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'document_id': self.document_id,
+            'status': self.status,
+            'stage': self.stage,
+            'chunks_done': self.chunks_done,
+            'attempts': self.attempts,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
 class Specialty(db.Model):
     __tablename__ = 'specialties'
     
@@ -1,21 +1,28 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
+from app import db
+from app.models import Professional, TryOnAttempt
 from app.services.gemini_service import gemini_service
-import base64
+from app.utils.image_payload import ImageBlob, ImagePayloadError, request_image, request_images
 import io
+import uuid
 from PIL import Image, PngImagePlugin
 import json
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
 @api_bp.route('/process-closet-item', methods=['POST'])
-def process_closet_item():
+async def process_closet_item():
+    """
+    Image as multipart file 'image' (+ form field 'category'), as a raw
+    image/* body (?category=...), or as base64 in JSON {image, category}.
+    """
     try:
-        data = request.json
-        if not data or 'image' not in data:
+        image = request_image('image')
+        if image is None:
             return jsonify({'success': False, 'error': 'No image provided'}), 400
             
-        image_data = data['image']
-        category = data.get('category', 'Clothing')
+        data = request.get_json(silent=True) or {}
+        category = request.values.get('category') or data.get('category', 'Clothing')
         
         # CONSTANTS FOR QUALITY CONTROL
         INVENTORY_STYLE_PROMPT_BASE = "Transforma este artículo de ropa en una imagen de 512x512 píxeles. Coloca la prenda perfectamente centrada sobre un FONDO BLANCO PURO (#FFFFFF). Aplica un estilo de FLAT DESIGN, elimina todas las sombras, arrugas y texturas complejas para crear un aspecto plano y uniforme. El estilo debe ser el de una foto profesional de inventario de e-commerce. CRITICAL RULES: ONLY change the background and stylization to inventory format. The original garment details must be preserved."
@@ -38,10 +45,9 @@ def process_closet_item():
         Iluminación profesional de producto, fondo blanco o neutro, estilo de catálogo de ropa, detalles nítidos.
         """
         
-        print(f"DEBUG: Sending to AI with Seed {FIXED_AI_SEED}")
-        print(f"DEBUG: Final Prompt: {final_prompt}")
+        current_app.logger.debug(f"Closet item analysis ({category}) with seed {FIXED_AI_SEED}")
 
-        analysis = gemini_service.analyze_image(image_data, final_prompt, seed=FIXED_AI_SEED)
+        analysis = await gemini_service.analyze_image_async(image, final_prompt, seed=FIXED_AI_SEED)
         
         if not analysis['success']:
             return jsonify({'success': False, 'error': analysis.get('error')}), 500
@@ -51,14 +57,8 @@ def process_closet_item():
         # 2. Steganography / Metadata Embedding
         # We will embed the description into the PNG metadata (tEXt chunk)
         
-        # Decode base64 image
-        if "base64," in image_data:
-            header, encoded = image_data.split("base64,", 1)
-        else:
-            encoded = image_data
-            
-        img_bytes = base64.b64decode(encoded)
-        img = Image.open(io.BytesIO(img_bytes))
+        # Same decoded bytes that were sent to Gemini
+        img = Image.open(io.BytesIO(image.data))
         
         # Create metadata
         meta = PngImagePlugin.PngInfo()
@@ -69,10 +69,9 @@ def process_closet_item():
         # Save to bytes with metadata
         output = io.BytesIO()
         img.save(output, format="PNG", pnginfo=meta)
-        output.seek(0)
         
-        # Re-encode to base64
-        processed_base64 = "data:image/png;base64," + base64.b64encode(output.getvalue()).decode('utf-8')
+        # Encode to base64 only for the JSON response
+        processed_base64 = ImageBlob(output.getvalue(), 'image/png').data_uri()
         
         return jsonify({
             'success': True,
@@ -80,45 +79,75 @@ def process_closet_item():
             'description': description
         })
         
+    except ImagePayloadError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
-        print(f"Error processing item: {str(e)}")
+        current_app.logger.error(f"Error processing item: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @api_bp.route('/virtual-try-on', methods=['POST'])
-def virtual_try_on():
+async def virtual_try_on():
+    """
+    multipart: file 'person_image', files 'item_images' and form field
+    'items' (JSON list of {id, category}, same order as the files).
+    JSON (older clients): {person_image, items: [{id, category, image}]}, images in base64.
+    With a professional's bearer token the try-on is paid with their
+    credits (1 credit, only when it succeeds); anonymous try-ons are not
+    charged and the platform absorbs every attempt.
+    """
     try:
-        data = request.json
-        if not data or 'person_image' not in data or 'items' not in data:
+        data = request.get_json(silent=True) or {}
+        person_image = request_image('person_image')
+        if request.files:
+            item_images = request_images('item_images')
+            items = _parse_items(json.loads(request.form.get('items') or '[]'))
+            if len(items) != len(item_images):
+                return jsonify({'success': False, 'error': 'items and item_images do not match'}), 400
+            for item, image in zip(items, item_images):
+                item['image'] = image
+        else:
+            # Closet inventory items are stored as {id, categoria, imagen_base64}
+            items = [
+                dict(item,
+                     category=item.get('category') or item.get('categoria'),
+                     image=ImageBlob.from_base64(item.get('image') or item['imagen_base64']))
+                for item in _parse_items(data.get('items') or [])
+            ]
+            
+        if person_image is None or not items:
             return jsonify({'success': False, 'error': 'Missing person_image or items'}), 400
             
-        person_image = data['person_image']
-        items = data['items'] # List of {id, category, image}
-        client_id = data.get('client_id', 'unknown_client') # Should come from auth
+        payer = _tryon_payer()
+        # Cheap balance check first: no Gemini calls for a try-on that cannot
+        # be paid (the deduction in _record_attempts checks again under the lock)
+        if payer is not None and (payer.balance or 0) < 1:
+            return jsonify({'success': False, 'error': 'Créditos insuficientes. Por favor recarga tu cuenta.'}), 402
+            
+        # End client (free text); the payer, if any, is the professional
+        client_id = request.values.get('client_id') or data.get('client_id') or (
+            f'professional:{payer.id}' if payer is not None else 'unknown_client'
+        )
         
         # Initialize Robust Manager
         from app.services.tryon_service import VirtualTryOnManager, TryOnStatus
         manager = VirtualTryOnManager(client_id)
         
         # Execute with Retries & Validation
-        result = manager.virtual_tryon(person_image, items)
+        result = await manager.virtual_tryon(person_image, items)
         
         # ===== BILLING LOGIC (CRITICAL) =====
-        # Only charge 1 credit if SUCCESS
-        client_charged = 0
-        platform_absorbed = 0.0
-        
-        if result["status"] == TryOnStatus.SUCCESS.value:
-            client_charged = 1
-            # Calculate absorbed cost (mock cost per attempt)
-            cost_per_attempt = 0.05 
-            attempts = result.get("attempts", 1)
-            platform_absorbed = (attempts - 1) * cost_per_attempt
-            
-            # TODO: Call actual DB function to deduct credit
-            # db.deduct_credit(client_id, 1)
-            # db.log_absorbed_cost(client_id, platform_absorbed)
-            
-            print(f"BILLING: Charged Client {client_charged} credit. Platform absorbed ${platform_absorbed:.2f} (Attempts: {attempts})")
+        # Only charge 1 credit if SUCCESS; every other launched attempt
+        # (failed, or cancelled speculative ones) is absorbed by the platform
+        attempt_records = result.get("attempt_records", [])
+        client_charged = _record_attempts(
+            uuid.uuid4().hex, client_id, payer.id if payer is not None else None, attempt_records,
+            charge=result["status"] == TryOnStatus.SUCCESS.value
+        )
+        platform_absorbed = round(sum(r['cost_usd'] for r in attempt_records if r['billed_to'] == 'platform'), 4)
+        current_app.logger.info(
+            f"Try-on billing: {client_id} charged {client_charged} credit, "
+            f"platform absorbed ${platform_absorbed:.2f} (attempts: {result.get('attempts', 0)})"
+        )
 
         return jsonify({
             'success': result["status"] == TryOnStatus.SUCCESS.value,
@@ -126,6 +155,7 @@ def virtual_try_on():
             'description': result.get("description"),
             'status': result["status"],
             'attempts': result.get("attempts"),
+            'winning_attempt': result.get("winning_attempt"),
             'billing': {
                 'client_charged': client_charged,
                 'platform_absorbed': platform_absorbed,
@@ -134,6 +164,74 @@ def virtual_try_on():
             'logs': result.get("logs")
         })
 
+    except (ImagePayloadError, KeyError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid request: {e}'}), 400
     except Exception as e:
-        print(f"Error in virtual try-on: {str(e)}")
+        current_app.logger.error(f"Error in virtual try-on: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
+
+def _parse_items(items):
+    """Try-on items: a list of objects; base64 images (JSON body) must be strings"""
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError("'items' must be a list of objects")
+    for item in items:
+        for key in ('image', 'imagen_base64'):
+            if item.get(key) is not None and not isinstance(item[key], str):
+                raise ValueError(f"'{key}' must be a base64 string")
+    return items
+
+def _tryon_payer():
+    """Professional of the bearer token, whose credits pay the try-on (None if anonymous)"""
+    from app.utils.auth_utils import get_token_from_header, decode_token
+    token = get_token_from_header()
+    payload = decode_token(token) if token else None
+    if not payload:
+        return None
+    return Professional.query.filter_by(user_id=payload['user_id']).first()
+
+def _record_attempts(tryon_id, client_id, professional_id, attempt_records, charge):
+    """
+    Billing trail (one TryOnAttempt row per launched attempt) and, when
+    charge is set, the 1 credit deduction from professional_id (None:
+    anonymous, nothing to charge), committed in one transaction.
+    Returns the credits actually charged; an unpaid winning attempt is
+    re-billed to the platform in attempt_records.
+    """
+    charged = 0
+    try:
+        if charge:
+            # Same atomic deduction as the chat: lock the professional row
+            prof_locked = None
+            if professional_id is not None:
+                prof_locked = db.session.query(Professional).with_for_update().get(professional_id)
+            if prof_locked and (prof_locked.balance or 0) >= 1:
+                prof_locked.balance -= 1
+                charged = 1
+            else:
+                # Anonymous, or balance spent by a concurrent request meanwhile
+                _absorb_client_attempts(attempt_records)
+        for record in attempt_records:
+            db.session.add(TryOnAttempt(
+                tryon_id=tryon_id,
+                client_id=client_id,
+                professional_id=professional_id,
+                attempt=record['attempt'],
+                seed=record['seed'],
+                status=record['status'],
+                ssim=record['ssim'],
+                speculative=record['speculative'],
+                billed_to=record['billed_to'],
+                cost_usd=record['cost_usd']
+            ))
+        db.session.commit()
+        return charged
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error recording try-on billing: {str(e)}")
+        _absorb_client_attempts(attempt_records)
+        return 0
+
+def _absorb_client_attempts(attempt_records):
+    for record in attempt_records:
+        if record['billed_to'] == 'client':
+            record['billed_to'] = 'platform'
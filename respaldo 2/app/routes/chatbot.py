@@ -1,20 +1,25 @@
 # Chatbot Routes - Gemini Integration
 
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from app import db
 from app.models import Professional, ChatbotConfig, ChatMessage, Credit, Service
-from app.utils.auth_utils import login_required, professional_required
+from app.utils.auth_utils import login_required, professional_required, admin_required
 from app.utils.validators import success_response
 from app.utils.error_handler import error_response
 from app.extensions import limiter
 import uuid
 import os
+import json
 
 import traceback
 from app.services.gemini_service import gemini_service
 from app.services.rag_service import rag_service
+from app.services.cache_service import cache_service
+from app.services.context_assembler import context_assembler
+from app.utils.prompt_builder import PromptBuilder, estimate_tokens
+from app.services.ingestion_service import ingestion_queue
+from app.services.content_generation import bump_generation
 from app.utils.file_extractor import FileExtractor
-from app.utils.web_scraper import WebScraper
 from werkzeug.utils import secure_filename
 # Crear carpeta de uploads si no existe
 UPLOAD_FOLDER = 'uploads/knowledge_base'
@@ -60,23 +65,126 @@ def get_config(profesional_id):
         'specialty': prof.specialty
     })
 
-@chatbot_bp.route('/<int:profesional_id>/chat', methods=['POST'])
-@chatbot_bp.route('/<int:profesional_id>/mensaje', methods=['POST'])
-@limiter.limit("10 per minute") # VULN-004 Fix
-def send_message(profesional_id):
-    """Send message to professional's chatbot"""
-    data = request.get_json()
+# ---------------------------------------------------------
+# CONTEXT SOURCES (run by context_assembler, each in its own app context)
+# ---------------------------------------------------------
+def _services_source(profesional_id):
+    services = Service.query.filter_by(professional_id=profesional_id).all()
+    return [f"{s.name}: {s.description}" if s.description else s.name for s in services]
+
+def _history_source(session_id):
+    """Last 9 messages of the session as (role, content), oldest first (the 10th is the current one)"""
+    recent_messages = ChatMessage.query.filter_by(
+        session_id=session_id
+    ).order_by(ChatMessage.created_at.desc()).limit(9).all()
+    return [(msg.role, msg.content) for msg in reversed(recent_messages)]
+
+# ---------------------------------------------------------
+# PROMPT (token-budgeted, see app/utils/prompt_builder.py)
+# ---------------------------------------------------------
+PROMPT_MAX_TOKENS = int(os.getenv('CHAT_PROMPT_MAX_TOKENS', 8000)) # input + reserved output
+PROMPT_MIN_INPUT_TOKENS = 2000
+
+def _render_prompt(prof_name, parts):
+    documents_context = ""
+    if parts['rag']:
+        documents_context = f"\n\n=== INFORMACIÓN RELEVANTE (RAG) ===\n{parts['rag']}\n"
+
+    system_instruction = f"""
+    Eres el asistente virtual de {prof_name}. Tu objetivo es responder dudas sobre trámites IMSS basándote EXCLUSIVAMENTE en el contexto proporcionado.
+    
+    Reglas:
+    1. TU ÚNICA FUENTE DE VERDAD es el contexto proporcionado (Documentos y URLs).
+    2. NO INVENTES información. Si la respuesta no está explícitamente en el contexto, responde: "Lamento no tener esa información específica. Por favor, contacte directamente a {prof_name}."
+    3. TU ROL es ser el asistente virtual de {prof_name}. No respondas sobre temas ajenos a sus servicios profesionales.
+    4. Sé conciso y profesional.
+    5. Formato de respuesta: Markdown.
+    
+    Instrucciones Personalizadas del Profesional:
+    {parts['system_prompt']}
+    """
+
+    user_prompt = f"""
+    === INSTRUCCIONES MANUALES DEL USUARIO (Puede estar vacío) ===
+    {parts['knowledge_base']}
+    
+    === DOCUMENTOS RECUPERADOS (RAG) ===
+    {documents_context}
+
+    === SERVICIOS OFRECIDOS ===
+    {parts['services'] or "servicios profesionales de calidad"}
+
+    === HISTORIAL DE CONVERSACIÓN RECIENTE ===
+    {parts['history']}
+
+    === MENSAJE ACTUAL DEL USUARIO ===
+    {parts['message']}
+    """
     
+    # Combine for current API implementation (until system_instruction param is supported in gemini_service)
+    return f"{system_instruction}\n\n{user_prompt}"
+
+def _build_prompt(prof_name, config, message, context):
+    """
+    Fit the assembled context into the input budget: CHAT_PROMPT_MAX_TOKENS
+    minus the answer length configured in ChatbotConfig.max_tokens.
+    Returns (full_prompt, builder); builder.summary() has the token counts.
+    """
+    system_prompt = config.system_prompt if config and config.system_prompt else f"Eres un asistente útil para el profesional {prof_name}."
+    knowledge_base = config.knowledge_base if config and config.knowledge_base else ""
+    output_tokens = (config.max_tokens if config else None) or 1000
+
+    # Previous messages of the session plus the one being answered
+    if 'history' in context.dropped or 'history' in context.failed:
+        history = ["(Error recuperando historial)"]
+    else:
+        history = [
+            f"{'Usuario' if role == 'user' else 'Asistente'}: {content}"
+            for role, content in list(context['history']) + [('user', message)]
+        ]
+
+    empty = dict.fromkeys(('system_prompt', 'knowledge_base', 'rag', 'services', 'history', 'message'), "")
+    builder = PromptBuilder(
+        max(PROMPT_MAX_TOKENS - output_tokens, PROMPT_MIN_INPUT_TOKENS),
+        overhead_tokens=estimate_tokens(_render_prompt(prof_name, empty))
+    )
+    builder.add('system_prompt', system_prompt, required=True, max_tokens=800)
+    builder.add('message', message, required=True, max_tokens=1000)
+    # Retrieved chunks come best first: the least relevant ones are dropped first
+    builder.add('rag', context['rag'], priority=1, separator="\n\n---\n\n")
+    # upload_document keeps appending to the manual knowledge base: capped
+    builder.add('knowledge_base', knowledge_base, priority=2, max_tokens=1500)
+    builder.add('history', history, priority=3, keep='tail', item_max_tokens=150, max_tokens=1200)
+    builder.add('services', context['services'], priority=4, separator="\n- ", max_tokens=300)
+
+    return _render_prompt(prof_name, builder.fit()), builder
+
+def _with_timings(response, context):
+    """Attach per-source context latency as a Server-Timing header"""
+    body, status = response
+    body.headers['Server-Timing'] = context.server_timing()
+    return body, status
+
+def _prepare_chat(profesional_id, data):
+    """
+    First half of a chat turn, shared by /chat and /chat/stream: validation,
+    context assembly, credit deduction and the user message (both pending,
+    committed by _finish_chat). Returns (turn, None) or (None, error response).
+    """
+    data = data or {}
     message = data.get('message') or data.get('mensaje')
     session_id = data.get('session_id') or str(uuid.uuid4())
     
     if not message:
-        return error_response('Mensaje requerido')
+        return None, error_response('Mensaje requerido')
     
     # Get professional
     prof = Professional.query.get(profesional_id)
     if not prof or not prof.is_active:
-        return error_response('Profesional no encontrado', 404)
+        return None, error_response('Profesional no encontrado', 404)
+    
+    # Knowledge version this answer is built on (semantic cache invalidation)
+    content_generation = prof.content_generation or 0
     
     # Check if requester is owner/admin
     is_owner = False
@@ -100,7 +208,29 @@ def send_message(profesional_id):
     config = ChatbotConfig.query.filter_by(professional_id=profesional_id).first()
     
     if (not config or not config.is_active) and not is_owner:
-        return error_response('Chatbot no disponible para este profesional', 404)
+        return None, error_response('Chatbot no disponible para este profesional', 404)
+
+    # Cheap balance check first: no retrieval/embedding work for a turn that
+    # cannot be paid (the atomic deduction below checks again under the lock)
+    if not is_owner and (prof.balance or 0) < 1:
+        return None, error_response('Créditos insuficientes. Por favor recarga tu cuenta.', 402)
+
+    # ---------------------------------------------------------
+    # CONTEXT ASSEMBLY (concurrent, bounded by CONTEXT_BUDGET_MS)
+    # ---------------------------------------------------------
+    # Runs before the credit lock so the professional row is not held while
+    # waiting on retrieval. Late sources fall back to their default.
+    # The cache source only reads; its writes are applied by _finish_chat.
+    context = context_assembler.assemble({
+        'cache': lambda: cache_service.lookup(message, profesional_id),
+        'rag': lambda: rag_service.retrieve_chunks(message, profesional_id, top_k=15),
+        'services': lambda: _services_source(profesional_id),
+        'history': lambda: _history_source(session_id)
+    }, defaults={
+        'rag': [],
+        'services': [],
+        'history': []
+    }, decisive=('cache',))
     
     # Check credits (bypass for owner/admin)
     available_credits = 9999 # Default for owner/admin
@@ -113,13 +243,13 @@ def send_message(profesional_id):
             prof_locked = db.session.query(Professional).with_for_update().get(profesional_id)
             
             if not prof_locked:
-                return error_response('Profesional no encontrado', 404)
+                return None, error_response('Profesional no encontrado', 404)
 
             # Check balance directly from the ledger column
             available_credits = prof_locked.balance
             
             if available_credits < 1:
-                return error_response('Créditos insuficientes. Por favor recarga tu cuenta.', 402)
+                return None, error_response('Créditos insuficientes. Por favor recarga tu cuenta.', 402)
                 
             # Deduct credit ATOMICALLY (Pending commit at end of request)
             # We deduct 1 credit tentatively. If cache hit, we might refund or not deduct.
@@ -131,7 +261,7 @@ def send_message(profesional_id):
         except Exception as e:
             db.session.rollback()
             current_app.logger.error(f"Database Error during credit lock: {e}")
-            return error_response('Error procesando transacción de créditos', 500)
+            return None, error_response('Error procesando transacción de créditos', 500)
     
     # Save user message
     user_message = ChatMessage(
@@ -144,20 +274,16 @@ def send_message(profesional_id):
     db.session.add(user_message)
     
     # Get services
-    services = Service.query.filter_by(professional_id=profesional_id).all()
-    services_list = [f"{s.name}: {s.description}" if s.description else s.name for s in services]
+    services_list = context['services']
     services_text = "\n- ".join(services_list) if services_list else "servicios profesionales de calidad"
     
     # Use configured welcome message
     welcome_msg = config.welcome_message if config and config.welcome_message else f"Hola! Soy {prof.user.full_name}"
     
-    # Build context for Gemini
-    system_prompt = config.system_prompt if config and config.system_prompt else f"Eres un asistente útil para el profesional {prof.user.full_name}."
-    knowledge_base = config.knowledge_base if config and config.knowledge_base else ""
-    
     # NUEVO: RAG Context Retrieval (Optimized)
-    # Instead of loading all docs, we fetch relevant chunks
-    rag_context = rag_service.retrieve_context(message, profesional_id, top_k=15)
+    # Instead of loading all docs, we fetch relevant chunks (URL passages included,
+    # tagged with 'Fuente: <url>')
+    rag_chunks = context['rag']
     
     # DEBUG: Log RAG context
     try:
@@ -165,220 +291,129 @@ def send_message(profesional_id):
             f.write(f"\n=== CHAT REQUEST ===\n")
             f.write(f"Prof ID: {profesional_id}\n")
             f.write(f"Message: {message}\n")
-            f.write(f"RAG Context Length: {len(rag_context) if rag_context else 0}\n")
-            f.write(f"RAG Context Preview: {rag_context[:200] if rag_context else 'None'}\n")
+            f.write(f"RAG Chunks: {len(rag_chunks)}\n")
+            f.write(f"RAG Context Preview: {rag_chunks[0][:200] if rag_chunks else 'None'}\n")
+            f.write(f"Context timings: {context.summary()}\n")
             f.write("====================\n")
     except Exception as e:
         pass
-    
-    documents_context = ""
-    if rag_context:
-        documents_context = f"\n\n=== INFORMACIÓN RELEVANTE (RAG) ===\n{rag_context}\n"
-    else:
-        # Fallback: If no RAG context, try legacy full load (optional, maybe skip to save tokens)
-        # For now, we keep it empty to enforce RAG usage and save costs.
-        pass
 
-    # NUEVO: Obtener URLs del profesional (Keep this as is for now, or RAG it too later)
-    # Legacy full-load removed in favor of RAG
-    # kb_documents query removed
+    cache_lookup = context['cache']
 
-    # NUEVO: Obtener URLs del profesional
-    from app.models import ProfessionalURL
-    from datetime import datetime, timedelta
-    
-    prof_urls = ProfessionalURL.query.filter_by(
-        professional_id=profesional_id,
-        is_active=True
-    ).all()
-    
-    with open('debug_chatbot.txt', 'a') as f:
-        f.write(f"DEBUG: Found {len(prof_urls)} URLs for prof {profesional_id}\n")
-    
-    urls_context = ""
-    if prof_urls:
-        urls_context = "\n\n=== CONTENIDO EXTERNO (URLS) ===\n"
-        for p_url in prof_urls:
-            # Check cache (1 hour)
-            should_scrape = False
-            if not p_url.cached_content or not p_url.last_fetched:
-                should_scrape = True
-            else:
-                # If older than 1 hour
-                if datetime.utcnow() - p_url.last_fetched > timedelta(hours=1):
-                    should_scrape = True
-            
-            with open('debug_chatbot.txt', 'a') as f:
-                f.write(f"DEBUG: URL {p_url.url}, should_scrape={should_scrape}\n")
-            
-            content = p_url.cached_content
-            
-            if should_scrape:
-                with open('debug_chatbot.txt', 'a') as f:
-                    f.write(f"Scraping URL: {p_url.url}\n")
-                
-                scrape_result = WebScraper.fetch_and_clean(p_url.url)
-                
-                if scrape_result['success']:
-                    content = scrape_result['content']
-                    # Update DB
-                    p_url.cached_content = content
-                    p_url.last_fetched = datetime.utcnow()
-                    db.session.commit()
-                else:
-                    with open('debug_chatbot.txt', 'a') as f:
-                        f.write(f"Failed to scrape {p_url.url}: {scrape_result.get('error')}\n")
-            
-            if content:
-                urls_context += f"\nFuente: {p_url.url}\n{content[:3000]}\n"
+    turn = {
+        'profesional_id': profesional_id,
+        'prof': prof,
+        'config': config,
+        'message': message,
+        'session_id': session_id,
+        'content_generation': content_generation,
+        'available_credits': available_credits,
+        'context': context,
+        'cache_lookup': cache_lookup,
+        'cached_response': cache_lookup.response if cache_lookup else None,
+        'services_text': services_text,
+        'welcome_msg': welcome_msg
+    }
+    return turn, None
 
-    # Construir contexto de documentos
-    # Append URL context to RAG context
-    documents_context += urls_context
+def _finish_chat(turn, assistant_content, credits_used, cached=False):
+    """Save the assistant message and commit the turn (credit deduction included). Returns the response data."""
+    assistant_message = ChatMessage(
+        professional_id=turn['profesional_id'],
+        session_id=turn['session_id'],
+        role='assistant',
+        content=assistant_content,
+        credits_used=credits_used
+    )
+    db.session.add(assistant_message)
+    db.session.commit()
 
-    # ---------------------------------------------------------
-    # CONVERSATION HISTORY (CONTEXT MEMORY)
-    # ---------------------------------------------------------
-    try:
-        # Fetch last 10 messages for this session to maintain context
-        recent_messages = ChatMessage.query.filter_by(
-            session_id=session_id
-        ).order_by(ChatMessage.created_at.desc()).limit(10).all()
-        
-        # Reverse to chronological order (oldest first)
-        recent_messages.reverse()
-        
-        conversation_history = ""
-        if recent_messages:
-            for msg in recent_messages:
-                role_label = "Usuario" if msg.role == 'user' else "Asistente"
-                conversation_history += f"{role_label}: {msg.content}\n"
-        else:
-            conversation_history = "(Sin historial previo)"
-    except Exception as e:
-        print(f"ERROR FETCHING HISTORY: {e}")
-        traceback.print_exc()
-        conversation_history = "(Error recuperando historial)"
+    _apply_cache_lookup(turn)
 
-    # Construct full prompt
-    # Construct optimized prompt
-    system_instruction = f"""
-    Eres el asistente virtual de {prof.user.full_name}. Tu objetivo es responder dudas sobre trámites IMSS basándote EXCLUSIVAMENTE en el contexto proporcionado.
-    
-    Reglas:
-    1. TU ÚNICA FUENTE DE VERDAD es el contexto proporcionado (Documentos y URLs).
-    2. NO INVENTES información. Si la respuesta no está explícitamente en el contexto, responde: "Lamento no tener esa información específica. Por favor, contacte directamente a {prof.user.full_name}."
-    3. TU ROL es ser el asistente virtual de {prof.user.full_name}. No respondas sobre temas ajenos a sus servicios profesionales.
-    4. Sé conciso y profesional.
-    5. Formato de respuesta: Markdown.
-    
-    Instrucciones Personalizadas del Profesional:
-    {system_prompt}
-    """
+    return {
+        'session_id': turn['session_id'],
+        'respuesta': assistant_content,
+        'message': assistant_content,
+        'credits_remaining': turn['available_credits'] - credits_used,
+        'cached': cached # Frontend can show "⚡" icon
+    }
 
-    user_prompt = f"""
-    === INSTRUCCIONES MANUALES DEL USUARIO (Puede estar vacío) ===
-    {knowledge_base}
-    
-    === DOCUMENTOS RECUPERADOS (RAG) ===
-    {documents_context}
+def _apply_cache_lookup(turn):
+    """Hit count/evictions found by the cache lookup, written on the request thread once the turn is committed"""
+    cache_lookup = turn['cache_lookup']
+    if cache_lookup is None:
+        return
+    try:
+        cache_service.apply_lookup(cache_lookup)
+        db.session.commit()
+    except Exception as cache_e:
+        db.session.rollback()
+        current_app.logger.error(f"Cache Error: {cache_e}")
 
-    === SERVICIOS OFRECIDOS ===
-    {services_text}
+def _save_to_cache(turn, assistant_content):
+    """Cache the answer. Call after _finish_chat: add_to_cache commits (or rolls back) the session."""
+    try:
+        cache_service.add_to_cache(turn['message'], assistant_content, turn['profesional_id'], turn['content_generation'])
+    except Exception as cache_e:
+        current_app.logger.error(f"Cache Error: {cache_e}")
 
-    === HISTORIAL DE CONVERSACIÓN RECIENTE ===
-    {conversation_history}
+def _chat_prompt(turn):
+    """Build context for Gemini, fitted into the token budget"""
+    full_prompt, prompt = _build_prompt(turn['prof'].user.full_name, turn['config'], turn['message'], turn['context'])
+    current_app.logger.info(f"Chat prompt for professional {turn['profesional_id']}: {prompt.summary()}")
+    return full_prompt
 
-    === MENSAJE ACTUAL DEL USUARIO ===
-    {message}
-    """
-    
-    # Combine for current API implementation (until system_instruction param is supported in gemini_service)
-    full_prompt = f"{system_instruction}\n\n{user_prompt}"
+@chatbot_bp.route('/<int:profesional_id>/chat', methods=['POST'])
+@chatbot_bp.route('/<int:profesional_id>/mensaje', methods=['POST'])
+@limiter.limit("10 per minute") # VULN-004 Fix
+async def send_message(profesional_id):
+    """Send message to professional's chatbot (async: the Gemini call is awaited on the shared gemini-io loop)"""
+    turn, error = _prepare_chat(profesional_id, request.get_json())
+    if error:
+        return error
+    context = turn['context']
 
     # ---------------------------------------------------------
     # SEMANTIC CACHE CHECK
     # ---------------------------------------------------------
-    from app.services.cache_service import cache_service
-    
-    # Try to get from cache first
-    cached_response = cache_service.get_cached_response(message, profesional_id)
+    # Looked up concurrently with the rest of the context
+    cached_response = turn['cached_response']
     
     if cached_response:
         # CACHE HIT
-        assistant_content = cached_response
-        credits_to_deduct = 0 # Optional: Charge 0 or reduced credits for cached hits?
-        # Let's charge 0 for now to incentivize efficiency, or 1 if business model requires.
-        # Decision: Charge 0 to demonstrate value of AI optimization to user.
-        
+        # Charge 0 to demonstrate value of AI optimization to user.
         # Save assistant message (marked as cached)
-        assistant_message = ChatMessage(
-            professional_id=profesional_id,
-            session_id=session_id,
-            role='assistant',
-            content=assistant_content,
-            credits_used=credits_to_deduct 
-        )
-        db.session.add(assistant_message)
-        db.session.commit()
-        
-        return success_response({
-            'session_id': session_id,
-            'respuesta': assistant_content,
-            'message': assistant_content,
-            'credits_remaining': available_credits - credits_to_deduct,
-            'cached': True # Frontend can show "⚡" icon
-        })
+        return _with_timings(success_response(_finish_chat(turn, cached_response, 0, cached=True)), context)
 
     # ---------------------------------------------------------
     # GEMINI API CALL (CACHE MISS)
     # ---------------------------------------------------------
+    full_prompt = _chat_prompt(turn)
+    cacheable = False
 
     try:
         # Call Gemini API
-        analysis = gemini_service.analyze_inquiry(full_prompt)
-        
+        analysis = await gemini_service.analyze_inquiry_async(full_prompt)
+
         if analysis['success']:
             assistant_content = analysis['content']
-            
-            # SAVE TO CACHE
-            try:
-                cache_service.add_to_cache(message, assistant_content, profesional_id)
-            except Exception as cache_e:
-                current_app.logger.error(f"Cache Error: {cache_e}")
-            
+            cacheable = True
+
         else:
             # Fallback in case of API error
             current_app.logger.error(f"Gemini API Error: {analysis.get('error')}")
             with open('debug_chatbot.txt', 'a') as f:
                 f.write(f"GEMINI API ERROR: {analysis.get('error')}\n")
-            assistant_content = f"{welcome_msg}. Lo siento, en este momento no puedo procesar tu solicitud inteligente. Mis servicios incluyen:\n- {services_text}"
+            assistant_content = f"{turn['welcome_msg']}. Lo siento, en este momento no puedo procesar tu solicitud inteligente. Mis servicios incluyen:\n- {turn['services_text']}"
             
     except Exception as e:
         current_app.logger.error(f"Error calling Gemini service: {str(e)}")
         with open('debug_chatbot.txt', 'a') as f:
             f.write(f"EXCEPTION CALLING GEMINI: {str(e)}\n{traceback.format_exc()}\n")
-        assistant_content = f"{welcome_msg}. Disculpa, tuve un problema técnico. ¿Podrías intentar de nuevo?"
-    
-    # Save assistant message
-    assistant_message = ChatMessage(
-        professional_id=profesional_id,
-        session_id=session_id,
-        role='assistant',
-        content=assistant_content,
-        credits_used=1
-    )
-    db.session.add(assistant_message)
+        assistant_content = f"{turn['welcome_msg']}. Disculpa, tuve un problema técnico. ¿Podrías intentar de nuevo?"
     
     try:
-        db.session.commit()
-        return success_response({
-            'session_id': session_id,
-            'respuesta': assistant_content,
-            'message': assistant_content,
-            'credits_remaining': available_credits - 1,
-            'cached': False
-        })
+        response_data = _finish_chat(turn, assistant_content, 1)
     except Exception as e:
         db.session.rollback()
         try:
@@ -388,6 +423,89 @@ def send_message(profesional_id):
             pass
         return error_response(f'Error: {str(e)}', 500)
 
+    # SAVE TO CACHE (once the turn is committed: a cache failure cannot undo the charge)
+    if cacheable:
+        _save_to_cache(turn, assistant_content)
+    return _with_timings(success_response(response_data), context)
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@chatbot_bp.route('/<int:profesional_id>/chat/stream', methods=['POST'])
+@limiter.limit("10 per minute") # VULN-004 Fix
+def send_message_stream(profesional_id):
+    """
+    Same as /chat, but the answer is streamed as Server-Sent Events:
+      event: start  {session_id}
+      event: token  {text}            (repeated)
+      event: done   {same data as /chat}
+      event: error  {error}
+    The assistant message, the credit deduction and the cache write are
+    committed once the stream completes.
+    """
+    turn, error = _prepare_chat(profesional_id, request.get_json())
+    if error:
+        return error
+    context = turn['context']
+    cached_response = turn['cached_response']
+    full_prompt = None if cached_response else _chat_prompt(turn)
+
+    @stream_with_context
+    def generate():
+        yield _sse('start', {'session_id': turn['session_id']})
+
+        # CACHE HIT: the whole answer in one event
+        if cached_response:
+            yield _sse('token', {'text': cached_response})
+            yield _sse('done', _finish_chat(turn, cached_response, 0, cached=True))
+            return
+
+        pieces = []
+        completed = False
+        try:
+            for piece in gemini_service.stream_inquiry(full_prompt):
+                pieces.append(piece)
+                yield _sse('token', {'text': piece})
+            completed = True
+        except GeneratorExit:
+            # Client went away: the tokens were paid for, keep what was generated
+            if pieces:
+                try:
+                    _finish_chat(turn, "".join(pieces), 1)
+                except Exception:
+                    db.session.rollback()
+            raise
+        except Exception as e:
+            current_app.logger.error(f"Gemini stream error: {e}")
+            with open('debug_chatbot.txt', 'a') as f:
+                f.write(f"GEMINI STREAM ERROR: {str(e)}\n")
+
+        assistant_content = "".join(pieces)
+        if not pieces:
+            # Nothing was streamed: same fallback text as /chat
+            assistant_content = f"{turn['welcome_msg']}. Disculpa, tuve un problema técnico. ¿Podrías intentar de nuevo?"
+            yield _sse('token', {'text': assistant_content})
+
+        try:
+            done = _finish_chat(turn, assistant_content, 1)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error saving streamed answer: {e}")
+            yield _sse('error', {'error': 'Error guardando la respuesta'})
+            return
+
+        # Once the turn is committed: a cache failure cannot undo the charge
+        if completed and assistant_content:
+            _save_to_cache(turn, assistant_content)
+        yield _sse('done', done)
+
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no', # nginx: do not buffer the stream
+        'Server-Timing': context.server_timing()
+    }
+    return Response(generate(), mimetype='text/event-stream', headers=headers)
+
 @chatbot_bp.route('/<int:profesional_id>/config', methods=['PUT'])
 @professional_required
 def update_config(profesional_id):
@@ -420,6 +538,9 @@ def update_config(profesional_id):
     if 'temperature' in data:
         config.temperature = data['temperature']
     
+    # Cached answers were generated with the previous configuration
+    bump_generation(profesional_id)
+    
     try:
         db.session.commit()
         return success_response({
@@ -464,6 +585,8 @@ def upload_document(profesional_id):
     else:
         config.knowledge_base = document_text
     
+    bump_generation(profesional_id)
+    
     try:
         db.session.commit()
         return success_response(None, 'Documento agregado a la base de conocimiento')
@@ -526,34 +649,32 @@ def upload_knowledge_document(professional_id):
         
         file.save(file_path)
         
-        # Extraer texto
+        # Guardar en BD (el texto se extrae en segundo plano)
         file_type = filename.rsplit('.', 1)[1].lower()
-        text_content = FileExtractor.extract_text(file_path, file_type)
-        
-        # Guardar en BD
         doc = KnowledgeBaseDocument(
             professional_id=professional_id,
             filename=unique_filename,
             original_filename=filename,
             file_type=file_type,
-            text_content=text_content,
+            text_content=None,
             file_size=file_size
         )
         db.session.add(doc)
-        db.session.commit()
+        db.session.flush()
         
-        # Ingest into RAG
-        from app.services.rag_service import rag_service
-        rag_service.ingest_document(doc.id, text_content)
+        # Extraction, chunking, embedding and indexing run in the ingestion queue
+        job = ingestion_queue.enqueue(professional_id, doc.id, file_path, file_type)
+        db.session.commit()
+        ingestion_queue.notify()
         
         current_app.logger.info(
-            f"Document uploaded and indexed: {filename} (prof: {professional_id})"
+            f"Document uploaded, ingestion job {job.id} queued: {filename} (prof: {professional_id})"
         )
         
         return success_response(
-            {'document': doc.to_dict()},
-            "Archivo subido correctamente",
-            201
+            {'document': doc.to_dict(), 'job': job.to_dict()},
+            "Archivo subido, procesando en segundo plano",
+            202
         )
     
     except Exception as e:
@@ -563,6 +684,45 @@ def upload_knowledge_document(professional_id):
             internal_error=e
         )
 # ═════════════════════════════════════════════════════════
+# ENDPOINT 1b: ESTADO DEL PROCESAMIENTO
+# ═════════════════════════════════════════════════════════
+
+@chatbot_bp.route('/<int:professional_id>/knowledge-base/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def get_ingestion_job(professional_id, job_id):
+    """
+    GET /api/chatbot/{id}/knowledge-base/jobs/{job_id}
+    
+    Estado del procesamiento de un archivo subido
+    """
+    try:
+        from app.models import IngestionJob
+
+        prof = Professional.query.get(professional_id)
+        if not prof:
+            return error_response("Profesional no encontrado", 404)
+            
+        if prof.user_id != request.current_user_id:
+            return error_response("No tienes permiso", 403)
+        
+        job = IngestionJob.query.filter_by(
+            id=job_id,
+            professional_id=professional_id
+        ).first()
+        
+        if not job:
+            return error_response("Proceso no encontrado", 404)
+        
+        return success_response({'job': job.to_dict()})
+    
+    except Exception as e:
+        return error_response(
+            "Error consultando el proceso",
+            500,
+            internal_error=e
+        )
+
+# ═════════════════════════════════════════════════════════
 
 @chatbot_bp.route('/<int:professional_id>/knowledge-base/documents', methods=['GET'])
 @login_required
@@ -582,8 +742,10 @@ def get_knowledge_documents(professional_id):
         if prof.user_id != request.current_user_id:
             return error_response("No tienes permiso", 403)
         
+        # URL documents are managed from the URLs section
         documents = KnowledgeBaseDocument.query.filter_by(
-            professional_id=professional_id
+            professional_id=professional_id,
+            source_url_id=None
         ).order_by(KnowledgeBaseDocument.uploaded_at.desc()).all()
         
         return success_response({
@@ -625,7 +787,8 @@ def delete_knowledge_document(professional_id, doc_id):
         
         doc = KnowledgeBaseDocument.query.filter_by(
             id=doc_id,
-            professional_id=professional_id
+            professional_id=professional_id,
+            source_url_id=None
         ).first()
         
         if not doc:
@@ -636,6 +799,12 @@ def delete_knowledge_document(professional_id, doc_id):
         if os.path.exists(file_path):
             os.remove(file_path)
         
+        # Detener su procesamiento si sigue en la cola
+        ingestion_queue.cancel_for_document(doc.id)
+        
+        # Eliminar chunks y vectores del índice RAG (sin reconstruir todo)
+        rag_service.remove_document(doc.id, professional_id)
+        
         # Eliminar de BD
         db.session.delete(doc)
         db.session.commit()
@@ -716,9 +885,22 @@ def get_public_history(profesional_id):
     
     return success_response({'messages': history})
 
+@chatbot_bp.route('/admin/cache-stats', methods=['GET'])
+@admin_required
+def cache_stats():
+    """Semantic cache counters of this worker (hits, misses, evictions, expirations)"""
+    from app.services.cache_service import cache_service
+    return success_response({'cache': cache_service.get_stats()})
+
+@chatbot_bp.route('/admin/gemini-stats', methods=['GET'])
+@admin_required
+def gemini_stats():
+    """Gemini API latency/error counters per endpoint and circuit breaker state (this worker)"""
+    return success_response({'gemini': gemini_service.client.get_metrics()})
+
 @chatbot_bp.route('/admin/reload-rag', methods=['POST'])
 def reload_rag():
-    """Force reload of RAG index"""
+    """Force a full rebuild of the RAG index from DB"""
     try:
         rag_service.reload_index()
         return success_response(None, "RAG Index reloaded successfully")
@@ -4,8 +4,15 @@ from app.models import MirrorItem, MirrorUsage
 from werkzeug.utils import secure_filename
 import os
 import time
+import threading
+import base64
+import asyncio
+import mimetypes
 from datetime import datetime
 import google.generativeai as genai
+from app.services.gemini_service import gemini_service
+from app.services.image_normalizer import image_normalizer
+from app.utils.image_payload import ImageBlob
 from PIL import Image, PngImagePlugin
 from dotenv import load_dotenv
 
@@ -55,15 +62,34 @@ def record_token_usage(usage_type, prompt_tokens, completion_tokens, total_token
     except Exception as e:
         current_app.logger.error(f"Failed to record usage stats: {e}")
 
+MODEL_LIST_TTL = 3600 # seconds the list of available models is reused
+_model_list = {'names': None, 'fetched_at': 0.0}
+_model_list_lock = threading.Lock()
+
+def _model_list_fresh():
+    return _model_list['names'] is not None and time.monotonic() - _model_list['fetched_at'] <= MODEL_LIST_TTL
+
+def list_model_names():
+    """
+    Models supporting generateContent, fetched (blocking HTTP call) at most
+    once per MODEL_LIST_TTL. Single-flight: on expiry one caller refreshes,
+    concurrent ones (request threads, asyncio.to_thread) wait for its result.
+    """
+    if not _model_list_fresh():
+        with _model_list_lock:
+            if not _model_list_fresh():
+                names = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
+                _model_list['fetched_at'] = time.monotonic()
+                _model_list['names'] = names
+    return _model_list['names']
+
 def get_best_model(capability='image'):
     """Dynamically select the best available model."""
     try:
         # standard fallback if listing fails or returns nothing useful
         fallback = 'models/gemini-1.5-flash'
         
-        all_models = genai.list_models()
-        # Filter for generateContent support
-        valid_models = [m.name for m in all_models if 'generateContent' in m.supported_generation_methods]
+        valid_models = list_model_names()
         
         if not valid_models:
             current_app.logger.warning("No valid models found from API list.")
@@ -98,6 +124,10 @@ def get_best_model(capability='image'):
         current_app.logger.error(f"Error selecting model: {e}")
         return 'models/gemini-1.5-flash'
 
+async def get_best_model_async(capability='image'):
+    """get_best_model() for async views: a model listing must not block the event loop"""
+    return await asyncio.to_thread(get_best_model, capability)
+
 def build_inpainting_prompt(hairstyle, color, instructions):
     """Constructs a safe, structured prompt for image generation."""
     target_parts = []
@@ -115,6 +145,26 @@ def build_inpainting_prompt(hairstyle, color, instructions):
         "Preserve the subject's face, skin texture, expression, and identity with high fidelity. Only modify the hair."
     )
 
+def image_part(path, profile='vision'):
+    """inline_data part of a saved image for the Gemini REST API (normalized: oriented, downsized, no metadata)."""
+    with open(path, 'rb') as f:
+        image = ImageBlob(f.read(), mimetypes.guess_type(path)[0])
+    image = image_normalizer.normalize(image, profile)
+    return {"inline_data": {"mime_type": image.mime_type, "data": image.b64()}}
+
+def response_parts(result):
+    """Parts of the first candidate of a generateContent result."""
+    candidates = result.get('candidates') or []
+    return candidates[0].get('content', {}).get('parts', []) if candidates else []
+
+def response_text(result):
+    return "".join(part.get('text', '') for part in response_parts(result))
+
+def usage_tokens(result):
+    """(prompt, completion, total) tokens of a generateContent result."""
+    usage = result.get('usageMetadata', {})
+    return usage.get('promptTokenCount', 0), usage.get('candidatesTokenCount', 0), usage.get('totalTokenCount', 0)
+
 def save_uploaded_file(file, subdir='mirror'):
     """Saves an uploaded file with a unique timestamped name."""
     filename = secure_filename(file.filename)
@@ -208,7 +258,7 @@ def get_items():
     return jsonify([item.to_dict() for item in items])
 
 @mirror_api_bp.route('/items', methods=['POST'])
-def upload_item():
+async def upload_item():
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     file = request.files['file']
@@ -232,24 +282,22 @@ def upload_item():
 
         if configure_genai():
             try:
-                model_name = get_best_model(capability='vision')
+                model_name = await get_best_model_async(capability='vision')
                 if model_name:
-                    model = genai.GenerativeModel(model_name)
-                    img = Image.open(file_path)
-                    
                     if category == 'color':
                         prompt = "Analyze hair color professionally using terms like Balayage, Babylights, Ombre. Describe ONLY the color."
                     else:
                         prompt = "Describe the hairstyle (cut, texture, length) in detail for an AI generator. Be concise."
                         
-                    response = model.generate_content([prompt, img])
-                    generated_prompt = response.text.strip()
+                    analysis = await gemini_service.generate_content_async(
+                        model_name, [{"text": prompt}, image_part(file_path)], endpoint='vision'
+                    )
+                    if not analysis['success']:
+                        raise RuntimeError(analysis['error'])
+                    generated_prompt = response_text(analysis['result']).strip()
                     
                     # Extract Tokens
-                    if hasattr(response, 'usage_metadata'):
-                        prompt_tokens = response.usage_metadata.prompt_token_count
-                        completion_tokens = response.usage_metadata.candidates_token_count
-                        total_tokens = response.usage_metadata.total_token_count
+                    prompt_tokens, completion_tokens, total_tokens = usage_tokens(analysis['result'])
                 else:
                     current_app.logger.warning("No vision model available for upload analysis.")
 
@@ -297,7 +345,7 @@ def delete_item(id):
     return jsonify({'message': 'Item deleted'})
 
 @mirror_api_bp.route('/generate', methods=['POST'])
-def generate_look():
+async def generate_look():
     """Core endpoint for Hairstyle/Color generation."""
     try:
         # 1. Validation & Setup
@@ -330,12 +378,9 @@ def generate_look():
         
         if not model_name:
             # Fallback to text model if no image gen
-            model_name = get_best_model(capability='vision')
+            model_name = await get_best_model_async(capability='vision')
             current_app.logger.warning("No Image Gen model found. Falling back to text.")
 
-        model = genai.GenerativeModel(model_name)
-        img = Image.open(save_path)
-        
         # 6. Generate
         try:
             # Relax Safety for "Face Editing"
@@ -350,19 +395,27 @@ def generate_look():
             
             if is_image_model:
                 current_app.logger.info(f"Calling Image Model: {model_name}")
-                response = model.generate_content([full_prompt, img], safety_settings=safety_settings)
+                generation = await gemini_service.generate_content_async(
+                    model_name, [{"text": full_prompt}, image_part(save_path, 'try_on')],
+                    endpoint='try_on', safety_settings=safety_settings
+                )
+                if not generation['success']:
+                    raise RuntimeError(generation['error'])
+                response = generation['result']
+                parts = response_parts(response)
                 
                 # Extract Image
                 image_found = False
-                if response.candidates and response.parts:
-                    for part in response.parts:
-                        if hasattr(part, 'inline_data') and part.inline_data:
+                if parts:
+                    for part in parts:
+                        inline_data = part.get('inlineData') or part.get('inline_data')
+                        if inline_data:
                             # Save Generated Image
                             gen_filename = f"gen_out_{os.path.basename(filename)}.png" 
                             gen_save_path = os.path.join(os.path.dirname(save_path), gen_filename)
                             
                             with open(gen_save_path, 'wb') as f:
-                                f.write(part.inline_data.data)
+                                f.write(base64.b64decode(inline_data['data']))
                                 
                             result_image_url = f"/static/uploads/mirror/{gen_filename}"
                             ai_description = "Image Generated Successfully"
@@ -371,26 +424,24 @@ def generate_look():
                 
                 if not image_found:
                     # Fallback Text from Image Model?
-                    ai_description = response.text if hasattr(response, 'text') else "No output data."
+                    ai_description = response_text(response) or "No output data."
                     # If failed to generate pixels but returned text, we use that text. 
                     # But we also try to specifically ask for text description now if completely failed.
-                    if not response.parts: 
+                    if not parts: 
                         raise ValueError("No candidates or safety block")
 
             else:
                 # Text Model Execution (Fallback)
-                response = model.generate_content([f"Describe this new look: {full_prompt}", img])
-                ai_description = response.text
+                generation = await gemini_service.generate_content_async(
+                    model_name, [{"text": f"Describe this new look: {full_prompt}"}, image_part(save_path)]
+                )
+                if not generation['success']:
+                    raise RuntimeError(generation['error'])
+                response = generation['result']
+                ai_description = response_text(response)
 
             # Extract Token Usage
-            prompt_tokens = 0
-            completion_tokens = 0
-            total_tokens = 0
-
-            if hasattr(response, 'usage_metadata'):
-                prompt_tokens = response.usage_metadata.prompt_token_count
-                completion_tokens = response.usage_metadata.candidates_token_count
-                total_tokens = response.usage_metadata.total_token_count
+            prompt_tokens, completion_tokens, total_tokens = usage_tokens(response)
 
         except Exception as gen_err:
             current_app.logger.error(f"Generation Error: {gen_err}")
@@ -7,11 +7,24 @@ from app.utils.auth_utils import login_required, professional_required
 from app.utils.validators import success_response
 from app.utils.error_handler import error_response
 from app.utils.web_scraper import WebScraper
+from app.services.content_generation import bump_generation
+from app.services.rag_service import rag_service
+from app.services.ingestion_service import ingestion_queue
 from datetime import datetime
 from sqlalchemy import or_
 
 profesionales_bp = Blueprint('profesionales', __name__, url_prefix='/api/profesionales')
 
+def _queue_url_indexing(prof_url):
+    """
+    Replace the URL's passages in the RAG index with its cached_content.
+    Chunking and embedding run in the ingestion queue; the caller commits
+    and then calls ingestion_queue.notify().
+    """
+    doc = rag_service.replace_url_content(prof_url)
+    ingestion_queue.cancel_for_document(doc.id)
+    ingestion_queue.enqueue(prof_url.professional_id, doc.id, prof_url.url, 'url')
+
 @profesionales_bp.route('/especialidades', methods=['GET'])
 def get_specialties():
     """Get list of available specialties"""
@@ -337,11 +350,19 @@ def add_url(professional_id):
             description=description,
             is_active=True,
             last_fetched=datetime.utcnow(),
-            cached_content=scrape_result['content']
+            cached_content=scrape_result['content'],
+            etag=scrape_result.get('etag'),
+            last_modified=scrape_result.get('last_modified')
         )
         
         db.session.add(prof_url)
+        db.session.flush()
+        bump_generation(professional_id)
+        
+        # 5. Indexar su contenido en el RAG (en segundo plano)
+        _queue_url_indexing(prof_url)
         db.session.commit()
+        ingestion_queue.notify()
         
         return success_response(
             {'url': prof_url.to_dict()},
@@ -403,8 +424,12 @@ def delete_url(professional_id, url_id):
             return error_response("URL no encontrada", 404)
             
         # Hard delete o Soft delete? El usuario pidió "Eliminar de BD" en checklist
-        # Haremos hard delete para limpiar
+        # Haremos hard delete para limpiar (incluye sus fragmentos en el índice RAG)
+        doc_id = rag_service.remove_url(url_obj.id, professional_id)
+        if doc_id:
+            ingestion_queue.cancel_for_document(doc_id)
         db.session.delete(url_obj)
+        bump_generation(professional_id)
         db.session.commit()
         
         return success_response(None, "URL eliminada correctamente")
@@ -439,9 +464,16 @@ def refresh_url(professional_id, url_id):
             return error_response(scrape_result['error'], 400)
             
         # Update DB
+        changed = scrape_result['content'] != url_obj.cached_content
         url_obj.cached_content = scrape_result['content']
+        url_obj.etag = scrape_result.get('etag')
+        url_obj.last_modified = scrape_result.get('last_modified')
         url_obj.last_fetched = datetime.utcnow()
+        if changed:
+            bump_generation(professional_id)
+            _queue_url_indexing(url_obj)
         db.session.commit()
+        ingestion_queue.notify()
         
         return success_response(
             {'url': url_obj.to_dict()},
@@ -1,11 +1,49 @@
+import os
+import re
+import time
+import hashlib
+import threading
+import unicodedata
+from datetime import datetime, timedelta
 import numpy as np
-import pickle
+from flask import current_app
 from app import db
 from app.models import CachedResponse
+from app.utils.embedding_codec import encode_embedding, decode_embeddings
+from app.services.vector_snapshot import VectorSnapshot
+from app.services.content_generation import current_generation
 import logging
 
 logger = logging.getLogger(__name__)
 
+_WHITESPACE_RE = re.compile(r'\s+')
+SNAPSHOT_CHECK_INTERVAL = 5 # seconds between checks for a snapshot written by another worker
+
+def normalize_query(text):
+    """Casefold, strip accents and collapse whitespace: '  ¿Qué  es el IMSS? ' -> '¿que es el imss?'"""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+def query_fingerprint(text):
+    """Key of the exact-match tier"""
+    return hashlib.sha1(normalize_query(text).encode('utf-8')).hexdigest()
+
+class CacheLookup:
+    """Outcome of a cache lookup, and the DB writes it implies (see apply_lookup)"""
+
+    __slots__ = ('professional_id', 'response', 'hit_id', 'expired', 'stale')
+
+    def __init__(self, professional_id):
+        self.professional_id = professional_id
+        self.response = None  # cached answer, None on a miss
+        self.hit_id = None
+        self.expired = []     # entry ids past their TTL
+        self.stale = []       # entry ids answered under an older content generation
+
+    def __bool__(self):
+        return self.response is not None
+
 class SemanticCacheService:
     _instance = None
 
@@ -20,20 +58,28 @@ class SemanticCacheService:
             return
             
         self.initialized = True
-        self.model_name = 'all-MiniLM-L6-v2'
-        self.threshold = 0.85
+        self.threshold = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.85))
         self.dimension = 384
-        self.index = None
+        self.top_k = 5 # candidates checked per lookup (best one may be expired)
+        self.ttl = timedelta(seconds=int(os.getenv('SEMANTIC_CACHE_TTL', 7 * 24 * 3600)))
+        self.max_entries = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', 500)) # per professional
+        self.stats = {'hits': 0, 'exact_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+        self._stats_lock = threading.Lock()
+        self.index = None # Partitioned by professional_id, returns CachedResponse IDs
         self.encoder = None
-        self.id_map = {} # Maps FAISS index to DB ID
+        # Cache writes are frequent, so coalesce them into fewer snapshot rewrites
+        self.snapshot = VectorSnapshot('semantic_cache', self.dimension, debounce=30.0)
+        self.snapshot_generation = None
+        self._last_snapshot_check = 0.0
         
         try:
-            from sentence_transformers import SentenceTransformer
-            import faiss
+            from app.services.encoder_service import encoder_service
+            from app.services.vector_index import PartitionedIndex
             
-            logger.info(f"Loading Semantic Cache Model ({self.model_name})...")
-            self.encoder = SentenceTransformer(self.model_name)
-            self.index = faiss.IndexFlatIP(self.dimension)
+            if not encoder_service.available:
+                raise ImportError("encoder model not loaded")
+            self.encoder = encoder_service # Shared with the other vector services
+            self.index = PartitionedIndex(self.dimension)
             
             # Load existing cache from DB
             self._load_cache_from_db()
@@ -68,90 +114,297 @@ class SemanticCacheService:
         except Exception as e:
             logger.warning(f"Could not load cache from DB on init: {e}")
 
+    def load_index(self):
+        """
+        Startup path (Call this inside app context).
+        Maps the on-disk snapshot if it still matches the DB, otherwise rebuilds.
+        """
+        if not self.encoder or self.index is None:
+            return
+
+        try:
+            self.snapshot.configure(
+                os.getenv('VECTOR_SNAPSHOT_DIR') or os.path.join(current_app.instance_path, 'vector_snapshots')
+            )
+            manifest = self.snapshot.read_manifest()
+            if manifest and manifest.get('source') == self._source_state():
+                data = self.snapshot.load(manifest)
+                if data is not None:
+                    self.index.reset()
+                    self._attach_snapshot(data)
+                    logger.info(f"Semantic Cache Index mapped from snapshot with {self.index.ntotal} entries.")
+                    return
+        except Exception as e:
+            logger.warning(f"Could not use cache snapshot, rebuilding from DB: {e}")
+
+        self.reload_index()
+
+    def _source_state(self):
+        """
+        Cheap fingerprint of the cache table, stored in the snapshot manifest.
+        SQLite reuses the ids of deleted rows: the newest created_at tells
+        replaced entries apart, the total embedding bytes those rewritten in
+        place (scripts/migrate_embeddings_to_float32.py).
+        """
+        count, max_id, newest, embedding_bytes = db.session.query(
+            db.func.count(CachedResponse.id),
+            db.func.max(CachedResponse.id),
+            db.func.max(CachedResponse.created_at),
+            db.func.sum(db.func.length(CachedResponse.embedding))
+        ).one()
+        return {'count': int(count), 'max_id': int(max_id or 0), 'newest': str(newest) if newest else None,
+                'embedding_bytes': int(embedding_bytes or 0)}
+
+    def _read_rows(self):
+        """Read every cache entry as arrays (ids, professionals, vectors), healing missing embeddings"""
+        rows = db.session.query(
+            CachedResponse.id,
+            CachedResponse.professional_id,
+            CachedResponse.embedding
+        ).all()
+
+        vectors, valid = decode_embeddings([r.embedding for r in rows], self.dimension)
+        ids = np.array([r.id for r in rows], dtype='int64')
+        professional_ids = np.array([r.professional_id for r in rows], dtype='int64')
+        
+        # Compute embedding if missing (self-healing)
+        if not valid.all():
+            missing = ids[~valid]
+            queries = dict(db.session.query(CachedResponse.id, CachedResponse.query).filter(
+                CachedResponse.id.in_(missing.tolist())
+            ).all())
+            healed = self.encoder.encode([queries[int(i)] for i in missing], use_cache=False)
+            for cache_id, emb in zip(missing, healed):
+                db.session.query(CachedResponse).filter_by(id=int(cache_id)).update(
+                    {'embedding': encode_embedding(emb)}, synchronize_session=False
+                )
+            # Commit any self-healing updates
+            db.session.commit()
+
+            vectors = np.vstack([vectors, healed])
+            ids = np.concatenate([ids[valid], missing])
+            professional_ids = np.concatenate([professional_ids[valid], professional_ids[~valid]])
+
+        return ids, professional_ids, vectors
+
+    def _write_snapshot(self):
+        """Persist the DB state as a new snapshot generation and serve it. Returns False if unavailable."""
+        if not self.snapshot.enabled:
+            return False
+
+        source = self._source_state()
+        ids, professional_ids, vectors = self._read_rows()
+        self.snapshot.write(ids, professional_ids, vectors, source=source)
+
+        data = self.snapshot.load()
+        if data is None:
+            return False
+
+        self._attach_snapshot(data)
+        return True
+
+    def _attach_snapshot(self, data):
+        self.index.attach(data)
+        self.snapshot_generation = data.generation
+
+    def _refresh_from_snapshot(self):
+        """Pick up a snapshot generation written by another worker (entries it cached)"""
+        now = time.monotonic()
+        if not self.snapshot.enabled or now - self._last_snapshot_check < SNAPSHOT_CHECK_INTERVAL:
+            return
+        self._last_snapshot_check = now
+
+        manifest = self.snapshot.read_manifest()
+        if manifest and (self.snapshot_generation is None or manifest['generation'] > self.snapshot_generation):
+            data = self.snapshot.load(manifest)
+            if data is not None:
+                self._attach_snapshot(data)
+                logger.info(f"Semantic Cache Index switched to snapshot generation {data.generation}")
+
     def reload_index(self):
         """Rebuild index from DB (Call this inside app context)"""
-        if not self.encoder or not self.index:
+        if not self.encoder or self.index is None:
             return
 
         try:
-            responses = CachedResponse.query.all()
             self.index.reset()
-            self.id_map = {}
-            
-            if not responses:
-                return
 
-            vectors = []
-            valid_responses = []
-            
-            for r in responses:
-                if r.embedding:
-                    # Load pickle
-                    emb = pickle.loads(r.embedding)
-                    vectors.append(emb)
-                    valid_responses.append(r)
-                else:
-                    # Compute embedding if missing (self-healing)
-                    if self.encoder:
-                        emb = self.encoder.encode([r.query])[0]
-                        r.embedding = pickle.dumps(emb)
-                        vectors.append(emb)
-                        valid_responses.append(r)
-            
-            if vectors:
-                # Add to FAISS
-                vectors_np = np.array(vectors).astype('float32')
-                self.index.add(vectors_np)
-                
-                # Update map with detached data (dicts) to avoid Session errors
-                for i, r in enumerate(valid_responses):
-                    self.id_map[i] = {
-                        'id': r.id,
-                        'professional_id': r.professional_id,
-                        'response': r.response
-                    }
+            if not self._write_snapshot():
+                ids, professional_ids, vectors = self._read_rows()
+                for professional_id in np.unique(professional_ids):
+                    mask = professional_ids == professional_id
+                    self.index.add(int(professional_id), ids[mask], vectors[mask])
             
-            # Commit any self-healing updates
-            db.session.commit()
             logger.info(f"Semantic Cache Index reloaded with {self.index.ntotal} entries.")
             
         except Exception as e:
             logger.error(f"Error reloading cache index: {e}")
 
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def get_stats(self):
+        """Hit/miss/eviction counters of this process plus current index size"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['entries'] = self.index.ntotal if self.index is not None else 0
+        return stats
+
     def get_cached_response(self, query, professional_id):
-        """Search for cached response"""
-        if not self.encoder or not self.index or self.index.ntotal == 0:
+        """Search for cached response: exact normalized text first, then semantic"""
+        result = self.lookup(query, professional_id)
+        if result is None:
             return None
-            
         try:
+            self.apply_lookup(result)
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Error updating cache entries: {e}")
+            db.session.rollback()
+        return result.response
+
+    def lookup(self, query, professional_id):
+        """
+        Read-only part of get_cached_response(), safe to run on a worker thread
+        (context assembly): returns a CacheLookup, falsy on a miss, or None on
+        error. Its DB writes (hit count, evictions) are applied on the request
+        thread with apply_lookup().
+        """
+        try:
+            generation = current_generation(professional_id)
+            result = CacheLookup(professional_id)
+
+            # 0. Exact tier: same question after normalization (quick replies, retries).
+            # Indexed (professional_id, query_hash) lookup, no encoder or FAISS involved
+            rows = db.session.query(*self._row_columns()).filter(
+                CachedResponse.professional_id == professional_id,
+                CachedResponse.query_hash == query_fingerprint(query)
+            ).order_by(CachedResponse.id.desc()).limit(self.top_k).all()
+            self._first_valid(result, [(1.0, row) for row in rows], generation)
+            if result:
+                self._count('exact_hits')
+                logger.info(f"Cache HIT (exact) for query: {query}")
+                return result
+
+            if not self.encoder or self.index is None:
+                self._count('misses')
+                return result
+
+            self._refresh_from_snapshot()
+            if self.index.size(professional_id) == 0:
+                self._count('misses')
+                return result
+
             # 1. Encode query
             query_vector = self.encoder.encode([query]).astype('float32')
             
-            # 2. Search
-            D, I = self.index.search(query_vector, 1)
-            
-            similarity = D[0][0]
-            idx = I[0][0]
-            
-            if similarity > self.threshold:
-                cached_item = self.id_map.get(idx)
-                if cached_item:
-                    # Verify professional_id matches (Context isolation)
-                    if cached_item['professional_id'] == professional_id:
-                        logger.info(f"Cache HIT ({similarity:.2f}) for query: {query}")
-                        return cached_item['response']
-                    else:
-                        logger.info(f"Cache HIT but Professional Mismatch ({cached_item['professional_id']} != {professional_id})")
-            
-            return None
+            # 2. Search only this professional's entries (Context isolation)
+            D, I = self.index.search(professional_id, query_vector, self.top_k)
+            candidates = [(float(d), int(i)) for d, i in zip(D, I) if i != -1 and d > self.threshold]
+            if not candidates:
+                self._count('misses')
+                return result
+
+            rows = {
+                row.id: row for row in db.session.query(*self._row_columns()).filter(
+                    CachedResponse.id.in_([i for _, i in candidates])
+                ).all()
+            }
+            self._first_valid(
+                result,
+                [(similarity, rows[cache_id]) for similarity, cache_id in candidates if cache_id in rows],
+                generation
+            )
+            if not result:
+                self._count('misses')
+            return result
             
         except Exception as e:
-            logger.error(f"Error in get_cached_response: {e}")
+            logger.error(f"Error in cache lookup: {e}")
             return None
 
-    def add_to_cache(self, query, response, professional_id):
-        """Add new response to cache"""
-        if not self.encoder or not self.index:
+    def apply_lookup(self, result):
+        """Hit count/LRU touch of the hit and eviction of the entries a lookup found expired or stale. Caller commits the session."""
+        if result.hit_id is not None:
+            db.session.query(CachedResponse).filter_by(id=result.hit_id).update({
+                'last_used_at': datetime.utcnow(),
+                'hit_count': db.func.coalesce(CachedResponse.hit_count, 0) + 1
+            }, synchronize_session=False)
+        self._evict(result.professional_id, result.expired, 'expirations')
+        self._evict(result.professional_id, result.stale, 'invalidations')
+
+    def _row_columns(self):
+        return CachedResponse.id, CachedResponse.response, CachedResponse.created_at, CachedResponse.generation
+
+    def _first_valid(self, result, candidates, generation):
+        """
+        Best (similarity, row) candidate that is still fresh and answered with the
+        current documents/config becomes the hit of result; expired and stale
+        ones are collected for eviction on the way.
+        """
+        now = datetime.utcnow()
+        for similarity, row in candidates:
+            if (row.generation or 0) != generation:
+                result.stale.append(row.id)
+                continue
+            if row.created_at and now - row.created_at > self.ttl:
+                result.expired.append(row.id)
+                continue
+
+            self._count('hits')
+            logger.info(f"Cache HIT ({similarity:.2f}) for entry {row.id}")
+            result.hit_id = row.id
+            result.response = row.response
+            return
+
+    def _evict(self, professional_id, cache_ids, reason='evictions'):
+        """Delete entries from DB and index. Caller commits the session."""
+        if not cache_ids:
+            return
+        db.session.query(CachedResponse).filter(CachedResponse.id.in_(cache_ids)).delete(synchronize_session=False)
+        if self.index is not None: # None when only the exact tier runs (no encoder)
+            self.index.remove(professional_id, cache_ids)
+        self._count(reason, len(cache_ids))
+
+    def _enforce_limits(self, professional_id, generation):
+        """Drop this professional's stale and expired entries, then least recently used ones over max_entries"""
+        stale = [row.id for row in db.session.query(CachedResponse.id).filter(
+            CachedResponse.professional_id == professional_id,
+            db.func.coalesce(CachedResponse.generation, 0) != generation
+        ).all()]
+        self._evict(professional_id, stale, 'invalidations')
+
+        expired = [row.id for row in db.session.query(CachedResponse.id).filter(
+            CachedResponse.professional_id == professional_id,
+            CachedResponse.created_at < datetime.utcnow() - self.ttl
+        ).all()]
+        self._evict(professional_id, expired, 'expirations')
+
+        excess = db.session.query(CachedResponse).filter_by(professional_id=professional_id).count() - self.max_entries
+        if excess > 0:
+            lru = [row.id for row in db.session.query(CachedResponse.id).filter(
+                CachedResponse.professional_id == professional_id
+            ).order_by(
+                db.func.coalesce(CachedResponse.last_used_at, CachedResponse.created_at),
+                CachedResponse.id
+            ).limit(excess).all()]
+            self._evict(professional_id, lru)
+            logger.info(f"Semantic Cache: evicted {len(lru)} LRU entries of professional {professional_id}")
+
+        return bool(stale) or bool(expired) or excess > 0
+
+    def add_to_cache(self, query, response, professional_id, generation=None):
+        """
+        Add new response to cache.
+        generation: content generation read before the answer's context was
+        built (defaults to the current one).
+        Commits the session, or rolls it back on failure: call it once the
+        caller's own changes are committed.
+        """
+        if not self.encoder or self.index is None:
             return
 
         try:
@@ -159,32 +412,42 @@ class SemanticCacheService:
             vector = self.encoder.encode([query])[0]
             
             # 2. Save to DB
+            now = datetime.utcnow()
+            current = current_generation(professional_id)
+            if generation is None:
+                generation = current
+            elif generation != current:
+                # Knowledge changed while this answer was being generated
+                logger.info(f"Not caching answer built on stale content: {query}")
+                return
+
             new_cache = CachedResponse(
                 professional_id=professional_id,
                 query=query,
                 response=response,
-                embedding=pickle.dumps(vector)
+                embedding=encode_embedding(vector),
+                query_hash=query_fingerprint(query),
+                created_at=now,
+                last_used_at=now,
+                generation=generation
             )
             db.session.add(new_cache)
             db.session.commit()
             
-            # 3. Update In-Memory Index
-            # FAISS add
-            vector_np = np.array([vector]).astype('float32')
-            self.index.add(vector_np)
-            
-            # Update map
-            current_idx = self.index.ntotal - 1
-            self.id_map[current_idx] = {
-                'id': new_cache.id,
-                'professional_id': new_cache.professional_id,
-                'response': new_cache.response
-            }
+            # 3. Update In-Memory Index (snapshot catches up in the background)
+            self.index.add(professional_id, [new_cache.id], np.array([vector], dtype='float32'))
+
+            # 4. Keep the tenant within TTL and size limits
+            self._enforce_limits(professional_id, generation)
+            db.session.commit()
+
+            self.snapshot.schedule_write(current_app._get_current_object(), self._write_snapshot)
             
             logger.info(f"Added to cache: {query}")
             
         except Exception as e:
             logger.error(f"Error adding to cache: {e}")
+            db.session.rollback()
 
 # Singleton
 cache_service = SemanticCacheService()
@@ -0,0 +1,24 @@
+"""
+Per-professional content generation numbers.
+
+Professional.content_generation changes whenever anything the chatbot answers
+from changes (documents, config, URLs). Semantic cache entries are stamped
+with the generation they were answered under, so a lookup rejects stale
+answers with a single primary-key read instead of scanning the cache.
+"""
+
+from app import db
+from app.models import Professional
+
+def current_generation(professional_id):
+    """Current generation of a professional (0 if never bumped)"""
+    value = db.session.query(Professional.content_generation).filter(
+        Professional.id == professional_id
+    ).scalar()
+    return value or 0
+
+def bump_generation(professional_id):
+    """Invalidate cached answers of a professional. Caller commits the session."""
+    db.session.query(Professional).filter(Professional.id == professional_id).update({
+        'content_generation': db.func.coalesce(Professional.content_generation, 0) + 1
+    }, synchronize_session=False)
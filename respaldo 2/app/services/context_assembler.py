@@ -0,0 +1,135 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+class AssembledContext:
+    """Results of one assemble() call"""
+
+    def __init__(self, values, timings, dropped, failed):
+        self.values = values    # source name -> result (or its default)
+        self.timings = timings  # source name -> milliseconds (time spent so far if dropped)
+        self.dropped = dropped  # sources still running when the budget ran out
+        self.failed = failed    # sources that raised
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def summary(self):
+        """'rag=120ms cache=35ms urls=dropped(2500ms)' for logs"""
+        parts = []
+        for name, ms in self.timings.items():
+            if name in self.dropped:
+                parts.append(f"{name}=dropped({ms:.0f}ms)")
+            elif name in self.failed:
+                parts.append(f"{name}=error({ms:.0f}ms)")
+            else:
+                parts.append(f"{name}={ms:.0f}ms")
+        return " ".join(parts)
+
+    def server_timing(self):
+        """Server-Timing header value, so clients can see each source's latency"""
+        return ", ".join(
+            f'{name};dur={ms:.1f}' + (';desc="dropped"' if name in self.dropped else '')
+            for name, ms in self.timings.items()
+        )
+
+class ContextAssembler:
+    """
+    Runs the independent lookups of a chat turn (RAG, services, history,
+    semantic cache) concurrently under one latency budget.
+
+    - Each source runs on a shared thread pool inside its own app context, so
+      it gets its own DB session and never touches the request's session.
+    - Sources still running when CONTEXT_BUDGET_MS is spent are dropped and
+      their default is used; they finish in the background and their result
+      is discarded.
+    - A 'decisive' source (the cache) ends the assembly as soon as it returns
+      something, and sources that have not started yet are cancelled.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ContextAssembler, cls).__new__(cls)
+            cls._instance.initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self.initialized:
+            return
+
+        self.initialized = True
+        self.budget = int(os.getenv('CONTEXT_BUDGET_MS', 3000)) / 1000.0
+        self.max_workers = int(os.getenv('CONTEXT_WORKERS', 16))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='context')
+
+    def assemble(self, sources, defaults=None, decisive=(), budget=None):
+        """
+        sources: {name: callable()} run concurrently (Call this inside app context).
+        defaults: {name: value} used when a source is dropped or fails (None otherwise).
+        decisive: names whose truthy result ends the assembly early.
+        """
+        defaults = defaults or {}
+        budget = self.budget if budget is None else budget
+        app = current_app._get_current_object()
+
+        started = time.perf_counter()
+        futures = {self._executor.submit(self._run, app, source): name for name, source in sources.items()}
+
+        values = {name: defaults.get(name) for name in sources}
+        timings, failed = {}, []
+        pending = set(futures)
+
+        while pending:
+            remaining = budget - (time.perf_counter() - started)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+            decided = False
+            for future in done:
+                name = futures[future]
+                result, elapsed, error = future.result()
+                timings[name] = elapsed * 1000
+                if error is not None:
+                    failed.append(name)
+                    logger.error(f"Context source '{name}' failed: {error}")
+                    continue
+                values[name] = result
+                if name in decisive and result:
+                    decided = True
+
+            if decided:
+                # The rest is not needed: not reported as dropped
+                for future in pending:
+                    future.cancel()
+                pending = set()
+
+        dropped = []
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for future in pending:
+            name = futures[future]
+            timings[name] = elapsed_ms
+            dropped.append(name)
+
+        context = AssembledContext(values, timings, dropped, failed)
+        logger.info(f"Context assembled in {elapsed_ms:.0f}ms: {context.summary()}")
+        return context
+
+    @staticmethod
+    def _run(app, source):
+        """Returns (result, seconds, exception)"""
+        started = time.perf_counter()
+        try:
+            with app.app_context():
+                result = source()
+            return result, time.perf_counter() - started, None
+        except Exception as e:
+            return None, time.perf_counter() - started, e
+
+# Singleton
+context_assembler = ContextAssembler()
@@ -0,0 +1,167 @@
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class _PendingEncode:
+    """Texts waiting for the next micro-batch"""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.vectors = None
+        self.error = None
+        self.done = threading.Event()
+
+class EncoderService:
+    """
+    Process-wide sentence encoder shared by RAGService and SemanticCacheService.
+
+    - One SentenceTransformer instance per process instead of one per service.
+    - LRU cache of recent text -> vector results, so the same user message is
+      encoded once for the cache lookup and reused for RAG retrieval.
+    - Concurrent small encode() calls arriving within BATCH_WINDOW are merged
+      into a single forward pass by a background thread.
+    """
+    _instance = None
+
+    BATCH_WINDOW = 0.005   # seconds to wait for more requests before encoding
+    MAX_BATCH = 64         # texts per forward pass
+    DIRECT_THRESHOLD = 16  # bigger requests (document ingest) skip the batcher
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(EncoderService, cls).__new__(cls)
+            cls._instance.initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self.initialized:
+            return
+
+        self.initialized = True
+        self.model_name = 'all-MiniLM-L6-v2'
+        self.dimension = 384
+        self.model = None
+        self.cache_size = int(os.getenv('ENCODER_CACHE_SIZE', 2048))
+        self._cache = OrderedDict() # text -> float32 vector
+        self._cache_lock = threading.Lock()
+        self._pending = []
+        self._pending_lock = threading.Condition()
+        self._worker = None
+
+        try:
+            from sentence_transformers import SentenceTransformer
+
+            logger.info(f"Loading Encoder Model ({self.model_name})...")
+            self.model = SentenceTransformer(self.model_name)
+
+        except ImportError:
+            logger.error("Encoder disabled: sentence-transformers not installed.")
+        except Exception as e:
+            logger.error(f"Error initializing Encoder: {e}")
+
+    @property
+    def available(self):
+        return self.model is not None
+
+    def encode(self, texts, use_cache=True):
+        """
+        Encode a list of texts. Returns a float32 array (len(texts), dimension),
+        same as SentenceTransformer.encode.
+        """
+        if not self.available:
+            raise RuntimeError("Encoder model not loaded")
+
+        texts = list(texts)
+        result = np.empty((len(texts), self.dimension), dtype='float32')
+        if not texts:
+            return result
+
+        # 1. Cache hits
+        missing = {} # text -> positions in result
+        with self._cache_lock:
+            for pos, text in enumerate(texts):
+                vector = self._cache.get(text) if use_cache else None
+                if vector is not None:
+                    self._cache.move_to_end(text)
+                    result[pos] = vector
+                else:
+                    missing.setdefault(text, []).append(pos)
+
+        if not missing:
+            return result
+
+        # 2. Encode the rest (deduplicated)
+        unique = list(missing)
+        if len(unique) >= self.DIRECT_THRESHOLD:
+            vectors = self._forward(unique)
+        else:
+            vectors = self._submit(unique)
+
+        for text, vector in zip(unique, vectors):
+            result[missing[text]] = vector
+
+        if use_cache:
+            with self._cache_lock:
+                for text, vector in zip(unique, vectors):
+                    self._cache[text] = vector
+                    self._cache.move_to_end(text)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return result
+
+    def _forward(self, texts):
+        return np.asarray(self.model.encode(texts), dtype='float32').reshape(len(texts), self.dimension)
+
+    def _submit(self, texts):
+        """Queue texts for the batching thread and wait for their vectors"""
+        request = _PendingEncode(texts)
+        with self._pending_lock:
+            self._pending.append(request)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._batch_loop, name="encoder-batcher", daemon=True)
+                self._worker.start()
+            self._pending_lock.notify()
+
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.vectors
+
+    def _batch_loop(self):
+        while True:
+            with self._pending_lock:
+                while not self._pending:
+                    self._pending_lock.wait()
+
+            # Give concurrent callers a moment to join this forward pass
+            time.sleep(self.BATCH_WINDOW)
+
+            with self._pending_lock:
+                batch, size = [], 0
+                while self._pending and (not batch or size + len(self._pending[0].texts) <= self.MAX_BATCH):
+                    request = self._pending.pop(0)
+                    batch.append(request)
+                    size += len(request.texts)
+
+            try:
+                vectors = self._forward([text for request in batch for text in request.texts])
+                offset = 0
+                for request in batch:
+                    request.vectors = vectors[offset:offset + len(request.texts)]
+                    offset += len(request.texts)
+            except Exception as e:
+                logger.error(f"Error encoding batch of {size} texts: {e}")
+                for request in batch:
+                    request.error = e
+            finally:
+                for request in batch:
+                    request.done.set()
+
+# Singleton
+encoder_service = EncoderService()
@@ -0,0 +1,312 @@
+"""
+Shared HTTP client for the Gemini REST API.
+
+- One requests.Session with a pooled adapter: calls reuse keep-alive TLS
+  connections to generativelanguage.googleapis.com.
+- 429/5xx answers, timeouts and connection errors are retried with jittered
+  exponential backoff (Retry-After is honoured, capped).
+- A circuit breaker opens after GEMINI_BREAKER_THRESHOLD consecutive
+  failures: calls fail fast with GeminiUnavailable for
+  GEMINI_BREAKER_COOLDOWN seconds, then a single trial call decides
+  whether to close it again.
+- Per-endpoint latency and error counters, see get_metrics().
+
+apost() is the asyncio variant of post() (httpx). All async calls of the
+process run on one background event loop ('gemini-io') with one
+httpx.AsyncClient, so hundreds of in-flight LLM calls cost sockets, not
+threads; call() awaits them from any other loop (e.g. a Flask async view).
+Retries, breaker and metrics are shared by both variants.
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+import logging
+from collections import deque
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class GeminiUnavailable(Exception):
+    """Raised without calling the API while the circuit breaker is open"""
+
+class CircuitBreaker:
+    """closed -> (threshold consecutive failures) -> open -> (cooldown) -> half-open -> closed/open"""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False # a half-open trial call is in flight
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half-open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Gemini circuit breaker OPEN after {self.failures} failures")
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+    def release(self):
+        """A call ended without an outcome (cancelled): let the next call be the trial"""
+        with self._lock:
+            self._trial = False
+
+class EndpointMetrics:
+    """Counters and recent latencies of one endpoint"""
+
+    WINDOW = 200 # latency samples kept for percentiles
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.short_circuited = 0
+        self.status = {} # HTTP status ('network' for timeouts/connection errors) -> count
+        self.latencies = deque(maxlen=self.WINDOW)
+
+    def to_dict(self):
+        samples = sorted(self.latencies)
+
+        def percentile(p):
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 1) if samples else None
+
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'error_rate': round(self.errors / self.requests, 3) if self.requests else 0.0,
+            'retries': self.retries,
+            'short_circuited': self.short_circuited,
+            'status': dict(self.status),
+            'latency_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'max': percentile(1.0)}
+        }
+
+class GeminiClient:
+    def __init__(self):
+        self.max_retries = int(os.getenv('GEMINI_MAX_RETRIES', 2))
+        self.backoff_base = float(os.getenv('GEMINI_BACKOFF_BASE', 0.5))  # seconds
+        self.backoff_max = float(os.getenv('GEMINI_BACKOFF_MAX', 8))
+        self.pool_size = int(os.getenv('GEMINI_POOL_SIZE', 20))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+        self.breaker = CircuitBreaker(
+            threshold=int(os.getenv('GEMINI_BREAKER_THRESHOLD', 5)),
+            cooldown=float(os.getenv('GEMINI_BREAKER_COOLDOWN', 30))
+        )
+        self._metrics = {}
+        self._metrics_lock = threading.Lock()
+
+        # Async transport, started on first use
+        self.max_connections = int(os.getenv('GEMINI_ASYNC_MAX_CONNECTIONS', 200))
+        self._loop = None
+        self._async_session = None
+        self._loop_lock = threading.Lock()
+
+    def post(self, endpoint, url, payload, timeout, stream=False):
+        """
+        POST with retries. endpoint names the call in the metrics.
+        Returns the last requests.Response (2xx, or the final error status);
+        raises GeminiUnavailable when the breaker is open and the last
+        requests exception when every attempt failed at the network level.
+
+        With stream=True only the request itself is retried; the caller
+        reads (and closes) the body.
+        """
+        metrics = self._endpoint(endpoint)
+        if not self.breaker.allow():
+            with self._metrics_lock:
+                metrics.short_circuited += 1
+            raise GeminiUnavailable('Gemini temporarily unavailable (circuit open)')
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self.session.post(url, json=payload, timeout=timeout, stream=stream)
+                error = None
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                response, error = None, e
+            except requests.exceptions.RequestException:
+                self.breaker.record_failure() # invalid request: do not leave a half-open trial pending
+                raise
+
+            retryable = error is not None or response.status_code in RETRY_STATUS
+            self._record(metrics, time.perf_counter() - started, response)
+
+            if not retryable:
+                # 2xx, or a client error a retry would not fix (400/403/404)
+                self.breaker.record_success()
+                return response
+
+            if attempt >= self.max_retries:
+                self.breaker.record_failure()
+                if error is not None:
+                    raise error
+                return response
+
+            delay = self._backoff(attempt, response)
+            logger.warning(
+                f"Gemini {endpoint}: {error or response.status_code}, retry {attempt + 1}/{self.max_retries} in {delay:.2f}s"
+            )
+            if response is not None:
+                response.close()
+            with self._metrics_lock:
+                metrics.retries += 1
+            time.sleep(delay)
+            attempt += 1
+
+    async def apost(self, endpoint, url, payload, timeout):
+        """
+        post() for the gemini-io loop: same retries, breaker and metrics.
+        Returns the last httpx.Response. (Await it through call())
+        """
+        metrics = self._endpoint(endpoint)
+        if not self.breaker.allow():
+            with self._metrics_lock:
+                metrics.short_circuited += 1
+            raise GeminiUnavailable('Gemini temporarily unavailable (circuit open)')
+
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = await self._async_session.post(url, json=payload, timeout=timeout)
+                error = None
+            except httpx.TransportError as e: # timeouts, connection and protocol errors
+                response, error = None, e
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception:
+                self.breaker.record_failure()
+                raise
+
+            retryable = error is not None or response.status_code in RETRY_STATUS
+            self._record(metrics, time.perf_counter() - started, response)
+
+            if not retryable:
+                self.breaker.record_success()
+                return response
+
+            if attempt >= self.max_retries:
+                self.breaker.record_failure()
+                if error is not None:
+                    raise error
+                return response
+
+            delay = self._backoff(attempt, response)
+            logger.warning(
+                f"Gemini {endpoint}: {error or response.status_code}, retry {attempt + 1}/{self.max_retries} in {delay:.2f}s"
+            )
+            with self._metrics_lock:
+                metrics.retries += 1
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            attempt += 1
+
+    def submit(self, coro):
+        """Schedule a coroutine on the gemini-io loop. Returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self._io_loop())
+
+    async def call(self, coro):
+        """Await a coroutine that uses apost() from any event loop (cancelling this cancels it)"""
+        if asyncio.get_running_loop() is self._loop:
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def _io_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    # The client must be created on the loop that uses it
+                    self._async_session = httpx.AsyncClient(
+                        headers={'Content-Type': 'application/json'},
+                        limits=httpx.Limits(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.pool_size
+                        )
+                    )
+                    ready.set()
+                    loop.run_forever()
+
+                threading.Thread(target=run, name='gemini-io', daemon=True).start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def _backoff(self, attempt, response):
+        """Full jitter exponential backoff; Retry-After (seconds) wins when the server sends it"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _endpoint(self, endpoint):
+        with self._metrics_lock:
+            return self._metrics.setdefault(endpoint, EndpointMetrics())
+
+    def _record(self, metrics, seconds, response):
+        with self._metrics_lock:
+            metrics.requests += 1
+            metrics.latencies.append(seconds)
+            if response is None or response.status_code >= 400:
+                metrics.errors += 1
+            status = str(response.status_code) if response is not None else 'network'
+            metrics.status[status] = metrics.status.get(status, 0) + 1
+
+    def get_metrics(self):
+        with self._metrics_lock:
+            endpoints = {name: metrics.to_dict() for name, metrics in self._metrics.items()}
+        return {
+            'circuit': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'endpoints': endpoints
+        }
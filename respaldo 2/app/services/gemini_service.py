@@ -4,10 +4,22 @@ Handles AI-powered chatbot responses using direct REST API calls
 """
 
 import os
+import json
+import httpx
 import requests
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Union
+from app.services.gemini_client import GeminiClient, GeminiUnavailable
+from app.utils.image_payload import ImageBlob
+from app.services.image_normalizer import image_normalizer
+
+# An image: decoded bytes, or (older callers) a base64 string / data URI
+ImageInput = Union[ImageBlob, str]
 
 class GeminiService:
+    # generate_try_on*() results carry no rendered image yet (gemini-2.0-flash
+    # answers with text, see _try_on_result): try-on attempts cannot be validated
+    TRY_ON_RETURNS_IMAGE = False
+    
     def __init__(self):
         """Initialize Gemini API with API key from environment"""
         self.api_key = os.getenv('GEMINI_API_KEY')
@@ -16,6 +28,18 @@ class GeminiService:
         
         # Use REST API endpoint
         self.base_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+        self.stream_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:streamGenerateContent"
+        
+        # Pooled, retrying HTTP client with circuit breaker (shared by all methods)
+        self.client = GeminiClient()
+        
+        # Per-method timeouts in seconds; streams use (connect, max silence between events)
+        self.timeouts = {
+            'chat': float(os.getenv('GEMINI_TIMEOUT_CHAT', 10)),
+            'chat_stream': (5, float(os.getenv('GEMINI_TIMEOUT_STREAM', 30))),
+            'vision': float(os.getenv('GEMINI_TIMEOUT_VISION', 15)),
+            'try_on': float(os.getenv('GEMINI_TIMEOUT_TRY_ON', 30))
+        }
         
     def analyze_inquiry(self, inquiry: str, language: str = 'es') -> Dict:
         """
@@ -29,75 +53,139 @@ class GeminiService:
             Dict with analysis and suggestions
         """
         try:
-            # Prepare request
+            # Make request
             url = f"{self.base_url}?key={self.api_key}"
-            
-            headers = {
-                'Content-Type': 'application/json'
-            }
-            
-            data = {
-                "contents": [{
-                    "parts": [{
-                        "text": inquiry
-                    }]
+            response = self.client.post('chat', url, self._text_payload(inquiry), timeout=self.timeouts['chat'])
+            return self._inquiry_result(response, language)
+        except Exception as e:
+            return self._inquiry_error(e)
+
+    async def analyze_inquiry_async(self, inquiry: str, language: str = 'es') -> Dict:
+        """analyze_inquiry() for async views; the request runs on the shared gemini-io loop"""
+        try:
+            url = f"{self.base_url}?key={self.api_key}"
+            response = await self.client.call(
+                self.client.apost('chat', url, self._text_payload(inquiry), timeout=self.timeouts['chat'])
+            )
+            return self._inquiry_result(response, language)
+        except Exception as e:
+            return self._inquiry_error(e)
+
+    @staticmethod
+    def _text_payload(inquiry: str) -> Dict:
+        return {
+            "contents": [{
+                "parts": [{
+                    "text": inquiry
                 }]
-            }
+            }]
+        }
+
+    @staticmethod
+    def _inquiry_result(response, language: str) -> Dict:
+        """Response (requests or httpx) of a chat call -> result dict"""
+        if response.status_code == 200:
+            result = response.json()
             
-            # Make request
-            response = requests.post(url, json=data, headers=headers, timeout=10)
+            # Extract text from response
+            if 'candidates' in result and len(result['candidates']) > 0:
+                candidate = result['candidates'][0]
+                if 'content' in candidate and 'parts' in candidate['content']:
+                    text = candidate['content']['parts'][0].get('text', '')
+                    
+                    return {
+                        'success': True,
+                        'content': text,
+                        'language': language
+                    }
+        
+        # If we get here, something went wrong
+        error_msg = f"API Error: {response.status_code} - {response.text}"
+        print(f"Gemini API Error: {error_msg}") # Print to stdout for immediate visibility in dev
+        
+        if response.status_code == 404:
+            error_msg = "Model not found - API may not be enabled or model name is incorrect"
+        elif response.status_code == 403:
+            error_msg = "API key invalid or API not enabled for this project"
             
-            if response.status_code == 200:
-                result = response.json()
-                
-                # Extract text from response
-                if 'candidates' in result and len(result['candidates']) > 0:
-                    candidate = result['candidates'][0]
-                    if 'content' in candidate and 'parts' in candidate['content']:
-                        text = candidate['content']['parts'][0].get('text', '')
-                        
-                        return {
-                            'success': True,
-                            'content': text,
-                            'language': language
-                        }
+        return {
+            'success': False,
+            'error': error_msg
+        }
+
+    @staticmethod
+    def _inquiry_error(e: Exception) -> Dict:
+        if isinstance(e, GeminiUnavailable):
+            # Upstream degraded: fail fast, callers show their fallback text
+            error = str(e)
+        elif isinstance(e, (requests.exceptions.Timeout, httpx.TimeoutException)):
+            error = 'Request timeout - Gemini API took too long'
+        elif isinstance(e, (requests.exceptions.RequestException, httpx.HTTPError)):
+            error = f'Network error: {str(e)}'
+        else:
+            error = f'Error al analizar consulta: {str(e)}'
+        return {
+            'success': False,
+            'error': error
+        }
+
+    def stream_inquiry(self, inquiry: str) -> Iterator[str]:
+        """
+        Stream the answer to a prompt using streamGenerateContent (SSE)
+        
+        Args:
+            inquiry: Full prompt
             
-            # If we get here, something went wrong
-            error_msg = f"API Error: {response.status_code} - {response.text}"
-            print(f"Gemini API Error: {error_msg}") # Print to stdout for immediate visibility in dev
+        Yields:
+            Text pieces as Gemini produces them
             
-            if response.status_code == 404:
-                error_msg = "Model not found - API may not be enabled or model name is incorrect"
-            elif response.status_code == 403:
-                error_msg = "API key invalid or API not enabled for this project"
-                
-            return {
-                'success': False,
-                'error': error_msg
-            }
+        Raises:
+            RuntimeError on API/network errors, before or during the stream
+        """
+        url = f"{self.stream_url}?alt=sse&key={self.api_key}"
+        data = {
+            "contents": [{
+                "parts": [{
+                    "text": inquiry
+                }]
+            }]
+        }
+        
+        try:
+            response = self.client.post('chat_stream', url, data, timeout=self.timeouts['chat_stream'], stream=True)
+            with response:
+                if response.status_code != 200:
+                    raise RuntimeError(f"API Error: {response.status_code} - {response.text}")
                 
+                response.encoding = 'utf-8'
+                for line in response.iter_lines(decode_unicode=True):
+                    # Each event is one 'data: {GenerateContentResponse}' line
+                    if not line or not line.startswith('data:'):
+                        continue
+                    event = json.loads(line[5:].strip())
+                    
+                    candidates = event.get('candidates') or []
+                    if not candidates:
+                        continue
+                    if candidates[0].get('finishReason') == 'SAFETY':
+                        raise RuntimeError('Response blocked by safety filters')
+                    for part in candidates[0].get('content', {}).get('parts', []):
+                        if part.get('text'):
+                            yield part['text']
+                            
+        except GeminiUnavailable as e:
+            raise RuntimeError(str(e))
         except requests.exceptions.Timeout:
-            return {
-                'success': False,
-                'error': 'Request timeout - Gemini API took too long'
-            }
+            raise RuntimeError('Request timeout - Gemini API took too long')
         except requests.exceptions.RequestException as e:
-            return {
-                'success': False,
-                'error': f'Network error: {str(e)}'
-            }
-        except Exception as e:
-            return {
-                'success': False,
-                'error': f'Error al analizar consulta: {str(e)}'
-            }
+            raise RuntimeError(f'Network error: {str(e)}')
 
-    def analyze_image(self, image_base64: str, prompt: str = None, seed: int = None) -> Dict:
+    def analyze_image(self, image: ImageInput, prompt: str = None, seed: int = None) -> Dict:
         """
         Analyze an image using Gemini Vision API
         
         Args:
-            image_base64: Base64 encoded image string (with or without data URI prefix)
+            image: ImageBlob (or base64 string, with or without data URI prefix)
             prompt: Optional custom prompt
             seed: Optional random seed for deterministic results
             
@@ -105,70 +193,87 @@ class GeminiService:
             Dict with analysis result
         """
         try:
-            # Clean base64 string if needed
-            if "base64," in image_base64:
-                image_base64 = image_base64.split("base64,")[1]
-            
-            # Default prompt for catalog style
-            if not prompt:
-                prompt = """
-                Analyze this clothing item and provide a high-quality product photography description.
-                Format the output exactly like this example:
-                
-                High-quality product photography of a [Gender/Category] [Color] [Item Name].
-                Fabric: [Material details].
-                Design details: [Neckline, sleeves, fit, unique features].
-                Style: [Style description].
-                Professional product lighting, white or neutral background, flat lay or on invisible stand, clothing catalog style, sharp details, commercial photography quality.
-                """
+            url, data = self._image_request(image, prompt, seed)
+            response = self.client.post('vision', url, data, timeout=self.timeouts['vision'])
+            return self._image_result(response)
+        except Exception as e:
+            return {'success': False, 'error': f"Error analyzing image: {str(e)}"}
 
-            # Use gemini-2.0-flash for vision capabilities
-            url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={self.api_key}"
-            
-            headers = {'Content-Type': 'application/json'}
+    async def analyze_image_async(self, image: ImageInput, prompt: str = None, seed: int = None) -> Dict:
+        """analyze_image() for async views"""
+        try:
+            url, data = self._image_request(image, prompt, seed)
+            response = await self.client.call(
+                self.client.apost('vision', url, data, timeout=self.timeouts['vision'])
+            )
+            return self._image_result(response)
+        except Exception as e:
+            return {'success': False, 'error': f"Error analyzing image: {str(e)}"}
+
+    def _image_request(self, image: ImageInput, prompt: Optional[str], seed: Optional[int]):
+        """Returns (url, payload) of a vision call"""
+        # Default prompt for catalog style
+        if not prompt:
+            prompt = """
+            Analyze this clothing item and provide a high-quality product photography description.
+            Format the output exactly like this example:
             
-            data = {
-                "contents": [{
-                    "parts": [
-                        {"text": prompt},
-                        {
-                            "inline_data": {
-                                "mime_type": "image/jpeg",
-                                "data": image_base64
-                            }
-                        }
-                    ]
-                }]
+            High-quality product photography of a [Gender/Category] [Color] [Item Name].
+            Fabric: [Material details].
+            Design details: [Neckline, sleeves, fit, unique features].
+            Style: [Style description].
+            Professional product lighting, white or neutral background, flat lay or on invisible stand, clothing catalog style, sharp details, commercial photography quality.
+            """
+
+        # Use gemini-2.0-flash for vision capabilities
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={self.api_key}"
+        
+        data = {
+            "contents": [{
+                "parts": [
+                    {"text": prompt},
+                    self._inline_image(image, 'vision')
+                ]
+            }]
+        }
+
+        if seed is not None:
+            data["generationConfig"] = {
+                "seed": seed,
+                "temperature": 0.0  # Deterministic
             }
+        return url, data
 
-            if seed is not None:
-                data["generationConfig"] = {
-                    "seed": seed,
-                    "temperature": 0.0  # Deterministic
-                }
-            
-            response = requests.post(url, json=data, headers=headers, timeout=15)
-            
-            if response.status_code == 200:
-                result = response.json()
-                if 'candidates' in result and len(result['candidates']) > 0:
-                    candidate = result['candidates'][0]
-                    if 'content' in candidate and 'parts' in candidate['content']:
-                        text = candidate['content']['parts'][0].get('text', '')
-                        return {'success': True, 'content': text}
-            
-            return {'success': False, 'error': f"API Error: {response.status_code} - {response.text}"}
-            
-        except Exception as e:
-            return {'success': False, 'error': f"Error analyzing image: {str(e)}"}
+    @staticmethod
+    def _inline_image(image: ImageInput, profile: str) -> Dict:
+        """
+        inline_data part of a normalized image (oriented, downsized, re-encoded;
+        see ImageNormalizer). The only place decoded images are base64 encoded.
+        """
+        if not isinstance(image, ImageBlob):
+            image = ImageBlob.from_base64(image)
+        image = image_normalizer.normalize(image, profile)
+        return {"inline_data": {"mime_type": image.mime_type, "data": image.b64()}}
 
-    def generate_try_on(self, person_image_base64: str, item_images_base64: List[str], prompt: str, seed: int = None) -> Dict:
+    @staticmethod
+    def _image_result(response) -> Dict:
+        if response.status_code == 200:
+            result = response.json()
+            if 'candidates' in result and len(result['candidates']) > 0:
+                candidate = result['candidates'][0]
+                if 'content' in candidate and 'parts' in candidate['content']:
+                    text = candidate['content']['parts'][0].get('text', '')
+                    return {'success': True, 'content': text}
+        
+        return {'success': False, 'error': f"API Error: {response.status_code} - {response.text}"}
+
+    def generate_try_on(self, person_image: ImageInput, item_images: List[ImageInput], prompt: str, seed: int = None) -> Dict:
         """
         Generate a Virtual Try-On image using Gemini Vision
         
         Args:
-            person_image_base64: Base64 string of the person
-            item_images_base64: List of Base64 strings of the clothing items
+            person_image: ImageBlob (or base64 string) of the person
+            item_images: ImageBlobs (or base64 strings) of the clothing items
             prompt: The dynamic prompt instructions
             seed: Optional seed for reproducibility
             
@@ -176,112 +281,129 @@ class GeminiService:
             Dict with 'image' (base64) and 'success' status
         """
         try:
-            # Clean base64 strings
-            if "base64," in person_image_base64:
-                person_image_base64 = person_image_base64.split("base64,")[1]
-            
-            cleaned_items = []
-            for item in item_images_base64:
-                if "base64," in item:
-                    cleaned_items.append(item.split("base64,")[1])
-                else:
-                    cleaned_items.append(item)
+            url, data = self._try_on_request(person_image, item_images, prompt, seed)
+            response = self.client.post('try_on', url, data, timeout=self.timeouts['try_on']) # Longer timeout for generation
+            return self._try_on_result(response)
+        except Exception as e:
+            return {'success': False, 'error': f"Error generating try-on: {str(e)}"}
 
-            # Build parts list: Prompt + Person Image + Item Images
-            parts = [{"text": prompt}]
-            
-            # Add Person Image
-            parts.append({
-                "inline_data": {
-                    "mime_type": "image/jpeg",
-                    "data": person_image_base64
-                }
-            })
-            
-            # Add Item Images
-            for item_data in cleaned_items:
-                parts.append({
-                    "inline_data": {
-                        "mime_type": "image/jpeg",
-                        "data": item_data
-                    }
-                })
+    async def generate_try_on_async(self, person_image: ImageInput, item_images: List[ImageInput], prompt: str, seed: int = None) -> Dict:
+        """generate_try_on() for async views and concurrent attempts"""
+        try:
+            url, data = self._try_on_request(person_image, item_images, prompt, seed)
+            response = await self.client.call(
+                self.client.apost('try_on', url, data, timeout=self.timeouts['try_on'])
+            )
+            return self._try_on_result(response)
+        except Exception as e:
+            return {'success': False, 'error': f"Error generating try-on: {str(e)}"}
 
-            # Use gemini-2.0-flash
-            url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={self.api_key}"
-            
-            headers = {'Content-Type': 'application/json'}
-            
-            data = {
-                "contents": [{
-                    "parts": parts
-                }]
+    def _try_on_request(self, person_image: ImageInput, item_images: List[ImageInput], prompt: str, seed: Optional[int]):
+        """Returns (url, payload) of a try-on call"""
+        # Build parts list: Prompt + Person Image + Item Images
+        parts = [{"text": prompt}, self._inline_image(person_image, 'try_on')]
+        parts.extend(self._inline_image(item, 'try_on') for item in item_images)
+
+        # Use gemini-2.0-flash
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={self.api_key}"
+        
+        data = {
+            "contents": [{
+                "parts": parts
+            }]
+        }
+
+        if seed is not None:
+            data["generationConfig"] = {
+                "seed": seed,
+                "temperature": 0.0
             }
+        return url, data
 
-            if seed is not None:
-                data["generationConfig"] = {
-                    "seed": seed,
-                    "temperature": 0.0
-                }
-            
-            response = requests.post(url, json=data, headers=headers, timeout=30) # Longer timeout for generation
+    @staticmethod
+    def _try_on_result(response) -> Dict:
+        if response.status_code == 200:
+            result = response.json()
+            # Check for valid response
+            if 'candidates' in result and len(result['candidates']) > 0:
+                candidate = result['candidates'][0]
+                # Check for safety ratings blocking
+                if candidate.get('finishReason') == 'SAFETY':
+                     return {'success': False, 'error': 'Image generation blocked by safety filters.'}
+                     
+                if 'content' in candidate and 'parts' in candidate['content']:
+                    # Gemini returns text description usually, but for image generation we need to check if it returns an image
+                    # Wait, Gemini 2.0 Flash generateContent returns TEXT. 
+                    # For Image Generation we might need a different model or endpoint if we want it to *render* the image.
+                    # However, the user prompt implies Gemini Vision *edits* or *generates* the image.
+                    # Current Gemini API (generateContent) returns text. 
+                    # Imagen 3 (image generation) is a different endpoint.
+                    # BUT, the user prompt says "Gemini Vision to process the image... Gemini returns edited image".
+                    # Let's assume for this "Sastre Virtual" we are using the text capability to DESCRIBE the change, 
+                    # OR if we are expecting an IMAGE return, we need to use the Imagen endpoint or check if Gemini 2.0 supports image output in this specific way.
+                    # 
+                    # CORRECTION: Gemini 2.0 Flash is multimodal input, text output. It does NOT generate images directly via `generateContent` in the standard way yet (it describes).
+                    # HOWEVER, for the purpose of this task and the user's specific request "Gemini returns edited image", 
+                    # we might be simulating the *interface* of an image generator, OR we need to use a model that supports image output if available.
+                    # The user mentioned "Gemini Vision to process... Gemini returns edited image". 
+                    # Since I cannot use a model I don't have access to (Imagen 3 via API might be restricted), 
+                    # I will implement the logic to RETURN THE TEXT DESCRIPTION for now, 
+                    # AND I will add a placeholder/simulation for the image return if the API doesn't support it directly yet,
+                    # OR I will check if `gemini-2.0-flash-exp` supports image generation (some experimental ones do).
+                    #
+                    # Actually, let's look at the `list_models` output again. 
+                    # `models/imagen-4.0-generate-preview-06-06` was there!
+                    # But that's for *generation from text*.
+                    # For *editing* (Image + Prompt -> Image), we usually need a specific editing endpoint or model.
+                    #
+                    # GIVEN THE CONSTRAINTS: I will implement the *call* structure. 
+                    # If Gemini returns text, I'll return that as a description and maybe pass back the original image (or a placeholder) to avoid breaking the frontend,
+                    # but I'll add a comment. 
+                    #
+                    # WAIT. The user said "Gemini returns edited image". 
+                    # If I use `generateContent`, I get text.
+                    # I will assume the user *wants* the text description of the look for now, 
+                    # OR I will use the `imagen-3.0-generate-001` if available for generation, but that doesn't take input images easily for editing.
+                    #
+                    # LET'S STICK TO THE PLAN: The user wants the ARCHITECTURE.
+                    # I will return the *text description* of the new look as the "result" for now, 
+                    # and maybe for the image I will return the *original* image but with the metadata embedded, 
+                    # effectively simulating the "visual" part until a real Image-to-Image API is hooked up.
+                    # This satisfies the "Control de Calidad" and "Metadata" requirements.
+                    
+                    text = candidate['content']['parts'][0].get('text', '')
+                    return {'success': True, 'description': text, 'image': None} # Image is None, handled in API
+        
+        return {'success': False, 'error': f"API Error: {response.status_code} - {response.text}"}
+
+    async def generate_content_async(self, model: str, parts: List[Dict], endpoint: str = 'vision',
+                                     safety_settings: Optional[List[Dict]] = None) -> Dict:
+        """
+        Raw generateContent call on any model (e.g. 'models/gemini-2.5-flash-image')
+        
+        Args:
+            model: Model resource name, as returned by list_models
+            parts: Request parts (text / inline_data)
+            endpoint: Metrics name; also selects the timeout ('vision' or 'try_on')
+            safety_settings: Optional safety settings
             
+        Returns:
+            Dict with 'success' and the raw API 'result' (or 'error')
+        """
+        url = f"https://generativelanguage.googleapis.com/v1beta/{model}:generateContent?key={self.api_key}"
+        data = {"contents": [{"parts": parts}]}
+        if safety_settings:
+            data["safetySettings"] = safety_settings
+        
+        try:
+            response = await self.client.call(
+                self.client.apost(endpoint, url, data, timeout=self.timeouts[endpoint])
+            )
             if response.status_code == 200:
-                result = response.json()
-                # Check for valid response
-                if 'candidates' in result and len(result['candidates']) > 0:
-                    candidate = result['candidates'][0]
-                    # Check for safety ratings blocking
-                    if candidate.get('finishReason') == 'SAFETY':
-                         return {'success': False, 'error': 'Image generation blocked by safety filters.'}
-                         
-                    if 'content' in candidate and 'parts' in candidate['content']:
-                        # Gemini returns text description usually, but for image generation we need to check if it returns an image
-                        # Wait, Gemini 2.0 Flash generateContent returns TEXT. 
-                        # For Image Generation we might need a different model or endpoint if we want it to *render* the image.
-                        # However, the user prompt implies Gemini Vision *edits* or *generates* the image.
-                        # Current Gemini API (generateContent) returns text. 
-                        # Imagen 3 (image generation) is a different endpoint.
-                        # BUT, the user prompt says "Gemini Vision to process the image... Gemini returns edited image".
-                        # Let's assume for this "Sastre Virtual" we are using the text capability to DESCRIBE the change, 
-                        # OR if we are expecting an IMAGE return, we need to use the Imagen endpoint or check if Gemini 2.0 supports image output in this specific way.
-                        # 
-                        # CORRECTION: Gemini 2.0 Flash is multimodal input, text output. It does NOT generate images directly via `generateContent` in the standard way yet (it describes).
-                        # HOWEVER, for the purpose of this task and the user's specific request "Gemini returns edited image", 
-                        # we might be simulating the *interface* of an image generator, OR we need to use a model that supports image output if available.
-                        # The user mentioned "Gemini Vision to process... Gemini returns edited image". 
-                        # Since I cannot use a model I don't have access to (Imagen 3 via API might be restricted), 
-                        # I will implement the logic to RETURN THE TEXT DESCRIPTION for now, 
-                        # AND I will add a placeholder/simulation for the image return if the API doesn't support it directly yet,
-                        # OR I will check if `gemini-2.0-flash-exp` supports image generation (some experimental ones do).
-                        #
-                        # Actually, let's look at the `list_models` output again. 
-                        # `models/imagen-4.0-generate-preview-06-06` was there!
-                        # But that's for *generation from text*.
-                        # For *editing* (Image + Prompt -> Image), we usually need a specific editing endpoint or model.
-                        #
-                        # GIVEN THE CONSTRAINTS: I will implement the *call* structure. 
-                        # If Gemini returns text, I'll return that as a description and maybe pass back the original image (or a placeholder) to avoid breaking the frontend,
-                        # but I'll add a comment. 
-                        #
-                        # WAIT. The user said "Gemini returns edited image". 
-                        # If I use `generateContent`, I get text.
-                        # I will assume the user *wants* the text description of the look for now, 
-                        # OR I will use the `imagen-3.0-generate-001` if available for generation, but that doesn't take input images easily for editing.
-                        #
-                        # LET'S STICK TO THE PLAN: The user wants the ARCHITECTURE.
-                        # I will return the *text description* of the new look as the "result" for now, 
-                        # and maybe for the image I will return the *original* image but with the metadata embedded, 
-                        # effectively simulating the "visual" part until a real Image-to-Image API is hooked up.
-                        # This satisfies the "Control de Calidad" and "Metadata" requirements.
-                        
-                        text = candidate['content']['parts'][0].get('text', '')
-                        return {'success': True, 'description': text, 'image': None} # Image is None, handled in API
-            
+                return {'success': True, 'result': response.json()}
             return {'success': False, 'error': f"API Error: {response.status_code} - {response.text}"}
-            
         except Exception as e:
-            return {'success': False, 'error': f"Error generating try-on: {str(e)}"}
+            return {'success': False, 'error': f"Error calling {model}: {str(e)}"}
 
 # Singleton instance
 gemini_service = GeminiService()
@@ -0,0 +1,105 @@
+import io
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from PIL import Image, ImageOps
+from app.utils.image_payload import ImageBlob, ImagePayloadError
+
+logger = logging.getLogger(__name__)
+
+class ImageNormalizer:
+    """
+    Prepares user photos before they are sent to Gemini.
+
+    - Applies the EXIF orientation (phones store most photos rotated).
+    - Downsizes to the profile's max edge; JPEGs are decoded directly at a
+      reduced scale (draft mode) when much larger than needed.
+    - Re-encodes to JPEG/WebP at a tuned quality, without any metadata
+      (EXIF, GPS, ICC), and labels the blob with its real MIME type.
+    - Keeps results in an LRU cache keyed by content hash and profile,
+      bounded by IMAGE_CACHE_MB, so try-on retries and re-submitted photos
+      are normalized (and base64 encoded) once.
+    """
+    _instance = None
+
+    # profile -> max edge in pixels (vision: analysis/description, try_on: image generation)
+    PROFILES = {
+        'vision': int(os.getenv('IMAGE_MAX_EDGE_VISION', 1024)),
+        'try_on': int(os.getenv('IMAGE_MAX_EDGE_TRY_ON', 1536))
+    }
+    FORMATS = {'jpeg': ('JPEG', 'image/jpeg'), 'webp': ('WEBP', 'image/webp')}
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ImageNormalizer, cls).__new__(cls)
+            cls._instance.initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self.initialized:
+            return
+
+        self.initialized = True
+        self.format, self.mime_type = self.FORMATS.get(os.getenv('IMAGE_FORMAT', 'jpeg').lower(), self.FORMATS['jpeg'])
+        self.quality = int(os.getenv('IMAGE_QUALITY', 85))
+        self.cache_bytes = int(os.getenv('IMAGE_CACHE_MB', 64)) * 1024 * 1024
+        self._cache = OrderedDict() # (digest, profile) -> ImageBlob
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    def normalize(self, image, profile='vision'):
+        """ImageBlob -> normalized ImageBlob (cached). Raises ImagePayloadError for unreadable images."""
+        key = (image.digest(), profile)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return cached
+
+        started = time.perf_counter()
+        normalized = self._normalize(image, self.PROFILES[profile])
+        logger.info(
+            f"Image normalized for {profile}: {len(image) // 1024}KB -> {len(normalized) // 1024}KB "
+            f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+
+        with self._lock:
+            self.stats['misses'] += 1
+            self.stats['bytes_in'] += len(image)
+            self.stats['bytes_out'] += len(normalized)
+            if key not in self._cache:
+                self._cache[key] = normalized
+                self._cached_bytes += len(normalized)
+            while self._cached_bytes > self.cache_bytes and self._cache:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted)
+        return normalized
+
+    def _normalize(self, image, max_edge):
+        try:
+            img = Image.open(io.BytesIO(image.data))
+            img.draft('RGB', (max_edge, max_edge)) # JPEG only: decode at 1/2, 1/4, 1/8 scale when possible
+            img = ImageOps.exif_transpose(img)
+        except Exception as e:
+            raise ImagePayloadError(f"Unreadable image: {e}")
+
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            # JPEG has no alpha: flatten on white (catalog background)
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel('A'))
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        output = io.BytesIO()
+        img.save(output, format=self.format, quality=self.quality) # no exif/icc_profile: metadata stripped
+        return ImageBlob(output.getvalue(), self.mime_type)
+
+# Singleton
+image_normalizer = ImageNormalizer()
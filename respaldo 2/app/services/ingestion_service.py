@@ -0,0 +1,255 @@
+import os
+import time
+import socket
+import threading
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from app import db
+from app.models import IngestionJob, KnowledgeBaseDocument, KnowledgeBaseChunk
+
+logger = logging.getLogger(__name__)
+
+class IngestionQueue:
+    """
+    Background processing of knowledge-base uploads.
+
+    Jobs live in the ingestion_jobs table, so they survive restarts and can be
+    claimed by any worker process. A dispatcher thread claims queued jobs and
+    runs them on a small thread pool through the stages
+    extracting -> chunking -> embedding -> indexing.
+
+    Resume: chunks are committed batch by batch and every batch refreshes the
+    job heartbeat (extraction refreshes it every HEARTBEAT_INTERVAL while it
+    reads pages/blocks). A running job whose heartbeat is older than
+    STALE_AFTER (its worker crashed) is queued again and continues after its
+    last stored chunk, up to MAX_ATTEMPTS times.
+    """
+    _instance = None
+
+    POLL_INTERVAL = 5                   # seconds between DB polls when idle
+    STALE_AFTER = timedelta(minutes=5)  # heartbeat age that marks a job as abandoned
+    HEARTBEAT_INTERVAL = 30             # seconds between heartbeats while extracting
+    MAX_ATTEMPTS = 3
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(IngestionQueue, cls).__new__(cls)
+            cls._instance.initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self.initialized:
+            return
+
+        self.initialized = True
+        self.app = None
+        self.max_workers = int(os.getenv('INGESTION_WORKERS', 2))
+        self.worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        self._executor = None
+        self._wakeup = threading.Event()
+        self._slots = threading.Semaphore(self.max_workers)
+        self._dispatcher = None
+
+    def start(self, app):
+        """Start the dispatcher (once per process). INGESTION_WORKERS=0 disables it."""
+        if self.max_workers <= 0 or self._dispatcher is not None:
+            return
+
+        self.app = app
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ingestion')
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name='ingestion-dispatcher', daemon=True)
+        self._dispatcher.start()
+        logger.info(f"Ingestion queue started with {self.max_workers} workers")
+
+    def enqueue(self, professional_id, document_id, file_path, file_type):
+        """Create a job for an uploaded file. Caller commits the session."""
+        job = IngestionJob(
+            professional_id=professional_id,
+            document_id=document_id,
+            file_path=file_path,
+            file_type=file_type,
+            status='queued',
+            stage='queued'
+        )
+        db.session.add(job)
+        return job
+
+    def cancel_for_document(self, document_id):
+        """Stop pending/running jobs of a document being deleted. Caller commits the session."""
+        IngestionJob.query.filter(
+            IngestionJob.document_id == document_id,
+            IngestionJob.status.in_(['queued', 'running'])
+        ).update({
+            'status': 'failed',
+            'error': 'Documento eliminado',
+            'finished_at': datetime.utcnow()
+        }, synchronize_session=False)
+
+    def notify(self):
+        """Wake the dispatcher right after a commit instead of waiting for the next poll"""
+        self._wakeup.set()
+
+    def _dispatch_loop(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self._requeue_stale()
+                    while self._slots.acquire(blocking=False):
+                        job_id = self._claim_next()
+                        if job_id is None:
+                            self._slots.release()
+                            break
+                        self._executor.submit(self._run, job_id)
+            except Exception as e:
+                logger.error(f"Ingestion dispatcher error: {e}")
+
+            self._wakeup.wait(self.POLL_INTERVAL)
+            self._wakeup.clear()
+
+    def _requeue_stale(self):
+        cutoff = datetime.utcnow() - self.STALE_AFTER
+        stale = IngestionJob.query.filter(
+            IngestionJob.status == 'running',
+            IngestionJob.heartbeat_at < cutoff
+        ).all()
+        for job in stale:
+            if job.attempts >= self.MAX_ATTEMPTS:
+                job.status = 'failed'
+                job.error = job.error or 'Worker stopped responding'
+                job.finished_at = datetime.utcnow()
+            else:
+                logger.warning(f"Ingestion job {job.id} abandoned at stage '{job.stage}', re-queueing")
+                job.status = 'queued'
+        if stale:
+            db.session.commit()
+
+    def _claim_next(self):
+        """Atomically move the oldest queued job to running. Returns its id or None."""
+        while True:
+            job = IngestionJob.query.filter_by(status='queued').order_by(IngestionJob.id).first()
+            if job is None:
+                return None
+
+            claimed = IngestionJob.query.filter_by(id=job.id, status='queued').update({
+                'status': 'running',
+                'worker': self.worker_name,
+                'attempts': IngestionJob.attempts + 1,
+                'heartbeat_at': datetime.utcnow()
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return job.id
+            # Another worker process took it first
+
+    def _run(self, job_id):
+        try:
+            with self.app.app_context():
+                self._process(job_id)
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} crashed: {e}")
+        finally:
+            self._slots.release()
+            self._wakeup.set()
+
+    def _process(self, job_id):
+        from app.services.rag_service import rag_service
+        from app.utils.file_extractor import FileExtractor
+
+        job = IngestionJob.query.get(job_id)
+        document_id, professional_id = job.document_id, job.professional_id
+        # Chunks with a higher id were stored by this run (discarded if it is cancelled)
+        since_chunk_id = db.session.query(db.func.max(KnowledgeBaseChunk.id)).scalar() or 0
+
+        def progress(stage, chunks_done):
+            updated = IngestionJob.query.filter_by(id=job_id, status='running').update({
+                'stage': stage,
+                'chunks_done': chunks_done,
+                'heartbeat_at': datetime.utcnow()
+            }, synchronize_session=False)
+            db.session.commit()
+            if not updated:
+                # Cancelled (document deleted): stops extraction/ingest_document at this block/batch
+                raise RuntimeError(f"Ingestion job {job_id} cancelled")
+
+        last_beat = time.monotonic()
+
+        def extracting():
+            # Long extractions (big PDF/XLSX) must not look abandoned
+            nonlocal last_beat
+            if time.monotonic() - last_beat >= self.HEARTBEAT_INTERVAL:
+                progress('extracting', 0)
+                last_beat = time.monotonic()
+
+        try:
+            doc = KnowledgeBaseDocument.query.get(document_id) if document_id else None
+            if doc is None:
+                raise ValueError('El documento fue eliminado')
+
+            # 1. Extract (skipped when resuming: the text is already stored)
+            text_content = doc.text_content
+            if text_content is None:
+                progress('extracting', 0)
+                text_content = FileExtractor.extract_text(job.file_path, job.file_type, on_block=extracting)
+                doc.text_content = text_content
+                db.session.commit()
+                if not text_content:
+                    raise ValueError('No se pudo extraer texto del archivo')
+
+            # 2-4. Chunk, embed and index, continuing after the last stored chunk
+            if not rag_service.ingest_document(document_id, text_content, resume=True, progress=progress):
+                if IngestionJob.query.get(job_id).status != 'running':
+                    self._discard_partial(document_id, professional_id, since_chunk_id)
+                    return
+                raise RuntimeError('No se pudo indexar el documento (ver logs)')
+
+            job = IngestionJob.query.get(job_id)
+            job.status = 'done'
+            job.stage = 'done'
+            job.error = None
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            logger.info(f"Ingestion job {job_id} done: document {document_id}, {job.chunks_done} chunks")
+
+        except Exception as e:
+            db.session.rollback()
+            job = IngestionJob.query.get(job_id)
+            if job.status != 'running':
+                # Cancelled while extracting or between batches
+                self._discard_partial(document_id, professional_id, since_chunk_id)
+                return
+            job.error = str(e)
+            if job.attempts < self.MAX_ATTEMPTS and not isinstance(e, ValueError):
+                job.status = 'queued'
+                logger.warning(f"Ingestion job {job_id} failed (attempt {job.attempts}), retrying: {e}")
+            else:
+                job.status = 'failed'
+                job.finished_at = datetime.utcnow()
+                logger.error(f"Ingestion job {job_id} failed: {e}")
+            db.session.commit()
+
+    def _discard_partial(self, document_id, professional_id, since_chunk_id):
+        """
+        A cancelled job may have committed batches after its document was
+        deleted or its text replaced: delete those chunks and their vectors.
+        All chunks go when the document no longer exists.
+        """
+        from app.services.rag_service import rag_service
+
+        try:
+            if KnowledgeBaseDocument.query.get(document_id) is None:
+                since_chunk_id = 0
+            chunk_ids = [row.id for row in db.session.query(KnowledgeBaseChunk.id).filter(
+                KnowledgeBaseChunk.document_id == document_id,
+                KnowledgeBaseChunk.id > since_chunk_id
+            ).all()]
+            if chunk_ids:
+                rag_service.remove_chunks(chunk_ids, professional_id)
+                db.session.commit()
+                logger.info(f"Ingestion of document {document_id} cancelled: discarded {len(chunk_ids)} chunks")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Could not discard chunks of cancelled document {document_id}: {e}")
+
+# Singleton
+ingestion_queue = IngestionQueue()
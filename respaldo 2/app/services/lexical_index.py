@@ -0,0 +1,144 @@
+import re
+import logging
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.utils.legal_chunker import ARTICLE_SUFFIXES, TEXT_TO_DIGIT, normalize_article
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'knowledge_base_chunks_fts'
+
+# Words that mark a reference to a specific provision; "<marker> <value>" is searched as a phrase
+REFERENCE_MARKERS = ('artículo', 'articulo', 'fracción', 'fraccion', 'inciso', 'numeral', 'capítulo', 'capitulo', 'transitorio')
+
+STOPWORDS = {
+    'a', 'al', 'como', 'con', 'cual', 'cuales', 'cuando', 'de', 'del', 'dice', 'donde', 'e', 'el', 'en', 'es',
+    'esta', 'este', 'hay', 'la', 'las', 'le', 'lo', 'los', 'me', 'mi', 'no', 'o', 'para', 'pero', 'por', 'que',
+    'qué', 'se', 'si', 'sobre', 'son', 'su', 'sus', 'un', 'una', 'y', 'ya'
+}
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+def parse_references(query):
+    """
+    '¿Qué dice el artículo quinto, fracción II?' -> [('artículo', '5'), ('fracción', 'ii')]
+    Values are in normalize_article() form, the one the chunker stores.
+    """
+    tokens = _TOKEN_RE.findall(query)
+    references = []
+    for i, (marker, value) in enumerate(zip(tokens, tokens[1:])):
+        marker = marker.lower()
+        if marker in REFERENCE_MARKERS:
+            suffix = tokens[i + 2] if i + 2 < len(tokens) else ''
+            # "artículo 27 bis", "artículo 5 A" (a lowercase 'a' is the preposition)
+            if suffix.lower() in ARTICLE_SUFFIXES or (
+                value[0].isdigit() and len(suffix) == 1 and suffix.isupper() and suffix not in 'YO'
+            ):
+                value = f"{value} {suffix}"
+            references.append((marker, normalize_article(value)))
+    return references
+
+class LexicalIndex:
+    """
+    BM25 inverted index over chunk content, backed by SQLite FTS5.
+
+    The FTS table is kept in sync with knowledge_base_chunks by triggers, so
+    ingest, bulk deletes and migration scripts never need to touch it. Each
+    row carries a 'p<professional_id>' token, and every query is ANDed with
+    it, so a search only walks that professional's postings.
+    """
+
+    def __init__(self):
+        self.enabled = False
+
+    def ensure_schema(self):
+        """Create the FTS table and triggers if needed and backfill it (Call this inside app context)"""
+        try:
+            db.session.execute(text(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+                    content, professional, tokenize = 'unicode61 remove_diacritics 2'
+                )
+            """))
+            db.session.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON knowledge_base_chunks BEGIN
+                    INSERT INTO {FTS_TABLE} (rowid, content, professional)
+                    SELECT new.id, new.content, 'p' || d.professional_id
+                    FROM knowledge_base_documents d WHERE d.id = new.document_id;
+                END
+            """))
+            db.session.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON knowledge_base_chunks BEGIN
+                    DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+                END
+            """))
+            db.session.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF content ON knowledge_base_chunks BEGIN
+                    UPDATE {FTS_TABLE} SET content = new.content WHERE rowid = new.id;
+                END
+            """))
+
+            indexed = db.session.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+            total = db.session.execute(text("SELECT count(*) FROM knowledge_base_chunks")).scalar()
+            if indexed != total:
+                logger.info(f"Lexical Index: rebuilding ({indexed} indexed, {total} chunks)")
+                db.session.execute(text(f"DELETE FROM {FTS_TABLE}"))
+                db.session.execute(text(f"""
+                    INSERT INTO {FTS_TABLE} (rowid, content, professional)
+                    SELECT c.id, c.content, 'p' || d.professional_id
+                    FROM knowledge_base_chunks c JOIN knowledge_base_documents d ON d.id = c.document_id
+                """))
+
+            db.session.commit()
+            self.enabled = True
+
+        except OperationalError as e:
+            # SQLite built without FTS5: retrieval falls back to vectors only
+            db.session.rollback()
+            self.enabled = False
+            logger.error(f"Lexical Index disabled (FTS5 not available?): {e}")
+
+    def build_match(self, query, professional_id):
+        """FTS5 MATCH expression: the professional's token AND content matching any term or reference phrase"""
+        terms = []
+        for token in _TOKEN_RE.findall(query.lower()):
+            token = TEXT_TO_DIGIT.get(token, token)
+            if token in STOPWORDS or token in REFERENCE_MARKERS or (len(token) < 2 and not token.isdigit()):
+                continue
+            if f'"{token}"' not in terms:
+                terms.append(f'"{token}"')
+
+        for marker, value in parse_references(query):
+            terms.append(f'"{marker} {value}"')
+
+        if not terms:
+            return None
+        return f'professional : "p{int(professional_id)}" AND content : ({" OR ".join(terms)})'
+
+    def search(self, query, professional_id, k):
+        """Returns [(chunk_id, bm25_score)] best first (FTS5 bm25: lower is better)"""
+        if not self.enabled or k <= 0:
+            return []
+
+        match = self.build_match(query, professional_id)
+        if not match:
+            return []
+
+        try:
+            rows = db.session.execute(
+                text(f"SELECT rowid, bm25({FTS_TABLE}) AS score FROM {FTS_TABLE} "
+                     f"WHERE {FTS_TABLE} MATCH :match ORDER BY score LIMIT :k"),
+                {'match': match, 'k': k}
+            ).fetchall()
+            return [(int(row[0]), float(row[1])) for row in rows]
+        except OperationalError as e:
+            logger.warning(f"Lexical search failed for '{query}': {e}")
+            return []
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse ranked id lists: score(id) = sum(1 / (k + rank)). Returns ids best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda item_id: scores[item_id], reverse=True)
@@ -1,11 +1,88 @@
+import os
+import time
+from itertools import islice
 import numpy as np
-import pickle
+from flask import current_app
 from app import db
-from app.models import KnowledgeBaseChunk, KnowledgeBaseDocument
+from app.models import KnowledgeBaseChunk, KnowledgeBaseDocument, ProfessionalURL, Professional
+from app.utils.embedding_codec import encode_embedding, decode_embeddings
+from app.services.vector_snapshot import VectorSnapshot
+from app.services.content_generation import bump_generation
+from app.utils.legal_chunker import iter_chunks
+from app.services.lexical_index import LexicalIndex, parse_references, reciprocal_rank_fusion
 import logging
 
 logger = logging.getLogger(__name__)
 
+SNAPSHOT_CHECK_INTERVAL = 5 # seconds between checks for a snapshot written by another worker
+INGEST_BATCH_SIZE = 64 # chunks encoded and flushed per step while ingesting
+
+class ChunkMetadata:
+    """
+    Compact per-chunk metadata for everything in the index.
+    Parallel numpy arrays sorted by chunk id, so ownership checks and
+    document lookups never need an ORM round-trip.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, chunk_ids=(), professional_ids=(), document_ids=()):
+        ids = np.asarray(chunk_ids, dtype='int64')
+        order = np.argsort(ids, kind='stable')
+        # Swap all arrays at once so concurrent readers never see mixed lengths
+        self._arrays = (
+            ids[order],
+            np.asarray(professional_ids, dtype='int64')[order],
+            np.asarray(document_ids, dtype='int64')[order]
+        )
+
+    def __len__(self):
+        return len(self._arrays[0])
+
+    def add(self, chunk_ids, professional_id, document_id):
+        ids, prof_ids, doc_ids = self._arrays
+        n = len(chunk_ids)
+        self.reset(
+            np.concatenate([ids, np.asarray(chunk_ids, dtype='int64')]),
+            np.concatenate([prof_ids, np.full(n, professional_id, dtype='int64')]),
+            np.concatenate([doc_ids, np.full(n, document_id, dtype='int64')])
+        )
+
+    def remove(self, chunk_ids):
+        ids, prof_ids, doc_ids = self._arrays
+        keep = ~np.isin(ids, np.asarray(chunk_ids, dtype='int64'))
+        self._arrays = (ids[keep], prof_ids[keep], doc_ids[keep])
+
+    def chunks_of_document(self, document_id):
+        ids, _, doc_ids = self._arrays
+        return ids[doc_ids == document_id]
+
+    def replace_with_snapshot(self, chunk_ids, professional_ids, document_ids, removed_ids):
+        """
+        Take the rows of a freshly attached snapshot (minus tombstoned ids) and
+        keep in-memory rows the snapshot does not cover yet.
+        """
+        ids, prof_ids, doc_ids = self._arrays
+        chunk_ids = np.asarray(chunk_ids, dtype='int64')
+        keep_new = ~np.isin(chunk_ids, np.asarray(removed_ids, dtype='int64'))
+        keep_old = ~np.isin(ids, chunk_ids)
+        self.reset(
+            np.concatenate([chunk_ids[keep_new], ids[keep_old]]),
+            np.concatenate([np.asarray(professional_ids, dtype='int64')[keep_new], prof_ids[keep_old]]),
+            np.concatenate([np.asarray(document_ids, dtype='int64')[keep_new], doc_ids[keep_old]])
+        )
+
+    def owned_by(self, chunk_ids, professional_id):
+        """Boolean mask: which of chunk_ids belong to professional_id"""
+        ids, prof_ids, _ = self._arrays
+        chunk_ids = np.asarray(chunk_ids, dtype='int64')
+        if len(ids) == 0 or len(chunk_ids) == 0:
+            return np.zeros(len(chunk_ids), dtype=bool)
+
+        pos = np.minimum(np.searchsorted(ids, chunk_ids), len(ids) - 1)
+        return (ids[pos] == chunk_ids) & (prof_ids[pos] == professional_id)
+
 class RAGService:
     _instance = None
 
@@ -20,19 +97,23 @@ class RAGService:
             return
             
         self.initialized = True
-        self.model_name = 'all-MiniLM-L6-v2'
         self.dimension = 384
         self.encoder = None
-        self.index = None
-        self.id_map = {} # Maps FAISS index to DB ID (Chunk ID)
+        self.index = None # Partitioned by professional_id, returns chunk IDs
+        self.chunk_meta = ChunkMetadata() # chunk_id -> professional/document
+        self.snapshot = VectorSnapshot('rag', self.dimension) # mmap'd copy shared by all workers
+        self.snapshot_generation = None
+        self.lexical = LexicalIndex() # FTS5/BM25, fused with vector scores
+        self._last_snapshot_check = 0.0
         
         try:
-            from sentence_transformers import SentenceTransformer
-            import faiss
+            from app.services.encoder_service import encoder_service
+            from app.services.vector_index import PartitionedIndex
             
-            logger.info(f"Loading RAG Model ({self.model_name})...")
-            self.encoder = SentenceTransformer(self.model_name)
-            self.index = faiss.IndexFlatIP(self.dimension)
+            if not encoder_service.available:
+                raise ImportError("encoder model not loaded")
+            self.encoder = encoder_service # Shared with the other vector services
+            self.index = PartitionedIndex(self.dimension)
             
             # Load existing chunks from DB
             self._load_chunks_from_db()
@@ -50,197 +131,398 @@ class RAGService:
         except Exception as e:
             logger.warning(f"Could not load RAG chunks from DB on init: {e}")
 
+    def load_index(self):
+        """
+        Startup path (Call this inside app context).
+        Maps the on-disk snapshot if it still matches the DB, otherwise falls
+        back to a full rebuild, which also writes a fresh snapshot.
+        """
+        if not self.encoder or self.index is None:
+            return
+
+        self.lexical.ensure_schema()
+
+        try:
+            self.snapshot.configure(
+                os.getenv('VECTOR_SNAPSHOT_DIR') or os.path.join(current_app.instance_path, 'vector_snapshots')
+            )
+            manifest = self.snapshot.read_manifest()
+            if manifest and manifest.get('source') == self._source_state():
+                data = self.snapshot.load(manifest)
+                if data is not None:
+                    self.index.reset()
+                    self.chunk_meta.reset()
+                    self._attach_snapshot(data)
+                    logger.info(f"RAG Index mapped from snapshot with {self.index.ntotal} chunks.")
+                    return
+        except Exception as e:
+            logger.warning(f"Could not use RAG snapshot, rebuilding from DB: {e}")
+
+        self.reload_index()
+
+    def _source_state(self):
+        """
+        Cheap fingerprint of the chunks table, stored in the snapshot manifest.
+        SQLite reuses the ids of deleted rows, so count/max_id alone can match
+        after chunks were replaced; every ingest/delete bumps a professional's
+        content generation, so their sum marks any change. Embeddings
+        rewritten in place (scripts/migrate_embeddings_to_float32.py) change
+        size, so the total embedding bytes marks those.
+        """
+        count, max_id, embedding_bytes = db.session.query(
+            db.func.count(KnowledgeBaseChunk.id),
+            db.func.max(KnowledgeBaseChunk.id),
+            db.func.sum(db.func.length(KnowledgeBaseChunk.embedding))
+        ).one()
+        generations = db.session.query(
+            db.func.sum(db.func.coalesce(Professional.content_generation, 0))
+        ).scalar()
+        return {'count': int(count), 'max_id': int(max_id or 0), 'generations': int(generations or 0),
+                'embedding_bytes': int(embedding_bytes or 0)}
+
+    def _read_rows(self):
+        """Read every indexed chunk from DB as arrays (ids, professionals, documents, vectors)"""
+        # Join to the document so each chunk lands in its professional's partition
+        rows = db.session.query(
+            KnowledgeBaseChunk.id,
+            KnowledgeBaseChunk.embedding,
+            KnowledgeBaseChunk.document_id,
+            KnowledgeBaseDocument.professional_id
+        ).join(
+            KnowledgeBaseDocument,
+            KnowledgeBaseChunk.document_id == KnowledgeBaseDocument.id
+        ).all()
+
+        # One np.frombuffer over all blobs instead of unpickling row by row
+        vectors, valid = decode_embeddings([row.embedding for row in rows], self.dimension)
+        if not valid.all():
+            logger.warning(
+                f"RAG Index: skipped {int((~valid).sum())} chunks without float32 embedding "
+                "(run scripts/migrate_embeddings_to_float32.py)"
+            )
+
+        chunk_ids = np.array([row.id for row in rows], dtype='int64')[valid]
+        professional_ids = np.array([row.professional_id for row in rows], dtype='int64')[valid]
+        document_ids = np.array([row.document_id for row in rows], dtype='int64')[valid]
+        return chunk_ids, professional_ids, document_ids, vectors
+
+    def _attach_snapshot(self, data):
+        self.index.attach(data)
+        removed_ids = [i for ids in self.index.removed.values() for i in ids]
+        self.chunk_meta.replace_with_snapshot(data.ids, data.partitions, data.extra, removed_ids)
+        self.snapshot_generation = data.generation
+
+    def _write_snapshot(self):
+        """Persist the DB state as a new snapshot generation and serve it. Returns False if unavailable."""
+        if not self.snapshot.enabled:
+            return False
+
+        source = self._source_state()
+        chunk_ids, professional_ids, document_ids, vectors = self._read_rows()
+        self.snapshot.write(chunk_ids, professional_ids, vectors, extra=document_ids, source=source)
+
+        data = self.snapshot.load()
+        if data is None:
+            return False
+
+        self._attach_snapshot(data)
+        return True
+
+    def _schedule_snapshot(self):
+        """Rewrite the snapshot in the background after ingest/delete"""
+        self.snapshot.schedule_write(current_app._get_current_object(), self._write_snapshot)
+
+    def _refresh_from_snapshot(self):
+        """Pick up a snapshot generation written by another worker"""
+        now = time.monotonic()
+        if not self.snapshot.enabled or now - self._last_snapshot_check < SNAPSHOT_CHECK_INTERVAL:
+            return
+        self._last_snapshot_check = now
+
+        manifest = self.snapshot.read_manifest()
+        if manifest and (self.snapshot_generation is None or manifest['generation'] > self.snapshot_generation):
+            data = self.snapshot.load(manifest)
+            if data is not None:
+                self._attach_snapshot(data)
+                logger.info(f"RAG Index switched to snapshot generation {data.generation}")
+
     def reload_index(self):
-        """Rebuild index from DB (Call this inside app context)"""
-        if not self.encoder or not self.index:
+        """
+        Full rebuild of the index from DB (Call this inside app context).
+        Expensive: used when no valid snapshot exists and by /api/chatbot/admin/reload-rag.
+        Regular ingest/delete go through add_chunks/remove_document.
+        """
+        if not self.encoder or self.index is None:
             return
 
         try:
-            chunks = KnowledgeBaseChunk.query.all()
             self.index.reset()
-            self.id_map = {}
-            
-            if not chunks:
+            self.chunk_meta.reset()
+
+            if self._write_snapshot():
+                logger.info(f"RAG Index reloaded with {self.index.ntotal} chunks (snapshot {self.snapshot_generation}).")
                 return
 
-            vectors = []
-            valid_chunks = []
-            
-            for chunk in chunks:
-                if chunk.embedding:
-                    emb = pickle.loads(chunk.embedding)
-                    vectors.append(emb)
-                    valid_chunks.append(chunk)
-            
-            if vectors:
-                vectors_np = np.array(vectors).astype('float32')
-                self.index.add(vectors_np)
-                
-                for i, chunk in enumerate(valid_chunks):
-                    self.id_map[i] = chunk.id
+            # No snapshot directory: keep everything in the in-memory partitions
+            chunk_ids, professional_ids, document_ids, vectors = self._read_rows()
+            for professional_id in np.unique(professional_ids):
+                mask = professional_ids == professional_id
+                self.index.add(int(professional_id), chunk_ids[mask], vectors[mask])
+            self.chunk_meta.reset(chunk_ids, professional_ids, document_ids)
             
             logger.info(f"RAG Index reloaded with {self.index.ntotal} chunks.")
             
         except Exception as e:
             logger.error(f"Error reloading RAG index: {e}")
 
-    def ingest_document(self, document_id, text_content, chunk_size=500):
-        """Split document into chunks and save to DB"""
+    def ingest_document(self, document_id, text_content, chunk_size=500, resume=False, progress=None):
+        """
+        Split document into chunks and save to DB.
+
+        Each batch is committed and indexed before the next one is encoded, so
+        resume=True continues after the last stored chunk (crash recovery of
+        ingestion jobs). progress(stage, chunks_done) is called per batch.
+        """
         if not self.encoder or not text_content:
             return False
 
         try:
-            # 1. Split text into chunks (Simple character split for now, better to use RecursiveCharacterTextSplitter)
-            # Approximate 4 chars per token -> 500 tokens ~= 2000 chars
-            # Approximate 4 chars per token -> 500 tokens ~= 2000 chars
-            chars_per_chunk = chunk_size * 4
-            overlap = 200 # 50 tokens overlap
-            
-            chunks = []
-            start = 0
-            while start < len(text_content):
-                end = start + chars_per_chunk
-                chunks.append(text_content[start:end])
-                start += (chars_per_chunk - overlap)
-            
-            # 2. Process chunks
-            # Batch encode for performance
-            embeddings = self.encoder.encode(chunks)
-            
-            for i, (chunk_text, vector) in enumerate(zip(chunks, embeddings)):
-                # Save to DB
-                kb_chunk = KnowledgeBaseChunk(
-                    document_id=document_id,
-                    content=chunk_text,
-                    embedding=pickle.dumps(vector),
-                    chunk_index=i
-                )
-                db.session.add(kb_chunk)
+            doc = KnowledgeBaseDocument.query.get(document_id)
+            if not doc:
+                return False
+            professional_id = doc.professional_id
+
+            chunk_index = 0
+            if resume:
+                last_index = db.session.query(db.func.max(KnowledgeBaseChunk.chunk_index)).filter(
+                    KnowledgeBaseChunk.document_id == document_id
+                ).scalar()
+                chunk_index = 0 if last_index is None else last_index + 1
+
+            # 1. Split on the legal structure (articles, fracciones, pages) within the token budget.
+            # Chunks are streamed in batches, so a huge law is never held twice in memory.
+            chunks = islice(iter_chunks(text_content, max_tokens=chunk_size), chunk_index, None)
             
-            db.session.commit()
+            added = 0
+            while True:
+                if progress:
+                    progress('chunking', chunk_index)
+                batch = list(islice(chunks, INGEST_BATCH_SIZE))
+                if not batch:
+                    break
+
+                # 2. Process chunks
+                # Batch encode for performance (document text is not worth caching)
+                if progress:
+                    progress('embedding', chunk_index)
+                embeddings = self.encoder.encode([c.content for c in batch], use_cache=False)
+                
+                kb_chunks = []
+                for chunk, vector in zip(batch, embeddings):
+                    # Save to DB
+                    kb_chunk = KnowledgeBaseChunk(
+                        document_id=document_id,
+                        content=chunk.content,
+                        embedding=encode_embedding(vector),
+                        chunk_index=chunk_index,
+                        article=chunk.article,
+                        page=chunk.page,
+                        heading=chunk.heading
+                    )
+                    db.session.add(kb_chunk)
+                    kb_chunks.append(kb_chunk)
+                    chunk_index += 1
+
+                db.session.commit()
+                
+                # 3. Update Index (only the new vectors), then let the session forget the texts
+                if progress:
+                    progress('indexing', chunk_index)
+                self.add_chunks(professional_id, document_id, [c.id for c in kb_chunks], embeddings)
+                for kb_chunk in kb_chunks:
+                    db.session.expunge(kb_chunk)
+                added += len(kb_chunks)
             
-            # 3. Update Index
-            self.reload_index()
-            return True
+            if added:
+                # Cached answers were built without this document
+                bump_generation(professional_id)
+                db.session.commit()
+                self._schedule_snapshot()
+            return chunk_index > 0
             
         except Exception as e:
             logger.error(f"Error ingesting document {document_id}: {e}")
             db.session.rollback()
             return False
 
+    def add_chunks(self, professional_id, document_id, chunk_ids, vectors):
+        """Add freshly stored chunks to the professional's partition"""
+        if self.index is None:
+            return
+
+        self.index.add(professional_id, chunk_ids, np.asarray(vectors, dtype='float32'))
+        self.chunk_meta.add(chunk_ids, professional_id, document_id)
+        logger.info(f"RAG Index: added {len(chunk_ids)} chunks for professional {professional_id}")
+
+    def remove_document(self, document_id, professional_id):
+        """
+        Delete a document's chunks from DB and drop their vectors from the index.
+        Caller commits the session.
+        """
+        deleted = KnowledgeBaseChunk.query.filter_by(document_id=document_id).delete(synchronize_session=False)
+        bump_generation(professional_id)
+
+        chunk_ids = self.chunk_meta.chunks_of_document(document_id)
+        if self.index is not None and len(chunk_ids):
+            removed = self.index.remove(professional_id, chunk_ids)
+            self.chunk_meta.remove(chunk_ids)
+            self._schedule_snapshot()
+            logger.info(f"RAG Index: removed {removed} chunks of document {document_id}")
+
+        return deleted
+
+    def remove_chunks(self, chunk_ids, professional_id):
+        """
+        Delete specific chunks (e.g. the partial batches of a cancelled
+        ingestion) from DB and index. Caller commits the session.
+        """
+        if not chunk_ids:
+            return 0
+
+        deleted = KnowledgeBaseChunk.query.filter(KnowledgeBaseChunk.id.in_(chunk_ids)).delete(synchronize_session=False)
+        bump_generation(professional_id)
+
+        if self.index is not None:
+            self.index.remove(professional_id, chunk_ids)
+            self.chunk_meta.remove(chunk_ids)
+            self._schedule_snapshot()
+        return deleted
+
+    def replace_url_content(self, p_url):
+        """
+        Store a ProfessionalURL's cached_content as the text of its (hidden) URL
+        document, dropping the chunks of the previous version. Returns the
+        document; the caller commits and then ingests it (ingest_document or
+        the ingestion queue).
+        """
+        doc = KnowledgeBaseDocument.query.filter_by(source_url_id=p_url.id).first()
+        if doc is None:
+            doc = KnowledgeBaseDocument(
+                professional_id=p_url.professional_id,
+                filename=f"url-{p_url.id}",
+                original_filename=p_url.url[:255],
+                file_type='url',
+                source_url_id=p_url.id
+            )
+            db.session.add(doc)
+        else:
+            self.remove_document(doc.id, doc.professional_id)
+
+        doc.text_content = p_url.cached_content
+        doc.file_size = len(p_url.cached_content.encode('utf-8')) if p_url.cached_content else 0
+        db.session.flush()
+        return doc
+
+    def remove_url(self, url_id, professional_id):
+        """Drop the URL document of a ProfessionalURL and its chunks. Caller commits the session."""
+        doc = KnowledgeBaseDocument.query.filter_by(source_url_id=url_id).first()
+        if doc is None:
+            return None
+        self.remove_document(doc.id, professional_id)
+        db.session.delete(doc)
+        return doc.id
+
+    def _fetch_contents(self, chunk_ids):
+        """Hydrate chunk texts with a single IN (...) query. Chunks of URL documents are tagged with their source."""
+        if not chunk_ids:
+            return {}
+
+        rows = db.session.query(KnowledgeBaseChunk.id, KnowledgeBaseChunk.content, ProfessionalURL.url).join(
+            KnowledgeBaseDocument,
+            KnowledgeBaseChunk.document_id == KnowledgeBaseDocument.id
+        ).outerjoin(
+            ProfessionalURL,
+            KnowledgeBaseDocument.source_url_id == ProfessionalURL.id
+        ).filter(
+            KnowledgeBaseChunk.id.in_(chunk_ids)
+        ).all()
+        return {
+            chunk_id: f"Fuente: {url}\n{content}" if url else content
+            for chunk_id, content, url in rows
+        }
+
+    def _article_chunks(self, professional_id, articles, limit):
+        """Chunk ids of the given articles in this professional's documents, in reading order"""
+        rows = db.session.query(KnowledgeBaseChunk.id).join(
+            KnowledgeBaseDocument,
+            KnowledgeBaseChunk.document_id == KnowledgeBaseDocument.id
+        ).filter(
+            KnowledgeBaseDocument.professional_id == professional_id,
+            KnowledgeBaseChunk.article.in_(articles)
+        ).order_by(
+            KnowledgeBaseChunk.document_id,
+            KnowledgeBaseChunk.chunk_index
+        ).limit(limit).all()
+        return [row.id for row in rows]
+
     def retrieve_context(self, query, professional_id, top_k=5):
-        """Retrieve most relevant chunks for a query"""
-        if not self.encoder or not self.index or self.index.ntotal == 0:
-            return ""
+        """Retrieve most relevant chunks for a query, joined into one text"""
+        return "\n\n---\n\n".join(self.retrieve_chunks(query, professional_id, top_k))
+
+    def retrieve_chunks(self, query, professional_id, top_k=5):
+        """Most relevant chunk texts for a query, best first"""
+        if self.index is not None:
+            self._refresh_from_snapshot()
+
+        if not self.encoder or self.index is None or self.index.size(professional_id) == 0:
+            return []
             
         try:
-            # Debug log entry
-            with open('rag_debug.log', 'a', encoding='utf-8') as f:
-                f.write(f"\n--- RETRIEVE CONTEXT CALLED ---\nQuery: '{query}'\nProfID: {professional_id}\n")
-
             # 1. Encode query
             query_vector = self.encoder.encode([query]).astype('float32')
             
-            # 2. Search (Vector)
-            # Fetch more candidates to allow for filtering by professional_id
-            fetch_k = top_k * 100 
-            D, I = self.index.search(query_vector, fetch_k)
-            
-            print(f"RAG Search: Query='{query}', ProfID={professional_id}, FetchK={fetch_k}")
-            
-            relevant_chunks = []
-            seen_chunk_ids = set()
+            # Candidates per ranker; the fused list is cut to top_k at the end
+            candidates = max(top_k * 2, 10)
 
-            # --- KEYWORD BOOST (Hybrid Search) ---
-            # If query asks for specific article, force include it
-            import re
-            
-            # Map text numbers to digits
-            text_to_digit = {
-                'primero': '1', 'uno': '1', '1ro': '1',
-                'segundo': '2', 'dos': '2', '2do': '2',
-                'tercero': '3', 'tres': '3', '3ro': '3',
-                'cuarto': '4', 'cuatro': '4', '4to': '4',
-                'quinto': '5', 'cinco': '5', '5to': '5',
-                'sexto': '6', 'seis': '6', '6to': '6',
-                'septimo': '7', 'siete': '7', '7mo': '7', 'séptimo': '7',
-                'octavo': '8', 'ocho': '8', '8vo': '8',
-                'noveno': '9', 'nueve': '9', '9no': '9',
-                'decimo': '10', 'diez': '10', '10mo': '10', 'décimo': '10'
-            }
-            
-            # Match "articulo X" where X can be digit or text
-            match = re.search(r'art[íi]culo\s+(\w+)', query.lower())
-            if match:
-                val = match.group(1)
-                art_num = None
-                
-                if val.isdigit():
-                    art_num = val
-                elif val in text_to_digit:
-                    art_num = text_to_digit[val]
-                
-                if art_num:
-                    print(f"  Detected search for Article {art_num} (from '{val}'). Boosting...")
-                    
-                    # Search DB for "Artículo X" or "Articulo X"
-                    keyword_chunks = KnowledgeBaseChunk.query.filter(
-                        (KnowledgeBaseChunk.content.ilike(f"%Artículo {art_num}%")) | 
-                        (KnowledgeBaseChunk.content.ilike(f"%Articulo {art_num}%"))
-                    ).all()
-                    
-                    for k_chunk in keyword_chunks:
-                        # Filter by professional
-                        doc = KnowledgeBaseDocument.query.get(k_chunk.document_id)
-                        if doc and doc.professional_id == professional_id:
-                            # Prioritize chunks that START with the article to find definition
-                            # e.g. "Artículo 3. ..." or "Artículo 3.-"
-                            # Check first 50 chars for loose match and use LOWERCASE
-                            content_start = k_chunk.content[:50].lower()
-                            target = f"artículo {art_num}"
-                            target_noacc = f"articulo {art_num}"
-                            
-                            # Debug log
-                            with open('rag_debug.log', 'a', encoding='utf-8') as f:
-                                f.write(f"Checking Chunk {k_chunk.id}: '{content_start}' vs '{target}'/'{target_noacc}'\n")
-                            
-                            if target in content_start or target_noacc in content_start:
-                                 with open('rag_debug.log', 'a', encoding='utf-8') as f:
-                                     f.write(f"  >>> BOOSTING CHUNK {k_chunk.id} <<<\n")
-                                 print(f"  >>> BOOSTING DEFINITION CHUNK {k_chunk.id} <<<")
-                                 relevant_chunks.insert(0, k_chunk.content) # Put at TOP
-                            else:
-                                 relevant_chunks.append(k_chunk.content)
-                            
-                            seen_chunk_ids.add(k_chunk.id)
-                            
-                            if len(relevant_chunks) >= top_k: 
-                                break
+            # --- LEXICAL SEARCH (BM25 over this professional's chunks) ---
+            lexical_ids = [chunk_id for chunk_id, _ in self.lexical.search(query, professional_id, candidates)]
 
             # --- VECTOR SEARCH ---
-            for rank, idx in enumerate(I[0]):
-                if idx == -1: continue
-                
-                chunk_id = self.id_map.get(idx)
-                if chunk_id and chunk_id not in seen_chunk_ids:
-                    chunk = KnowledgeBaseChunk.query.get(chunk_id)
-                    if chunk:
-                        # Filter by professional_id (via document)
-                        doc = KnowledgeBaseDocument.query.get(chunk.document_id)
-                        if doc and doc.professional_id == professional_id:
-                            # print(f"  Match Found: Rank={rank}, ChunkID={chunk.id}, Score={D[0][rank]:.4f}")
-                            relevant_chunks.append(chunk.content)
-                            seen_chunk_ids.add(chunk.id)
-                            
-                            if len(relevant_chunks) >= top_k:
-                                break
+            # Only this professional's partition is scanned
+            D, I = self.index.search(professional_id, query_vector, candidates)
+            vector_ids = [int(i) for i in I if i != -1]
+            owned = self.chunk_meta.owned_by(vector_ids, professional_id)
+            vector_ids = [cid for cid, ok in zip(vector_ids, owned) if ok]
+
+            # --- HYBRID: Reciprocal Rank Fusion ---
+            fused_ids = reciprocal_rank_fusion([vector_ids, lexical_ids])
+            contents = self._fetch_contents(fused_ids)
+            fused_ids = [cid for cid in fused_ids if cid in contents]
+
+            # If the query cites an article, its chunks (from the chunker's metadata)
+            # hold the definition: put them at the TOP
+            articles = [
+                value for marker, value in parse_references(query)
+                if marker in ('artículo', 'articulo')
+            ]
+            definitions = []
+            if articles:
+                definitions = self._article_chunks(professional_id, articles, top_k)
+                contents.update(self._fetch_contents([cid for cid in definitions if cid not in contents]))
+                fused_ids = definitions + [cid for cid in fused_ids if cid not in definitions]
+
+            relevant_chunks = [contents[cid] for cid in fused_ids[:top_k]]
             
-            print(f"RAG Search Result: Found {len(relevant_chunks)} chunks")
-            return "\n\n---\n\n".join(relevant_chunks)
+            logger.debug(
+                f"RAG search for professional {professional_id}: {len(vector_ids)} vector / "
+                f"{len(lexical_ids)} lexical candidates, {len(definitions)} article chunks boosted, "
+                f"{len(relevant_chunks)} returned"
+            )
+            return relevant_chunks
             
         except Exception as e:
             logger.error(f"Error retrieving context: {e}")
-            return ""
+            return []
 
 # Singleton
 rag_service = RAGService()
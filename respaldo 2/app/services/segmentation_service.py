@@ -0,0 +1,139 @@
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+import numpy as np
+import cv2
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+class SegmentationService:
+    """
+    CPU-only person/background separation for try-on validation.
+
+    The person mask of a photo is computed with OpenCV GrabCut at a small
+    working size (SEGMENT_SIZE long edge), seeded with a portrait rectangle,
+    and cleaned up morphologically. Masks are cached by image content hash:
+    in memory (LRU, SEGMENT_CACHE_SIZE masks) and as PNG files under
+    instance/segmentation_masks (or SEGMENT_CACHE_DIR), shared by all
+    worker processes. Repeated try-ons of the same client photo therefore
+    skip GrabCut entirely.
+
+    A mask that covers almost nothing or almost everything is treated as a
+    failed segmentation: person_mask() returns None and callers fall back
+    to their default.
+    """
+    _instance = None
+
+    ITERATIONS = 3
+    MIN_PERSON = 0.05  # plausible fraction of the frame covered by the person
+    MAX_PERSON = 0.90
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SegmentationService, cls).__new__(cls)
+            cls._instance.initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self.initialized:
+            return
+
+        self.initialized = True
+        self.size = int(os.getenv('SEGMENT_SIZE', 256))
+        self.cache_size = int(os.getenv('SEGMENT_CACHE_SIZE', 256))
+        self._cache = OrderedDict() # digest -> bool mask (True = person), or None for failed segmentations
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'computed': 0}
+
+    def person_mask(self, image):
+        """
+        Person mask of an ImageBlob at SEGMENT_SIZE (bool array, True = person),
+        or None when the photo could not be segmented.
+        """
+        key = image.digest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return self._cache[key]
+
+        path = self._cache_path(key)
+        mask = self._load(path)
+        if mask is not None:
+            with self._lock:
+                self.stats['disk_hits'] += 1
+        else:
+            started = time.perf_counter()
+            mask = self._segment(image)
+            logger.info(f"Person segmentation computed in {(time.perf_counter() - started) * 1000:.0f}ms")
+            with self._lock:
+                self.stats['computed'] += 1
+            self._store(path, mask)
+
+        mask = mask if self._plausible(mask) else None
+        with self._lock:
+            self._cache[key] = mask
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return mask
+
+    def _segment(self, image):
+        img = cv2.imdecode(np.frombuffer(image.data, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("Unreadable image")
+        scale = self.size / max(img.shape[:2])
+        if scale < 1:
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        h, w = img.shape[:2]
+        # Portrait framing: the subject is centered and may touch the bottom edge
+        rect = (int(w * 0.12), int(h * 0.04), int(w * 0.76), int(h * 0.96))
+        mask = np.zeros((h, w), np.uint8)
+        bgd_model = np.zeros((1, 65), np.float64)
+        fgd_model = np.zeros((1, 65), np.float64)
+        cv2.grabCut(img, mask, rect, bgd_model, fgd_model, self.ITERATIONS, cv2.GC_INIT_WITH_RECT)
+
+        person = np.where((mask == cv2.GC_FGD) | (mask == cv2.GC_PR_FGD), 255, 0).astype(np.uint8)
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+        person = cv2.morphologyEx(person, cv2.MORPH_OPEN, kernel)
+        person = cv2.morphologyEx(person, cv2.MORPH_CLOSE, kernel)
+        return person > 0
+
+    def _plausible(self, mask):
+        return self.MIN_PERSON <= float(mask.mean()) <= self.MAX_PERSON
+
+    def _cache_path(self, key):
+        directory = os.getenv('SEGMENT_CACHE_DIR')
+        if not directory:
+            if not has_app_context():
+                return None
+            directory = os.path.join(current_app.instance_path, 'segmentation_masks')
+        return os.path.join(directory, f"{key}.png")
+
+    @staticmethod
+    def _load(path):
+        if path is None or not os.path.exists(path):
+            return None
+        mask = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        return mask > 0 if mask is not None else None
+
+    @staticmethod
+    def _store(path, mask):
+        if path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            ok, encoded = cv2.imencode('.png', mask.astype(np.uint8) * 255)
+            if ok:
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, 'wb') as f:
+                    f.write(encoded.tobytes())
+                os.replace(tmp, path) # atomic: other workers never read a partial file
+        except OSError as e:
+            logger.warning(f"Could not store segmentation mask: {e}")
+
+# Singleton
+segmentation_service = SegmentationService()
@@ -1,14 +1,18 @@
+import os
+import math
 import logging
-import base64
+import asyncio
 import json
 import io
 import numpy as np
 import cv2
 from datetime import datetime
 from enum import Enum
-from skimage.metrics import structural_similarity as ssim
 from PIL import Image, PngImagePlugin
 from app.services.gemini_service import gemini_service
+from app.services.image_normalizer import image_normalizer
+from app.services.segmentation_service import segmentation_service
+from app.utils.image_payload import ImageBlob
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -20,110 +24,276 @@ class TryOnStatus(Enum):
     FAILED_SIMILARITY = "failed_similarity"
     MAX_RETRIES = "max_retries_exceeded"
 
+class BackgroundSSIM:
+    """
+    SSIM of the background between the original photo and generated images.
+
+    Both images are compared at fixed low resolutions (LEVELS, long edge in
+    px) instead of full frame: the original is downscaled and its local
+    means/variances are computed once per try-on, so each attempt only
+    decodes, downscales and filters the new image. The SSIM map (same
+    formula and 7x7 window as skimage's default) is vectorized with box
+    filters and averaged over the background mask only.
+
+    The coarse level decides alone when its score is far enough from the
+    threshold; only borderline attempts are measured at the finer level.
+    """
+
+    LEVELS = (64, 256)
+    WINDOW = 7
+    C1 = (0.01 * 255) ** 2
+    C2 = (0.03 * 255) ** 2
+    # Downscaling smooths away fine changes, so a coarse pass needs a wider
+    # margin to accept than to reject
+    ACCEPT_MARGIN = 0.10
+    REJECT_MARGIN = 0.05
+
+    def __init__(self, gray: np.ndarray, mask: np.ndarray = None):
+        """mask: background = True, any resolution with gray's aspect ratio"""
+        if mask is None:
+            mask = self.default_mask(gray.shape)
+        self.levels = [self._reference(gray, mask, size) for size in self.LEVELS]
+
+    @staticmethod
+    def default_mask(shape) -> np.ndarray:
+        """Fallback when segmentation fails: everything outside a central ellipse where the subject stands"""
+        h, w = shape
+        yy, xx = np.ogrid[:h, :w]
+        subject = ((xx - w * 0.5) / (w * 0.32)) ** 2 + ((yy - h * 0.55) / (h * 0.5)) ** 2 <= 1
+        return ~subject
+
+    def score(self, gray_out: np.ndarray, threshold: float) -> float:
+        """Masked SSIM of gray_out against the original, early-exiting on the coarse level"""
+        for index, level in enumerate(self.levels):
+            value = self._ssim(level, gray_out)
+            is_last = index == len(self.levels) - 1
+            if is_last or value >= threshold + self.ACCEPT_MARGIN or value < threshold - self.REJECT_MARGIN:
+                return value
+
+    def _reference(self, gray, mask, size):
+        scale = size / max(gray.shape)
+        dsize = (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale)))
+        x = cv2.resize(gray, dsize, interpolation=cv2.INTER_AREA).astype(np.float32)
+        mu_x, var_x = self._moments(x)
+        level_mask = cv2.resize(mask.astype(np.uint8), dsize, interpolation=cv2.INTER_NEAREST).astype(bool)
+        if not level_mask.any():
+            level_mask[:] = True
+        return {'dsize': dsize, 'x': x, 'mu_x': mu_x, 'var_x': var_x, 'mask': level_mask}
+
+    def _moments(self, img):
+        window = (self.WINDOW, self.WINDOW)
+        n = self.WINDOW * self.WINDOW
+        mu = cv2.blur(img, window, borderType=cv2.BORDER_REFLECT)
+        var = (cv2.blur(img * img, window, borderType=cv2.BORDER_REFLECT) - mu * mu) * (n / (n - 1))
+        return mu, var
+
+    def _ssim(self, level, gray_out):
+        y = cv2.resize(gray_out, level['dsize'], interpolation=cv2.INTER_AREA).astype(np.float32)
+        mu_y, var_y = self._moments(y)
+        n = self.WINDOW * self.WINDOW
+        window = (self.WINDOW, self.WINDOW)
+        cov = (cv2.blur(level['x'] * y, window, borderType=cv2.BORDER_REFLECT) - level['mu_x'] * mu_y) * (n / (n - 1))
+
+        mu_x = level['mu_x']
+        ssim_map = ((2 * mu_x * mu_y + self.C1) * (2 * cov + self.C2)) / (
+            (mu_x * mu_x + mu_y * mu_y + self.C1) * (level['var_x'] + var_y + self.C2)
+        )
+        return float(ssim_map[level['mask']].mean())
+
 class VirtualTryOnManager:
     """
     Manages Virtual Try-On with validation and retries (Platform absorbs retry costs).
+    
+    Attempts differ by seed and prompt adjustments. With a speculative
+    fan-out > 1 up to that many attempts run concurrently: results are
+    validated as they arrive, the first one that passes wins and the
+    attempts still in flight are cancelled. Every launched attempt is
+    assumed to cost COST_PER_ATTEMPT (a cancelled call may already have been
+    billed by Gemini), and no more attempts are launched than the platform
+    can absorb within MAX_ABSORBED_COST on top of the one the client pays.
+    
+    Speculation only pays off when results can fail validation: while
+    Gemini returns no image (GeminiService.TRY_ON_RETURNS_IMAGE) the first
+    attempt always passes, so each extra attempt in flight would be one more
+    paid call thrown away, and the fan-out is clamped to 1.
     """
     
     MAX_RETRIES = 3
     SSIM_THRESHOLD = 0.85  # Background similarity threshold
+    SPECULATIVE_FANOUT = int(os.getenv('TRYON_SPECULATIVE_FANOUT', 1))  # attempts in flight at once (1 = sequential)
+    COST_PER_ATTEMPT = float(os.getenv('TRYON_COST_PER_ATTEMPT', 0.05))  # USD, estimated Gemini cost of one attempt
+    MAX_ABSORBED_COST = float(os.getenv('TRYON_MAX_ABSORBED_COST', 0.10))  # USD the platform absorbs per try-on
     
-    def __init__(self, client_id: str):
+    def __init__(self, client_id: str, speculative_fanout: int = None):
         self.client_id = client_id
+        self.fanout = max(1, speculative_fanout or self.SPECULATIVE_FANOUT)
+        self._background = None # task building the BackgroundSSIM reference, shared by attempts
+        
+    def max_attempts(self) -> int:
+        """Attempts allowed by MAX_RETRIES and the absorbed cost cap"""
+        absorbable = math.floor(self.MAX_ABSORBED_COST / self.COST_PER_ATTEMPT + 1e-9) if self.COST_PER_ATTEMPT > 0 else self.MAX_RETRIES
+        return max(1, min(self.MAX_RETRIES, 1 + absorbable))
         
-    def virtual_tryon(self, person_image_base64: str, items: list) -> dict:
+    async def virtual_tryon(self, person_image: ImageBlob, items: list) -> dict:
         """
-        Process Virtual Try-On with automatic retries.
+        Process Virtual Try-On with automatic retries (coroutine: the Gemini
+        calls run on the shared gemini-io loop).
         
         Args:
-            person_image_base64: Base64 string of person
-            items: List of item dicts {id, category, image}
+            person_image: Decoded image of the person
+            items: List of item dicts {id, category, image (ImageBlob)}
         
         Returns:
-            dict with status, image, attempts, logs
+            dict with status, image, attempts (launched), logs and
+            attempt_records (one per launched attempt, for billing)
         """
         
         logs = []
-        item_images = [item['image'] for item in items]
+        max_attempts = self.max_attempts()
+        fanout = min(self.fanout, max_attempts)
+        if fanout > 1 and not gemini_service.TRY_ON_RETURNS_IMAGE:
+            logger.info(f"[{self.client_id}] No try-on image to validate: speculative fan-out {fanout} clamped to 1")
+            fanout = 1
+        records = {} # attempt -> record
+        tasks = {}   # task -> attempt
+        next_attempt = 1
+        winner = None
         
-        # Pre-calculate original background signature (simplified)
-        # In a real scenario, we'd segment the background. 
-        # Here we use the whole image SSIM as a proxy for "too much change"
+        def launch():
+            nonlocal next_attempt
+            while next_attempt <= max_attempts and len(tasks) < fanout:
+                attempt = next_attempt
+                next_attempt += 1
+                logger.info(f"[{self.client_id}] Try-On Attempt {attempt}/{max_attempts}")
+                logs.append(f"Intento {attempt}/{max_attempts} a las {datetime.now().isoformat()}")
+                records[attempt] = {'attempt': attempt, 'seed': self._seed(attempt), 'status': 'running',
+                                    'ssim': None, 'speculative': attempt > 1 and fanout > 1}
+                tasks[asyncio.ensure_future(self._attempt(attempt, person_image, items, logs))] = attempt
         
-        for attempt in range(1, self.MAX_RETRIES + 1):
-            logger.info(f"[{self.client_id}] Try-On Attempt {attempt}/{self.MAX_RETRIES}")
-            logs.append(f"Intento {attempt}/{self.MAX_RETRIES} a las {datetime.now().isoformat()}")
-            
-            # 1. Build Dynamic Prompt
-            prompt = self._build_prompt(items, attempt)
-            
-            try:
-                # 2. Call Gemini Service
-                # We use a different seed per attempt to get variation
-                seed = 12345 + attempt 
-                
-                result = gemini_service.generate_try_on(
-                    person_image_base64, 
-                    item_images, 
-                    prompt, 
-                    seed=seed
-                )
-                
-                if not result['success']:
-                    logs.append(f"❌ Intento {attempt}: Error API - {result.get('error')}")
-                    continue
-                
-                # For now, Gemini returns a DESCRIPTION (Text). 
-                # To simulate the "Image Return" for validation, we will assume 
-                # the "output_image" is the person_image itself (since we don't have real image gen yet).
-                # IN A REAL IMPLEMENTATION: output_image_base64 = result['image']
-                
-                # SIMULATION FOR VALIDATION LOGIC:
-                # We will mock the validation pass/fail based on random chance or deterministic logic for testing.
-                # Since we can't validate text against an image using SSIM, we skip validation if no image returned.
-                
-                if result.get('image'):
-                    output_image_base64 = result['image']
-                    
-                    # 3. Validate Background (SSIM)
-                    ssim_score = self._validate_background_ssim(person_image_base64, output_image_base64)
-                    if ssim_score < self.SSIM_THRESHOLD:
-                        logs.append(f"❌ Intento {attempt}: Fondo modificado (SSIM: {ssim_score:.3f})")
-                        logger.warning(f"[{self.client_id}] SSIM Low: {ssim_score}")
-                        continue
-                else:
-                    # If text only, we assume success for now but log it
-                    logs.append(f"⚠️ Intento {attempt}: Solo texto generado (Validación visual omitida)")
-
-                # ===== SUCCESS =====
-                logs.append(f"✅ Intento {attempt}: Validación exitosa")
-                
-                # Embed metadata (The "Digital Twin")
-                final_image = self._embed_metadata(person_image_base64, items, result.get('description', ''), logs)
-                
-                return {
-                    "status": TryOnStatus.SUCCESS.value,
-                    "image": final_image,
-                    "description": result.get('description', ''),
-                    "attempts": attempt,
-                    "logs": logs,
-                    "timestamp": datetime.now().isoformat()
-                }
-                
-            except Exception as e:
-                logs.append(f"❌ Intento {attempt}: Excepción - {str(e)}")
-                logger.error(f"Try-On Error: {e}")
-                continue
+        try:
+            launch()
+            while tasks and winner is None:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=tasks.get): # lowest attempt first when several finish together
+                    attempt = tasks.pop(task)
+                    status, ssim_score, result = task.result()
+                    records[attempt].update(status=status, ssim=ssim_score)
+                    if status == 'passed' and winner is None:
+                        winner = (attempt, result)
+                if winner is None:
+                    launch()
+        finally:
+            # A winner was found (or the request itself was cancelled): stop the rest
+            for task, attempt in tasks.items():
+                task.cancel()
+                records[attempt]['status'] = 'cancelled'
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+                logs.append(f"⏹️ {len(tasks)} intento(s) especulativo(s) cancelado(s)")
+        
+        attempt_records = self._bill(records, winner[0] if winner else None)
+        
+        if winner is None:
+            # All retries failed
+            return {
+                "status": TryOnStatus.MAX_RETRIES.value,
+                "image": None,
+                "attempts": len(records),
+                "logs": logs,
+                "attempt_records": attempt_records,
+                "error": "No pudimos procesar tu imagen tras varios intentos. Intenta con mejor iluminación."
+            }
+        
+        attempt, result = winner
+        
+        # ===== SUCCESS =====
+        # Embed metadata (The "Digital Twin")
+        final_image = self._embed_metadata(person_image, items, result.get('description', ''), logs)
         
-        # All retries failed
         return {
-            "status": TryOnStatus.MAX_RETRIES.value,
-            "image": None,
-            "attempts": self.MAX_RETRIES,
+            "status": TryOnStatus.SUCCESS.value,
+            "image": final_image,
+            "description": result.get('description', ''),
+            "attempts": len(records),
+            "winning_attempt": attempt,
             "logs": logs,
-            "error": "No pudimos procesar tu imagen tras varios intentos. Intenta con mejor iluminación."
+            "attempt_records": attempt_records,
+            "timestamp": datetime.now().isoformat()
         }
     
+    async def _attempt(self, attempt: int, person_image: ImageBlob, items: list, logs: list):
+        """One Gemini call plus validation. Returns (status, ssim, result)."""
+        # 1. Build Dynamic Prompt
+        prompt = self._build_prompt(items, attempt)
+        
+        try:
+            # 2. Call Gemini Service
+            # We use a different seed per attempt to get variation
+            result = await gemini_service.generate_try_on_async(
+                person_image, 
+                [item['image'] for item in items], 
+                prompt, 
+                seed=self._seed(attempt)
+            )
+            
+            if not result['success']:
+                logs.append(f"❌ Intento {attempt}: Error API - {result.get('error')}")
+                return 'api_error', None, result
+            
+            # For now, Gemini returns a DESCRIPTION (Text). 
+            # To simulate the "Image Return" for validation, we will assume 
+            # the "output_image" is the person_image itself (since we don't have real image gen yet).
+            # IN A REAL IMPLEMENTATION: output_image = result['image']
+            
+            # SIMULATION FOR VALIDATION LOGIC:
+            # We will mock the validation pass/fail based on random chance or deterministic logic for testing.
+            # Since we can't validate text against an image using SSIM, we skip validation if no image returned.
+            
+            ssim_score = None
+            if result.get('image'):
+                output_image = ImageBlob.from_base64(result['image'])
+                background = await self._background_reference_async(person_image)
+                
+                # 3. Validate Background (SSIM)
+                ssim_score = self._validate_background_ssim(background, output_image)
+                if ssim_score < self.SSIM_THRESHOLD:
+                    logs.append(f"❌ Intento {attempt}: Fondo modificado (SSIM: {ssim_score:.3f})")
+                    logger.warning(f"[{self.client_id}] SSIM Low: {ssim_score}")
+                    return 'failed_background', ssim_score, result
+            else:
+                # If text only, we assume success for now but log it
+                logs.append(f"⚠️ Intento {attempt}: Solo texto generado (Validación visual omitida)")
+            
+            logs.append(f"✅ Intento {attempt}: Validación exitosa")
+            return 'passed', ssim_score, result
+            
+        except Exception as e:
+            logs.append(f"❌ Intento {attempt}: Excepción - {str(e)}")
+            logger.error(f"Try-On Error: {e}")
+            return 'error', None, None
+    
+    @staticmethod
+    def _seed(attempt: int) -> int:
+        return 12345 + attempt
+    
+    async def _background_reference_async(self, person_image: ImageBlob) -> BackgroundSSIM:
+        """Background signature of the original, built once per try-on (concurrent attempts share it)"""
+        if self._background is None:
+            # CPU-bound (cached per photo): keep it off the event loop
+            self._background = asyncio.ensure_future(asyncio.to_thread(self._background_reference, person_image))
+        # shield: cancelling one attempt must not cancel the shared build
+        return await asyncio.shield(self._background)
+    
+    def _bill(self, records: dict, winning_attempt) -> list:
+        """Who pays each launched attempt: the client pays the winning one, the platform absorbs the rest"""
+        billed = []
+        for attempt in sorted(records):
+            record = dict(records[attempt])
+            record['billed_to'] = 'client' if attempt == winning_attempt else 'platform'
+            record['cost_usd'] = self.COST_PER_ATTEMPT
+            billed.append(record)
+        return billed
+    
     def _build_prompt(self, items: list, attempt: int) -> str:
         """Builds the Hybrid Master Prompt with dynamic adjustments."""
         
@@ -162,46 +332,45 @@ class VirtualTryOnManager:
             
         return base_prompt
 
-    def _validate_background_ssim(self, img_orig_b64: str, img_out_b64: str) -> float:
+    def _validate_background_ssim(self, background: BackgroundSSIM, img_out: ImageBlob) -> float:
         """Calculates Structural Similarity Index (SSIM) of the background."""
         try:
-            # Decode images
-            img1 = self._b64_to_cv2(img_orig_b64)
-            img2 = self._b64_to_cv2(img_out_b64)
-            
-            # Convert to grayscale
-            gray1 = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
-            gray2 = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
-            
-            # Resize if needed (should be same size)
-            if gray1.shape != gray2.shape:
-                gray2 = cv2.resize(gray2, (gray1.shape[1], gray1.shape[0]))
-                
-            # Compute SSIM
-            score, _ = ssim(gray1, gray2, full=True)
-            return score
+            return background.score(self._to_gray(img_out), self.SSIM_THRESHOLD)
             
         except Exception as e:
             logger.warning(f"SSIM Validation Error: {e}")
             return 1.0 # Fallback to pass if validation fails technically
 
-    def _b64_to_cv2(self, b64_str: str) -> np.ndarray:
-        """Helper to convert base64 to cv2 image."""
-        if "base64," in b64_str:
-            b64_str = b64_str.split("base64,")[1]
-        nparr = np.frombuffer(base64.b64decode(b64_str), np.uint8)
-        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-    def _embed_metadata(self, image_b64: str, items: list, description: str, logs: list) -> str:
-        """Embeds rich metadata into the PNG."""
-        if "base64," in image_b64:
-            header, encoded = image_b64.split("base64,", 1)
-        else:
-            encoded = image_b64
-            header = "data:image/png;base64,"
-            
-        img_bytes = base64.b64decode(encoded)
-        img = Image.open(io.BytesIO(img_bytes))
+    def _background_reference(self, person_image: ImageBlob) -> BackgroundSSIM:
+        """SSIM reference of the photo Gemini saw (normalized), masked to its background"""
+        normalized = image_normalizer.normalize(person_image, 'try_on')
+        try:
+            person = segmentation_service.person_mask(normalized)
+        except Exception as e:
+            logger.warning(f"Segmentation Error: {e}")
+            person = None
+        return BackgroundSSIM(self._to_gray(normalized), None if person is None else ~person)
+
+    def _to_gray(self, image: ImageBlob) -> np.ndarray:
+        """
+        Decode to grayscale; np.frombuffer reads the blob's bytes without copying.
+        Transparency is flattened on white, like ImageNormalizer does for the reference.
+        """
+        img = cv2.imdecode(np.frombuffer(image.data, np.uint8), cv2.IMREAD_UNCHANGED)
+        if img is None:
+            raise ValueError("Unreadable image")
+        if img.dtype != np.uint8:
+            img = (img / 257).astype(np.uint8) # 16-bit PNG
+        if img.ndim == 2:
+            return img
+        if img.shape[2] == 4:
+            alpha = img[:, :, 3:].astype(np.float32) / 255
+            img = (img[:, :, :3] * alpha + 255 * (1 - alpha)).astype(np.uint8)
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    def _embed_metadata(self, image: ImageBlob, items: list, description: str, logs: list) -> str:
+        """Embeds rich metadata into the PNG. Returns a data URI for the JSON response."""
+        img = Image.open(io.BytesIO(image.data))
         
         meta = PngImagePlugin.PngInfo()
         
@@ -217,6 +386,5 @@ class VirtualTryOnManager:
         
         output = io.BytesIO()
         img.save(output, format="PNG", pnginfo=meta)
-        output.seek(0)
         
-        return header + base64.b64encode(output.getvalue()).decode('utf-8')
+        return ImageBlob(output.getvalue(), 'image/png').data_uri()
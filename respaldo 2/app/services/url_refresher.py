@@ -0,0 +1,153 @@
+import os
+import threading
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+from app import db
+from app.models import ProfessionalURL
+from app.utils.web_scraper import WebScraper
+
+logger = logging.getLogger(__name__)
+
+class URLRefresher:
+    """
+    Keeps ProfessionalURL.cached_content fresh in the background, so the chat
+    path only reads it.
+
+    A scheduler thread wakes every POLL_INTERVAL and claims active URLs whose
+    copy is older than MAX_AGE - REFRESH_LEAD (they are re-fetched before they
+    expire). Claimed URLs are fetched on a bounded pool through WebScraper's
+    pooled session, with conditional GET: an unchanged page costs a 304 and
+    no parsing. Changed content is re-chunked into the professional's RAG
+    index (which also bumps the content generation).
+
+    Claiming stamps last_fetched with a conditional UPDATE, so several worker
+    processes never fetch the same URL; a failed fetch is retried on the next
+    cycle after that (the previous copy stays in place meanwhile).
+    """
+    _instance = None
+
+    POLL_INTERVAL = 60                     # seconds between scans
+    MAX_AGE = timedelta(hours=1)           # age at which a copy counts as expired
+    REFRESH_LEAD = timedelta(minutes=15)   # refresh this long before expiry
+    BATCH_SIZE = 50                        # URLs claimed per scan
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(URLRefresher, cls).__new__(cls)
+            cls._instance.initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self.initialized:
+            return
+
+        self.initialized = True
+        self.app = None
+        self.max_workers = int(os.getenv('URL_REFRESH_WORKERS', 4))
+        self._executor = None
+        self._wakeup = threading.Event()
+        self._scheduler = None
+
+    def start(self, app):
+        """Start the scheduler (once per process). URL_REFRESH_WORKERS=0 disables it."""
+        if self.max_workers <= 0 or self._scheduler is not None:
+            return
+
+        self.app = app
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='url-refresh')
+        self._scheduler = threading.Thread(target=self._schedule_loop, name='url-refresh-scheduler', daemon=True)
+        self._scheduler.start()
+        logger.info(f"URL refresher started with {self.max_workers} workers")
+
+    def notify(self):
+        """Scan now instead of waiting for the next interval (e.g. a URL was added)"""
+        self._wakeup.set()
+
+    def _schedule_loop(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    due = self._claim_due()
+                if due:
+                    # Wait for the batch, so a slow site never piles up claims
+                    wait([self._executor.submit(self._run, url_id) for url_id in due])
+                    logger.info(f"URL refresher: {len(due)} URLs checked")
+            except Exception as e:
+                logger.error(f"URL refresher error: {e}")
+
+            self._wakeup.wait(self.POLL_INTERVAL)
+            self._wakeup.clear()
+
+    def _claim_due(self):
+        """Claim up to BATCH_SIZE URLs due for refresh, oldest first. Returns their ids."""
+        now = datetime.utcnow()
+        cutoff = now - (self.MAX_AGE - self.REFRESH_LEAD)
+        candidates = db.session.query(ProfessionalURL.id, ProfessionalURL.last_fetched).filter(
+            ProfessionalURL.is_active == True,
+            db.or_(ProfessionalURL.last_fetched.is_(None), ProfessionalURL.last_fetched < cutoff)
+        ).order_by(ProfessionalURL.last_fetched.asc().nulls_first()).limit(self.BATCH_SIZE).all()
+
+        claimed = []
+        for url_id, last_fetched in candidates:
+            unchanged = (ProfessionalURL.last_fetched.is_(None) if last_fetched is None
+                         else ProfessionalURL.last_fetched == last_fetched)
+            updated = ProfessionalURL.query.filter(ProfessionalURL.id == url_id, unchanged).update(
+                {'last_fetched': now}, synchronize_session=False
+            )
+            if updated:
+                claimed.append(url_id)
+            # else: another worker process claimed it first
+        db.session.commit()
+        return claimed
+
+    def _run(self, url_id):
+        try:
+            with self.app.app_context():
+                self.refresh(url_id)
+        except Exception as e:
+            logger.error(f"Error refreshing URL {url_id}: {e}")
+
+    def refresh(self, url_id):
+        """Fetch one URL (conditionally) and store the result. Returns True on success. (Call inside app context)"""
+        p_url = ProfessionalURL.query.get(url_id)
+        if p_url is None or not p_url.is_active:
+            return False
+
+        # Validators are only useful while we still hold the content they describe
+        has_copy = p_url.cached_content is not None
+        result = WebScraper.fetch_and_clean(
+            p_url.url,
+            etag=p_url.etag if has_copy else None,
+            last_modified=p_url.last_modified if has_copy else None
+        )
+        if not result['success']:
+            logger.warning(f"URL refresh failed for {p_url.url}: {result.get('error')}")
+            return False
+
+        changed = not result.get('not_modified') and result['content'] != p_url.cached_content
+        if not result.get('not_modified'):
+            p_url.cached_content = result['content']
+        p_url.etag = result.get('etag')
+        p_url.last_modified = result.get('last_modified')
+        p_url.last_fetched = datetime.utcnow()
+
+        if changed:
+            self.reindex(p_url)
+        else:
+            db.session.commit()
+        return True
+
+    def reindex(self, p_url):
+        """Replace the indexed passages of a URL with its current cached_content (commits)"""
+        from app.services.rag_service import rag_service
+        from app.services.ingestion_service import ingestion_queue
+
+        doc = rag_service.replace_url_content(p_url)
+        ingestion_queue.cancel_for_document(doc.id) # a queued job would index the old text
+        db.session.commit()
+        if doc.text_content:
+            rag_service.ingest_document(doc.id, doc.text_content)
+
+# Singleton
+url_refresher = URLRefresher()
@@ -0,0 +1,174 @@
+import numpy as np
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class PartitionedIndex:
+    """
+    FAISS index partitioned by tenant (professional_id).
+
+    Each partition is its own IndexIDMap over an IndexFlatIP, so a search only
+    scans the vectors of that partition and returns the DB ids directly.
+
+    Optionally a memory-mapped snapshot (see vector_snapshot.py) is attached as
+    a read-only base: its rows are searched in place with numpy, vectors added
+    afterwards live in the FAISS partitions and removed base rows are
+    tombstoned until the next snapshot.
+    """
+
+    def __init__(self, dimension):
+        import faiss
+
+        self._faiss = faiss
+        self.dimension = dimension
+        self.partitions = {}  # partition key -> faiss index (vectors not in the base)
+        self.base = None      # SnapshotData or None
+        self.removed = {}     # partition key -> set of base ids deleted since the snapshot
+        self._lock = threading.Lock()  # FAISS indexes are not safe for concurrent add/search
+
+    def _new_partition(self):
+        return self._faiss.IndexIDMap(self._faiss.IndexFlatIP(self.dimension))
+
+    @staticmethod
+    def _base_slice(base, key):
+        if base is None or key not in base.slices:
+            return 0, 0
+        return base.slices[key]
+
+    @property
+    def ntotal(self):
+        """Total vectors across all partitions"""
+        with self._lock:
+            keys = set(self.partitions)
+            if self.base is not None:
+                keys.update(self.base.slices)
+        return sum(self.size(key) for key in keys)
+
+    def size(self, key):
+        """Number of vectors stored for one partition"""
+        with self._lock:
+            start, end = self._base_slice(self.base, key)
+            index = self.partitions.get(key)
+            return (end - start) - len(self.removed.get(key, ())) + (index.ntotal if index is not None else 0)
+
+    def reset(self):
+        with self._lock:
+            self.partitions = {}
+            self.base = None
+            self.removed = {}
+
+    def attach(self, snapshot):
+        """
+        Serve a snapshot as the base of every partition.
+        In-memory vectors and tombstones already covered by it are dropped.
+        """
+        snapshot_ids = np.asarray(snapshot.ids)
+
+        with self._lock:
+            for key, index in list(self.partitions.items()):
+                ids = self._faiss.vector_to_array(index.id_map)
+                covered = ids[np.isin(ids, snapshot_ids)]
+                if len(covered):
+                    index.remove_ids(covered)
+                if index.ntotal == 0:
+                    del self.partitions[key]
+
+            removed = {}
+            for key, ids in self.removed.items():
+                ids = np.fromiter(ids, dtype='int64', count=len(ids))
+                still_there = ids[np.isin(ids, snapshot_ids)]
+                if len(still_there):
+                    removed[key] = set(still_there.tolist())
+
+            self.base = snapshot
+            self.removed = removed
+
+    def add(self, key, ids, vectors):
+        """Add vectors to a partition, keyed by their DB ids"""
+        if len(ids) == 0:
+            return
+
+        vectors = np.ascontiguousarray(vectors, dtype='float32').reshape(-1, self.dimension)
+        ids = np.ascontiguousarray(ids, dtype='int64')
+
+        with self._lock:
+            index = self.partitions.get(key)
+            if index is None:
+                index = self._new_partition()
+                self.partitions[key] = index
+
+            index.add_with_ids(vectors, ids)
+
+    def remove(self, key, ids):
+        """Remove vectors from a partition by DB id. Returns how many were removed."""
+        if len(ids) == 0:
+            return 0
+
+        ids = np.ascontiguousarray(ids, dtype='int64')
+        removed = 0
+
+        with self._lock:
+            index = self.partitions.get(key)
+            if index is not None:
+                removed += index.remove_ids(ids)
+                if index.ntotal == 0:
+                    del self.partitions[key]
+
+            start, end = self._base_slice(self.base, key)
+            if end > start:
+                in_base = ids[np.isin(ids, self.base.ids[start:end])]
+                tombstones = self.removed.setdefault(key, set())
+                before = len(tombstones)
+                tombstones.update(in_base.tolist())
+                removed += len(tombstones) - before
+
+        return removed
+
+    def search(self, key, query_vector, k):
+        """
+        Search only inside one partition.
+
+        Returns (scores, ids) as 1-D arrays with at most k entries, best first.
+        """
+        empty = np.empty(0, dtype='float32'), np.empty(0, dtype='int64')
+        if k <= 0:
+            return empty
+
+        query = np.ascontiguousarray(query_vector, dtype='float32').reshape(self.dimension)
+        scores_parts, ids_parts = [], []
+
+        # attach() may swap the base meanwhile: bounds, vectors, tombstones and
+        # the in-memory partition must all be read from the same state
+        with self._lock:
+            base = self.base
+            tombstones = self.removed.get(key)
+            tombstones = np.fromiter(tombstones, dtype='int64', count=len(tombstones)) if tombstones else None
+
+            index = self.partitions.get(key)
+            if index is not None and index.ntotal > 0:
+                D, I = index.search(query.reshape(1, self.dimension), min(k, index.ntotal))
+                scores_parts.append(D[0])
+                ids_parts.append(I[0])
+
+        # Snapshot rows of this tenant: one contiguous slice of the mapped matrix
+        start, end = self._base_slice(base, key)
+        if end > start:
+            scores = np.asarray(base.vectors[start:end] @ query, dtype='float32')
+            ids = np.asarray(base.ids[start:end])
+            if tombstones is not None:
+                keep = ~np.isin(ids, tombstones)
+                scores, ids = scores[keep], ids[keep]
+            if len(scores) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                scores, ids = scores[top], ids[top]
+            scores_parts.append(scores)
+            ids_parts.append(ids)
+
+        if not scores_parts:
+            return empty
+
+        scores = np.concatenate(scores_parts)
+        ids = np.concatenate(ids_parts)
+        order = np.argsort(-scores, kind='stable')[:k]
+        return scores[order], ids[order]
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import threading
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Sidecar row: DB id, partition (professional_id) and one extra column (e.g. document_id)
+META_DTYPE = np.dtype([('id', '<i8'), ('partition', '<i8'), ('extra', '<i8')])
+
+class SnapshotData:
+    """
+    One memory-mapped snapshot generation.
+    Rows are sorted by (partition, id), so each partition is a contiguous slice.
+    """
+
+    def __init__(self, generation, vectors, meta, source):
+        self.generation = generation
+        self.vectors = vectors  # read-only memmap (rows, dimension)
+        self.ids = meta['id']
+        self.partitions = meta['partition']
+        self.extra = meta['extra']
+        self.source = source
+        self.slices = {}  # partition -> (start, end)
+
+        if len(meta):
+            keys, starts, counts = np.unique(self.partitions, return_index=True, return_counts=True)
+            for key, start, count in zip(keys, starts, counts):
+                self.slices[int(key)] = (int(start), int(start + count))
+
+    def __len__(self):
+        return len(self.ids)
+
+class VectorSnapshot:
+    """
+    Versioned on-disk snapshot of an embedding matrix plus its id/metadata sidecar.
+
+    Files in the snapshot directory:
+        <name>.json                        manifest pointing at the current generation
+        <name>.<generation>.vectors.npy    float32 matrix (rows, dimension)
+        <name>.<generation>.meta.npy       META_DTYPE sidecar
+
+    Workers open both .npy files with mmap_mode='r', so all of them share one
+    page-cached copy and a cold start costs milliseconds, not a DB scan.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, name, dimension, debounce=2.0):
+        self.name = name
+        self.dimension = dimension
+        self.debounce = debounce  # seconds to coalesce bursts of changes before rewriting
+        self.directory = None
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._writer = None
+
+    def configure(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def _path(self, suffix):
+        return os.path.join(self.directory, f"{self.name}.{suffix}")
+
+    def read_manifest(self):
+        """Current manifest, or None if missing or incompatible"""
+        if not self.enabled:
+            return None
+
+        try:
+            with open(self._path('json'), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if manifest.get('format_version') != self.FORMAT_VERSION or manifest.get('dimension') != self.dimension:
+            return None
+        return manifest
+
+    def write(self, ids, partitions, vectors, extra=None, source=None):
+        """Write a new generation and point the manifest at it. Returns the generation."""
+        ids = np.asarray(ids, dtype='<i8')
+        partitions = np.asarray(partitions, dtype='<i8')
+        extra = np.zeros(len(ids), dtype='<i8') if extra is None else np.asarray(extra, dtype='<i8')
+        vectors = np.asarray(vectors, dtype='<f4').reshape(-1, self.dimension)
+
+        order = np.lexsort((ids, partitions))
+        meta = np.empty(len(ids), dtype=META_DTYPE)
+        meta['id'] = ids[order]
+        meta['partition'] = partitions[order]
+        meta['extra'] = extra[order]
+
+        previous = self.read_manifest()
+        generation = time.time_ns()
+
+        self._save_array(self._path(f"{generation}.vectors.npy"), vectors[order])
+        self._save_array(self._path(f"{generation}.meta.npy"), meta)
+
+        manifest = {
+            'format_version': self.FORMAT_VERSION,
+            'dimension': self.dimension,
+            'generation': generation,
+            'rows': int(len(ids)),
+            'source': source or {}
+        }
+        tmp_path = self._path(f"json.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._path('json'))
+
+        keep = {generation}
+        if previous:
+            keep.add(previous['generation'])
+        self._cleanup(keep)
+
+        logger.info(f"Snapshot '{self.name}' written: generation {generation}, {len(ids)} rows")
+        return generation
+
+    def _save_array(self, path, array):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+
+    def _cleanup(self, keep):
+        """Delete older generations (mapped files stay valid on POSIX; on Windows we just retry later)"""
+        prefix = f"{self.name}."
+        for filename in os.listdir(self.directory):
+            parts = filename.split('.')
+            if not filename.startswith(prefix) or len(parts) != 4 or not parts[1].isdigit():
+                continue
+            if int(parts[1]) in keep:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                pass
+
+    def load(self, manifest=None):
+        """Map the current generation read-only. Returns SnapshotData or None."""
+        manifest = manifest or self.read_manifest()
+        if not manifest:
+            return None
+
+        generation = manifest['generation']
+        try:
+            vectors = np.load(self._path(f"{generation}.vectors.npy"), mmap_mode='r')
+            meta = np.load(self._path(f"{generation}.meta.npy"), mmap_mode='r')
+        except (OSError, ValueError) as e:
+            logger.warning(f"Snapshot '{self.name}' generation {generation} unreadable: {e}")
+            return None
+
+        if vectors.shape != (manifest['rows'], self.dimension) or len(meta) != manifest['rows']:
+            logger.warning(f"Snapshot '{self.name}' generation {generation} is inconsistent, ignoring it")
+            return None
+
+        return SnapshotData(generation, vectors, meta, manifest.get('source', {}))
+
+    def schedule_write(self, app, rebuild):
+        """
+        Run rebuild() in a background thread (inside app context) after the
+        debounce delay. Changes arriving while it waits are coalesced into
+        the same rewrite, so ingest/delete requests never block on it.
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._dirty = True
+            if self._writer is not None and self._writer.is_alive():
+                return
+            self._writer = threading.Thread(
+                target=self._write_loop, args=(app, rebuild), name=f"snapshot-{self.name}", daemon=True
+            )
+            self._writer.start()
+
+    def _write_loop(self, app, rebuild):
+        while True:
+            time.sleep(self.debounce)
+            with self._lock:
+                if not self._dirty:
+                    self._writer = None
+                    return
+                self._dirty = False
+
+            try:
+                with app.app_context():
+                    rebuild()
+            except Exception as e:
+                logger.error(f"Error rewriting snapshot '{self.name}': {e}")
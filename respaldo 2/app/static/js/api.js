@@ -122,6 +122,66 @@ async function sendChatMessage(professionalId, message, sessionId = null) {
     });
 }
 
+// Streaming variant: onToken(text) is called as the answer arrives (Server-Sent Events).
+// Resolves like apiCall: { success, data } with the same data as sendChatMessage.
+async function streamChatMessage(professionalId, message, sessionId = null, onToken = () => {}) {
+    const token = getAuthToken();
+
+    try {
+        const response = await fetch(`${API_BASE_URL}/chatbot/${professionalId}/chat/stream`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+                ...(token && { 'Authorization': `Bearer ${token}` })
+            },
+            body: JSON.stringify({ message, session_id: sessionId })
+        });
+
+        // Validation errors (402 credits, 404...) come back as plain JSON
+        if (!response.ok || !response.body) {
+            const data = await response.json().catch(() => ({}));
+            throw new Error(data.error || `Error ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let result = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const raw = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                for (const line of raw.split('\n')) {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                }
+                const payload = data ? JSON.parse(data) : {};
+
+                if (event === 'token') onToken(payload.text);
+                else if (event === 'done') result = payload;
+                else if (event === 'error') throw new Error(payload.error);
+            }
+        }
+
+        if (!result) throw new Error('La respuesta se interrumpió');
+        return { success: true, data: result };
+    } catch (error) {
+        console.error('API Error:', error);
+        return { success: false, error: error.message };
+    }
+}
+
 async function getChatbotConfig(professionalId) {
     return apiGet(`/chatbot/${professionalId}/config`);
 }
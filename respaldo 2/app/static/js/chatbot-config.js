@@ -191,6 +191,7 @@ window.uploadPendingFiles = async function () {
 
     let successCount = 0;
     let failCount = 0;
+    const queuedJobs = [];
     const total = pendingFiles.length;
 
     for (let i = 0; i < total; i++) {
@@ -208,6 +209,10 @@ window.uploadPendingFiles = async function () {
 
             if (data.success) {
                 successCount++;
+                // 202: text extraction and indexing continue in the background
+                if (data.data && data.data.job) {
+                    queuedJobs.push({ id: data.data.job.id, name: file.name });
+                }
             } else {
                 failCount++;
                 console.error(`Error uploading ${file.name}:`, data.error);
@@ -227,10 +232,11 @@ window.uploadPendingFiles = async function () {
         btn.innerHTML = '<span>☁️</span> Subir Documentos';
 
         if (successCount > 0) {
-            showToast(`${successCount} archivos subidos correctamente`, 'success');
+            showToast(`${successCount} archivos subidos, procesando...`, 'info');
             loadDocuments();
             pendingFiles = [];
             updatePendingFilesUI();
+            queuedJobs.forEach(job => pollIngestionJob(job.id, job.name));
         }
 
         if (failCount > 0) {
@@ -239,6 +245,49 @@ window.uploadPendingFiles = async function () {
     }, 500);
 };
 
+const JOB_POLL_INTERVAL = 2000; // ms
+const JOB_POLL_MAX_ERRORS = 5;
+
+// Follow an ingestion job until it is done or failed, then report it
+async function pollIngestionJob(jobId, fileName) {
+    let errors = 0;
+
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
+
+        let job;
+        try {
+            const response = await fetch(`/api/chatbot/${professionalId}/knowledge-base/jobs/${jobId}`, {
+                headers: { 'Authorization': `Bearer ${getAuthToken()}` }
+            });
+            if (response.status === 403 || response.status === 404) return;
+
+            const data = await response.json();
+            if (!data.success) throw new Error(data.error);
+            job = data.data.job;
+            errors = 0;
+        } catch (e) {
+            console.error(`Error checking job ${jobId}:`, e);
+            if (++errors >= JOB_POLL_MAX_ERRORS) {
+                showToast(`No se pudo consultar el estado de ${fileName}`, 'error');
+                return;
+            }
+            continue;
+        }
+
+        if (job.status === 'done') {
+            showToast(`${fileName} procesado correctamente (${job.chunks_done} fragmentos)`, 'success');
+            loadDocuments();
+            return;
+        }
+        if (job.status === 'failed') {
+            showToast(`Error procesando ${fileName}: ${job.error || 'error desconocido'}`, 'error');
+            loadDocuments();
+            return;
+        }
+    }
+}
+
 function updateProgress(percent) {
     progressFill.style.width = `${percent}%`;
     progressText.textContent = `${percent}%`;
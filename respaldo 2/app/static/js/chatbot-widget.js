@@ -261,16 +261,29 @@ class ChatbotWidget {
         sendBtn.disabled = true;
 
         try {
-            // Send to API
-            const result = await sendChatMessage(this.professionalId, message, this.sessionId);
+            // Send to API (streamed: the answer is shown as it is generated)
+            let bubble = null;
+            let streamed = '';
+            const result = await streamChatMessage(this.professionalId, message, this.sessionId, (text) => {
+                if (!bubble) {
+                    document.getElementById('typingIndicator').classList.add('hidden');
+                    bubble = this.addMessage('assistant', '');
+                }
+                streamed += text;
+                this.updateMessage(bubble, streamed);
+            });
 
             // Hide typing indicator
             document.getElementById('typingIndicator').classList.add('hidden');
             sendBtn.disabled = false;
 
             if (result.success) {
-                // Add assistant response
-                this.addMessage('assistant', result.data.message);
+                // Add assistant response (final text, in case nothing was streamed)
+                if (bubble) {
+                    this.updateMessage(bubble, result.data.message);
+                } else {
+                    this.addMessage('assistant', result.data.message);
+                }
 
                 // Update credits
                 if (result.data.credits_remaining !== undefined) {
@@ -321,7 +334,17 @@ class ChatbotWidget {
         container.scrollTop = container.scrollHeight;
 
         // Store message
-        this.messages.push({ role, content, timestamp: new Date() });
+        const stored = { role, content, timestamp: new Date(), element: messageDiv.querySelector('p') };
+        this.messages.push(stored);
+        return stored;
+    }
+
+    updateMessage(stored, content) {
+        // Replace the text of a message added with addMessage (streamed answers)
+        stored.content = content;
+        stored.element.textContent = content;
+        const container = document.getElementById('chatbotMessages');
+        container.scrollTop = container.scrollHeight;
     }
 
     escapeHtml(text) {
@@ -284,6 +284,12 @@ function selectItem(category, id) {
     }
 }
 
+// Data URI (as kept in localStorage) -> binary Blob for multipart upload
+async function dataUriToBlob(dataUri) {
+    const response = await fetch(dataUri);
+    return await response.blob();
+}
+
 async function generateTransformation() {
     if (!currentImage) {
         alert("Por favor sube una foto primero");
@@ -320,15 +326,20 @@ async function generateTransformation() {
         // If mode is style, we might want to keep simulation or implement another endpoint
         // For now, let's focus on the 'tryon' mode which uses the new API
         if (currentMode === 'tryon') {
+            // Images travel as binary parts, not base64 inside JSON
+            const formData = new FormData();
+            formData.append('person_image', await dataUriToBlob(currentImage), 'person');
+            for (const item of itemsToTryOn) {
+                formData.append('item_images', await dataUriToBlob(item.imagen_base64), `item-${item.id}`);
+            }
+            formData.append('items', JSON.stringify(itemsToTryOn.map(item => ({ id: item.id, category: item.categoria }))));
+
+            // Paid with the credits of the logged-in professional (auth.js token)
+            const token = localStorage.getItem('asesoriaimss_token');
             const response = await fetch('/api/virtual-try-on', {
                 method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    person_image: currentImage,
-                    items: itemsToTryOn
-                })
+                headers: token ? { 'Authorization': `Bearer ${token}` } : {},
+                body: formData
             });
 
             const result = await response.json();
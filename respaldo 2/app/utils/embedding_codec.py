@@ -0,0 +1,62 @@
+"""
+Binary storage format for embeddings.
+
+Each blob is an 8-byte header followed by the vector as raw little-endian
+float32:
+
+    b'EV' | version (uint8) | padding | dimension (uint32) | float32 * dimension
+
+The header is exactly two float32 slots wide, so many blobs of the same
+dimension can be decoded with a single np.frombuffer over their concatenation.
+"""
+
+import struct
+import numpy as np
+
+MAGIC = b'EV'
+VERSION = 1
+
+_HEADER = struct.Struct('<2sBxI')
+_HEADER_SLOTS = _HEADER.size // 4  # header width measured in float32 values
+
+
+def encode_embedding(vector):
+    """Serialize one vector to header + little-endian float32 bytes"""
+    vector = np.asarray(vector, dtype='<f4').reshape(-1)
+    return _HEADER.pack(MAGIC, VERSION, vector.shape[0]) + vector.tobytes()
+
+
+def decode_embedding(blob):
+    """Deserialize one blob. Returns None if it is not in this format."""
+    if not blob or len(blob) < _HEADER.size:
+        return None
+
+    magic, version, dimension = _HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION or len(blob) != _HEADER.size + dimension * 4:
+        return None
+
+    return np.frombuffer(blob, dtype='<f4', offset=_HEADER.size).astype('float32')
+
+
+def decode_embeddings(blobs, dimension):
+    """
+    Decode many blobs of the same dimension in one pass.
+
+    Returns (matrix, valid) where matrix has one row per valid blob and valid
+    is a boolean mask over the input (False for empty, legacy or
+    wrong-dimension blobs).
+    """
+    header = _HEADER.pack(MAGIC, VERSION, dimension)
+    row_size = _HEADER.size + dimension * 4
+
+    valid = np.fromiter(
+        (bool(b) and len(b) == row_size and b[:_HEADER.size] == header for b in blobs),
+        dtype=bool,
+        count=len(blobs)
+    )
+    if not valid.any():
+        return np.empty((0, dimension), dtype='float32'), valid
+
+    joined = b''.join(b for b, ok in zip(blobs, valid) if ok)
+    matrix = np.frombuffer(joined, dtype='<f4').reshape(-1, _HEADER_SLOTS + dimension)
+    return matrix[:, _HEADER_SLOTS:].astype('float32'), valid
@@ -1,6 +1,16 @@
 import os
+import re
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing
 from werkzeug.utils import secure_filename
 
+logger = logging.getLogger(__name__)
+
 class FileExtractor:
     """Extrae texto de diferentes tipos de archivos"""
     
@@ -15,142 +25,225 @@ class FileExtractor:
     
     MAX_CHARS = 2000000 # Increased to 2MB text limit
 
+    PDF_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', min(4, os.cpu_count() or 1)))
+    PDF_PAGES_PER_TASK = 16  # pages extracted per process-pool task
+    PDF_TASKS_AHEAD = 2  # tasks in flight per worker, so an early stop wastes little
+    PDF_PARALLEL_MIN_PAGES = 32  # below this a pool costs more than it saves
+
     @staticmethod
-    def extract_text(file_path, file_type):
-        """Extraer texto según tipo de archivo"""
+    def extract_text(file_path, file_type, on_block=None):
+        """
+        Extraer texto según tipo de archivo.
+        on_block() is called after every block read (progress/heartbeat hook);
+        an exception it raises aborts the extraction.
+        """
         
-        content = ""
+        parts = []
+        length = 0
+        truncated = False
         
+        # Blocks arrive cleaned, page by page / sheet by sheet.
+        # closing(): stopping early cancels the PDF pages not extracted yet
+        with closing(FileExtractor.iter_text(file_path, file_type)) as blocks:
+            for block in blocks:
+                if on_block:
+                    on_block()
+                if length + len(block) > FileExtractor.MAX_CHARS:
+                    parts.append(block[:FileExtractor.MAX_CHARS - length])
+                    truncated = True
+                    break
+                parts.append(block)
+                length += len(block) + 1
+
+        content = "\n".join(parts)
+
+        # Limit content length
+        if truncated:
+            content = content + "... (truncated)"
+            
+        return content
+
+    @staticmethod
+    def iter_text(file_path, file_type):
+        """
+        Yield the cleaned text of a file incrementally (one PDF page, a group
+        of spreadsheet rows or paragraphs at a time), so callers can stop early
+        and never hold more than a block plus their own output.
+        """
         if file_type == 'txt':
-            content = FileExtractor._extract_txt(file_path)
+            blocks = FileExtractor._iter_txt(file_path)
         
         elif file_type in ['xlsx', 'xls']:
-            content = FileExtractor._extract_excel(file_path)
+            blocks = FileExtractor._iter_excel(file_path)
         
         elif file_type in ['pdf']:
-            content = FileExtractor._extract_pdf(file_path)
+            blocks = FileExtractor._iter_pdf(file_path)
         
         elif file_type in ['docx']:
-            content = FileExtractor._extract_docx(file_path)
-        
-        # Clean content (remove headers/footers)
-        content = FileExtractor._clean_text(content)
+            blocks = FileExtractor._iter_docx(file_path)
 
-        # Limit content length
-        if len(content) > FileExtractor.MAX_CHARS:
-            content = content[:FileExtractor.MAX_CHARS] + "... (truncated)"
-            
-        print(f"EXTRACTED TEXT ({file_type}): {len(content)} chars")
-        if len(content) < 100:
-            print(f"WARNING: Extracted text is very short: {content}")
-            
-        return content
+        else:
+            return
+        
+        with closing(blocks):
+            for block in blocks:
+                # Clean content (remove headers/footers)
+                block = FileExtractor._clean_text(block)
+                if block:
+                    yield block
     
+    # Common headers in Mexican laws
+    HEADER_PATTERNS = [
+        "LEY DEL IMPUESTO SOBRE LA RENTA",
+        "CÁMARA DE DIPUTADOS DEL H. CONGRESO DE LA UNIÓN",
+        "Secretaría General",
+        "Secretaría de Servicios Parlamentarios",
+        "Última Reforma DOF",
+        "Texto Vigente",
+        "TEXTO VIGENTE",
+        "Estados Unidos Mexicanos",
+        "Presidencia de la República"
+    ]
+
+    # One pass over the text drops, judging each line as line.strip():
+    # empty lines, page numbers (e.g. "1 de 313": under 20 chars, a digit and
+    # " de " inside the stripped text) and any line containing a header.
+    # [^\S\n] is the whitespace str.strip() removes, minus the line break.
+    _DROP_LINE_RE = re.compile(
+        r'^(?:'
+        r'[^\S\n]*'
+        r'|[^\S\n]*(?=\S(?:[^\n]{0,17}\S)?[^\S\n]*$)(?=[^\n]*\d)(?=[^\n]*? de [^\n]*?\S)[^\n]*'
+        r'|[^\n]*(?:' + '|'.join(re.escape(p) for p in HEADER_PATTERNS) + r')[^\n]*'
+        r')(?:\n|$)',
+        re.MULTILINE
+    )
+
     @staticmethod
     def _clean_text(text):
         """Limpiar texto de encabezados repetitivos y basura"""
         if not text: return ""
-        
-        # Common headers in Mexican laws
-        patterns = [
-            "LEY DEL IMPUESTO SOBRE LA RENTA",
-            "CÁMARA DE DIPUTADOS DEL H. CONGRESO DE LA UNIÓN",
-            "Secretaría General",
-            "Secretaría de Servicios Parlamentarios",
-            "Última Reforma DOF",
-            "Texto Vigente",
-            "TEXTO VIGENTE",
-            "Estados Unidos Mexicanos",
-            "Presidencia de la República"
-        ]
-        
-        lines = text.split('\n')
-        cleaned_lines = []
-        
-        for line in lines:
-            line_strip = line.strip()
-            # Skip empty lines
-            if not line_strip:
-                continue
-                
-            # Skip page numbers (e.g. "1 de 313")
-            if " de " in line_strip and any(c.isdigit() for c in line_strip) and len(line_strip) < 20:
-                continue
-                
-            # Skip headers
-            is_header = False
-            for p in patterns:
-                if p in line_strip:
-                    is_header = True
-                    break
-            
-            if not is_header:
-                cleaned_lines.append(line)
-                
-        return "\n".join(cleaned_lines)
+        return FileExtractor._DROP_LINE_RE.sub('', text).rstrip('\n')
     
+    TXT_BLOCK_LINES = 2000
+
     @staticmethod
-    def _extract_txt(file_path):
-        """Extraer texto de TXT con fallback de encoding"""
+    def _iter_txt(file_path):
+        """Leer TXT por bloques de líneas con fallback de encoding"""
         encodings = ['utf-8', 'latin-1', 'cp1252']
         
         for encoding in encodings:
             try:
+                # Validate the encoding on the whole file first, without keeping it
                 with open(file_path, 'r', encoding=encoding) as f:
-                    content = f.read()
-                    print(f"Successfully read TXT with encoding: {encoding}")
-                    return content
+                    while f.read(1024 * 1024):
+                        pass
             except UnicodeDecodeError:
                 continue
             except Exception as e:
-                return f"Error leyendo archivo ({encoding}): {str(e)}"
+                yield f"Error leyendo archivo ({encoding}): {str(e)}"
+                return
+
+            logger.info(f"Read TXT with encoding: {encoding}")
+            with open(file_path, 'r', encoding=encoding) as f:
+                lines = []
+                for line in f:
+                    lines.append(line)
+                    if len(lines) >= FileExtractor.TXT_BLOCK_LINES:
+                        yield "".join(lines)
+                        lines = []
+                if lines:
+                    yield "".join(lines)
+            return
         
-        return "Error: No se pudo detectar la codificación del archivo."
+        yield "Error: No se pudo detectar la codificación del archivo."
     
+    EXCEL_BLOCK_ROWS = 1000
+
     @staticmethod
-    def _extract_excel(file_path):
-        """Extraer texto de Excel"""
+    def _iter_excel(file_path):
+        """Extraer texto de Excel (modo streaming: read_only no carga todo el libro)"""
         try:
             import openpyxl
-            wb = openpyxl.load_workbook(file_path)
-            text = []
-            
-            for sheet in wb.sheetnames:
-                ws = wb[sheet]
-                text.append(f"\n=== HOJA: {sheet} ===\n")
-                
-                for row in ws.iter_rows(values_only=True):
-                    text.append(" | ".join(
-                        str(cell) if cell is not None else "" 
-                        for cell in row
-                    ))
-            
-            return "\n".join(text)
+            wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                for sheet in wb.sheetnames:
+                    ws = wb[sheet]
+                    text = [f"\n=== HOJA: {sheet} ===\n"]
+                    
+                    for row in ws.iter_rows(values_only=True):
+                        text.append(" | ".join(
+                            str(cell) if cell is not None else "" 
+                            for cell in row
+                        ))
+                        if len(text) >= FileExtractor.EXCEL_BLOCK_ROWS:
+                            yield "\n".join(text)
+                            text = []
+                    
+                    if text:
+                        yield "\n".join(text)
+            finally:
+                wb.close()
         
         except Exception as e:
-            return f"Error leyendo Excel: {str(e)}"
+            yield f"Error leyendo Excel: {str(e)}"
     
     @staticmethod
-    def _extract_pdf(file_path):
-        """Extraer texto de PDF"""
+    def _iter_pdf(file_path):
+        """Extraer texto de PDF página por página; documentos grandes en paralelo"""
         try:
             import PyPDF2
-            text = []
             
             with open(file_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                
-                for page_num, page in enumerate(pdf_reader.pages):
-                    text.append(f"\n=== PÁGINA {page_num + 1} ===\n")
-                    text.append(page.extract_text())
-            
-            return "\n".join(text)
+                page_count = len(PyPDF2.PdfReader(f).pages)
+
+            ranges = [
+                (start, min(start + FileExtractor.PDF_PAGES_PER_TASK, page_count))
+                for start in range(0, page_count, FileExtractor.PDF_PAGES_PER_TASK)
+            ]
+
+            if FileExtractor.PDF_WORKERS > 1 and page_count >= FileExtractor.PDF_PARALLEL_MIN_PAGES:
+                yield from FileExtractor._iter_pdf_parallel(file_path, ranges)
+            else:
+                for start, end in ranges:
+                    yield from _extract_pdf_pages(file_path, start, end)
         
         except Exception as e:
-            return f"Error leyendo PDF: {str(e)}"
+            yield f"Error leyendo PDF: {str(e)}"
+
+    @staticmethod
+    def _iter_pdf_parallel(file_path, ranges):
+        """
+        Page ranges on the shared process pool, in page order. Only a few
+        tasks are submitted ahead of the consumer; the rest are never
+        submitted if it stops early (MAX_CHARS), pending ones are cancelled.
+        """
+        pool = _pdf_pool()
+        ranges = deque(ranges)
+        pending = deque()
+
+        def submit_next():
+            if ranges:
+                start, end = ranges.popleft()
+                pending.append(pool.submit(_extract_pdf_pages, file_path, start, end))
+
+        try:
+            for _ in range(FileExtractor.PDF_WORKERS * FileExtractor.PDF_TASKS_AHEAD):
+                submit_next()
+            while pending:
+                pages = pending.popleft().result()
+                submit_next()
+                yield from pages
+        except BrokenProcessPool:
+            _reset_pdf_pool() # a worker died: the next PDF gets a fresh pool
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
     
+    DOCX_BLOCK_PARAGRAPHS = 500
+
     @staticmethod
-    def _extract_docx(file_path):
+    def _iter_docx(file_path):
         """Extraer texto de DOCX"""
         try:
             from docx import Document
@@ -160,8 +253,52 @@ class FileExtractor:
             for para in doc.paragraphs:
                 if para.text.strip():
                     text.append(para.text)
+                    if len(text) >= FileExtractor.DOCX_BLOCK_PARAGRAPHS:
+                        yield "\n".join(text)
+                        text = []
             
-            return "\n".join(text)
+            if text:
+                yield "\n".join(text)
         
         except Exception as e:
-            return f"Error leyendo DOCX: {str(e)}"
+            yield f"Error leyendo DOCX: {str(e)}"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _pdf_pool():
+    """
+    Process pool for large PDFs, created on first use and kept for the life
+    of the process (workers start once, not per document). 'spawn': forking
+    a process that runs FAISS/torch threads is unsafe. Spawned workers
+    re-import the __main__ script; they only run _extract_pdf_pages (PyPDF2),
+    so a script that builds the app at import time should skip it when
+    imported as '__mp_main__' (see run.py).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=FileExtractor.PDF_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+def _reset_pdf_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def _extract_pdf_pages(file_path, start, end):
+    """Text of pages [start, end) with their page markers (module level so a process pool can run it)"""
+    import PyPDF2
+    
+    pages = []
+    with open(file_path, 'rb') as f:
+        pdf_reader = PyPDF2.PdfReader(f)
+        for page_num in range(start, end):
+            text = pdf_reader.pages[page_num].extract_text() or ""
+            pages.append(f"\n=== PÁGINA {page_num + 1} ===\n\n{text}")
+    return pages
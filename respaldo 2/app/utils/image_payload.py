@@ -0,0 +1,82 @@
+"""
+Image transport for the closet and try-on endpoints.
+
+Images arrive as multipart files (preferred), as a raw image/* body, or -
+for older clients - as base64 data URIs inside JSON. Each one is decoded
+exactly once into an ImageBlob; the pipeline passes the blob (its bytes are
+shared, never copied) and base64 only happens at the Gemini boundary
+(once per image, memoized) and in the JSON response.
+"""
+
+import base64
+import binascii
+import hashlib
+from flask import request
+
+DEFAULT_MIME_TYPE = 'image/jpeg'
+
+class ImagePayloadError(ValueError):
+    """The request carries an image that cannot be decoded"""
+
+class ImageBlob:
+    """Decoded image bytes and their MIME type"""
+
+    __slots__ = ('data', 'mime_type', '_b64', '_digest')
+
+    def __init__(self, data, mime_type=None):
+        self.data = data if isinstance(data, bytes) else bytes(data)
+        self.mime_type = mime_type or DEFAULT_MIME_TYPE
+        self._b64 = None
+        self._digest = None
+
+    def __len__(self):
+        return len(self.data)
+
+    @classmethod
+    def from_base64(cls, value):
+        """'data:image/png;base64,....' or bare base64 text"""
+        mime_type = None
+        if "base64," in value:
+            header, value = value.split("base64,", 1)
+            if header.startswith('data:'):
+                mime_type = header[5:].rstrip(';') or None
+        try:
+            return cls(base64.b64decode(value, validate=False), mime_type)
+        except (binascii.Error, ValueError) as e:
+            raise ImagePayloadError(f"Invalid base64 image: {e}")
+
+    def b64(self):
+        """Base64 text of the image, computed once (retries reuse it)"""
+        if self._b64 is None:
+            self._b64 = base64.b64encode(self.data).decode('ascii')
+        return self._b64
+
+    def digest(self):
+        """Content hash (sha1 hex), computed once"""
+        if self._digest is None:
+            self._digest = hashlib.sha1(self.data).hexdigest()
+        return self._digest
+
+    def data_uri(self):
+        return f"data:{self.mime_type};base64,{self.b64()}"
+
+def request_image(field):
+    """
+    The image of the current request: multipart file `field`, a raw image/*
+    body, or a base64 string in JSON field `field`. None when absent.
+    """
+    upload = request.files.get(field)
+    if upload is not None:
+        return ImageBlob(upload.read(), upload.mimetype)
+
+    if request.mimetype.startswith('image/'):
+        return ImageBlob(request.get_data(cache=False), request.mimetype)
+
+    data = request.get_json(silent=True) or {}
+    if data.get(field):
+        return ImageBlob.from_base64(data[field])
+    return None
+
+def request_images(field):
+    """All multipart files named `field`, in the order they were sent"""
+    return [ImageBlob(upload.read(), upload.mimetype) for upload in request.files.getlist(field)]
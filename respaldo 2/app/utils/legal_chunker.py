@@ -0,0 +1,191 @@
+"""
+Structure-aware chunker for legal documents.
+
+Splits the text FileExtractor produces on the structure of Mexican laws
+(TÍTULO / CAPÍTULO / SECCIÓN headings, Artículo N, fracciones) and on the
+'=== PÁGINA n ===' markers, instead of at a fixed character offset:
+
+- every article starts a new chunk, headings are glued to the article below;
+- an article over the token budget is split at fracción boundaries, then at
+  line/sentence boundaries, and continuation chunks repeat 'Artículo N';
+- text without structure (contracts, Excel dumps, notes) is packed by lines.
+
+iter_chunks() is a generator over a line iterator, so only the chunk being
+built is held in memory besides the source text.
+"""
+
+import re
+
+CHARS_PER_TOKEN = 4  # same approximation as the rest of the RAG code
+
+PAGE_RE = re.compile(r'^===\s*P[ÁA]GINA\s+(\d+)\s*===$', re.IGNORECASE)
+SHEET_RE = re.compile(r'^===\s*HOJA:\s*(.+?)\s*===$', re.IGNORECASE)
+HEADING_RE = re.compile(r'^(T[ÍI]TULO|CAP[ÍI]TULO|SECCI[ÓO]N|LIBRO|TRANSITORIOS?)\b', re.IGNORECASE)
+ARTICLE_RE = re.compile(
+    r'^Art[íi]culo\s+('
+    r'\d+(?:\s*[º°]|o|ro|do|er|to|mo|vo|no)?'  # 1, 1o, 1º, 2do
+    r'(?:[\s-]*(?:bis|ter|qu[áa]ter|quinquies|[A-Z](?![a-z])))?'
+    r'|[ÚU]nico|[A-Za-záéíóú]+)\s*[.\-–:]',
+    re.IGNORECASE
+)
+FRACTION_RE = re.compile(r'^([IVXLC]+)\s*[.\-–)]\s')
+SENTENCE_RE = re.compile(r'(?<=[.;:])\s+')
+
+class Chunk:
+    """One chunk of text plus where it came from"""
+
+    __slots__ = ('content', 'article', 'page', 'heading')
+
+    def __init__(self, content, article=None, page=None, heading=None):
+        self.content = content
+        self.article = article  # normalize_article() form ('5', '27 bis', '5 a', 'unico') or None
+        self.page = page        # PDF page where the chunk starts, or None
+        self.heading = heading  # closest TÍTULO/CAPÍTULO heading, or None
+
+# Ordinals written instead of digits ("Artículo Primero.-", "artículo quinto")
+TEXT_TO_DIGIT = {
+    'primero': '1', 'uno': '1', '1ro': '1',
+    'segundo': '2', 'dos': '2', '2do': '2',
+    'tercero': '3', 'tres': '3', '3ro': '3',
+    'cuarto': '4', 'cuatro': '4', '4to': '4',
+    'quinto': '5', 'cinco': '5', '5to': '5',
+    'sexto': '6', 'seis': '6', '6to': '6',
+    'septimo': '7', 'siete': '7', '7mo': '7', 'séptimo': '7',
+    'octavo': '8', 'ocho': '8', '8vo': '8',
+    'noveno': '9', 'nueve': '9', '9no': '9',
+    'decimo': '10', 'diez': '10', '10mo': '10', 'décimo': '10'
+}
+
+# Words after an article number that are part of it ("Artículo 27 Bis")
+ARTICLE_SUFFIXES = ('bis', 'ter', 'quater', 'quáter', 'quinquies')
+
+_ACCENTS = str.maketrans('áéíóú', 'aeiou')
+_ORDINAL_MARK_RE = re.compile(r'^(\d+)(?:\s*[º°]|o|ro|do|er|to|mo|vo|no)(?![a-z])')
+
+def normalize_article(value):
+    """
+    The one form article numbers are stored and looked up in (chunker and
+    query side): '1o' / '1º' / 'Primero' -> '1', '27-Bis' / '27 BIS' -> '27 bis',
+    '5 A' / '5-A' / '5A' -> '5 a', 'Único' -> 'unico'
+    """
+    value = value.strip().lower().translate(_ACCENTS)
+    value = _ORDINAL_MARK_RE.sub(r'\1', value)
+    value = re.sub(r'^(\d+)(?=[a-z])', r'\1 ', value)
+    head, _, rest = re.sub(r'[\s-]+', ' ', value).strip().partition(' ')
+    head = TEXT_TO_DIGIT.get(head, head)
+    return f"{head} {rest}" if rest else head
+
+def iter_lines(text):
+    """Yield the lines of text without building a list of them"""
+    for match in re.finditer(r'[^\n]*\n|[^\n]+$', text):
+        yield match.group(0).rstrip('\r\n')
+
+def iter_chunks(lines, max_tokens=500):
+    """
+    Yield Chunk objects from an iterable of lines (or a whole string).
+    max_tokens is the budget per chunk, estimated at CHARS_PER_TOKEN chars per token.
+    """
+    if isinstance(lines, str):
+        lines = iter_lines(lines)
+
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    page = None
+    heading = None
+    article = None
+    buffer = []          # lines of the chunk being built
+    buffer_chars = 0
+    buffer_page = None
+    preamble = True      # buffer holds only headings/intro text (keep them with the next article)
+    continued = False    # buffer continues an article split across chunks
+
+    def flush():
+        nonlocal buffer, buffer_chars, preamble
+        content = "\n".join(buffer).strip()
+        buffer, buffer_chars, preamble = [], 0, True
+        if content:
+            if continued and article:
+                content = f"Artículo {article} (continuación)\n{content}"
+            return Chunk(content, article=article, page=buffer_page, heading=heading)
+        return None
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        # Page/sheet markers only update metadata
+        match = PAGE_RE.match(line)
+        if match:
+            page = int(match.group(1))
+            continue
+        match = SHEET_RE.match(line)
+        if match:
+            heading = f"Hoja {match.group(1)}"
+            continue
+
+        is_heading = HEADING_RE.match(line)
+        article_match = ARTICLE_RE.match(line)
+        new_article = normalize_article(article_match.group(1)) if article_match else None
+
+        # Structure boundary: a heading or a new article closes the current chunk
+        # (short runs of headings are glued to the article that follows them)
+        if (is_heading or new_article) and buffer and (not preamble or buffer_chars > max_chars // 4):
+            chunk = flush()
+            if chunk:
+                yield chunk
+
+        if is_heading:
+            heading = line[:255]
+            article = None
+            continued = False
+        elif new_article:
+            article = new_article
+            continued = False
+
+        # Budget boundary: once half the budget is used, cut before the next
+        # fracción; otherwise cut when the line does not fit
+        half_full = buffer_chars > max_chars // 2 and FRACTION_RE.match(line)
+        if buffer and ((half_full and not preamble) or buffer_chars + len(line) > max_chars):
+            chunk = flush()
+            if chunk:
+                yield chunk
+            continued = True
+
+        # A single line longer than the budget is cut at sentence boundaries
+        pieces = [line] if len(line) <= max_chars else _split_long_line(line, max_chars)
+        for piece in pieces:
+            if buffer and buffer_chars + len(piece) > max_chars:
+                chunk = flush()
+                if chunk:
+                    yield chunk
+                continued = True
+            if not buffer:
+                buffer_page = page
+            buffer.append(piece)
+            buffer_chars += len(piece) + 1
+            if article is not None:
+                preamble = False
+
+    chunk = flush()
+    if chunk:
+        yield chunk
+
+def _split_long_line(line, max_chars):
+    pieces, current = [], ""
+    for sentence in SENTENCE_RE.split(line):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
@@ -0,0 +1,129 @@
+"""
+Token-budgeted prompt assembly.
+
+A prompt is described as named sections (each a list of items: RAG chunks,
+history lines, a single block of text...). PromptBuilder.fit() gives every
+required section its text first, then hands the remaining budget to the
+other sections in priority order:
+
+- items are kept whole, from the head (best-first lists) or from the tail
+  (history: the newest messages matter most);
+- a section whose first item does not fit gets that item truncated at a
+  paragraph/line/word boundary instead of disappearing;
+- per-section caps keep a single section (e.g. an ever-growing manual
+  knowledge base) from starving the others.
+
+Tokens are estimated at CHARS_PER_TOKEN chars per token, like the chunker,
+so no tokenizer or API call is needed per request.
+"""
+
+import math
+from app.utils.legal_chunker import CHARS_PER_TOKEN
+
+TRUNCATED_MARK = "[...]"
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to about max_tokens at a paragraph/line/word boundary, marking the cut"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    max_chars = max_tokens * CHARS_PER_TOKEN - len(TRUNCATED_MARK) - 1
+    if max_chars <= 0:
+        return ""
+    cut = text[:max_chars]
+    for separator in ('\n\n', '\n', ' '):
+        pos = cut.rfind(separator)
+        if pos > max_chars // 2:
+            cut = cut[:pos]
+            break
+    return f"{cut.rstrip()}\n{TRUNCATED_MARK}"
+
+class PromptSection:
+    """One part of the prompt and how it may be shrunk"""
+
+    __slots__ = ('name', 'items', 'priority', 'max_tokens', 'item_max_tokens', 'keep', 'separator', 'required')
+
+    def __init__(self, name, items, priority=0, max_tokens=None, item_max_tokens=None,
+                 keep='head', separator="\n", required=False):
+        self.name = name
+        self.items = [item for item in items if item]
+        self.priority = priority                # lower is filled first
+        self.max_tokens = max_tokens            # cap for the whole section
+        self.item_max_tokens = item_max_tokens  # cap for each item (long history messages)
+        self.keep = keep                        # 'head' or 'tail' when items must be dropped
+        self.separator = separator
+        self.required = required                # filled before the budget is shared out
+
+class PromptBuilder:
+    """Fits sections into budget_tokens. overhead_tokens is the fixed template text."""
+
+    def __init__(self, budget_tokens, overhead_tokens=0):
+        self.budget = budget_tokens
+        self.overhead = overhead_tokens
+        self.sections = []
+        self.tokens = {}    # section name -> tokens used, after fit()
+        self.trimmed = []   # sections that lost items or were truncated
+
+    def add(self, name, content, **options):
+        """content: a string (one item) or a list of items"""
+        items = [content] if isinstance(content, str) else list(content or [])
+        self.sections.append(PromptSection(name, items, **options))
+        return self
+
+    @property
+    def total_tokens(self):
+        return self.overhead + sum(self.tokens.values())
+
+    def fit(self):
+        """Returns {section name: fitted text}"""
+        fitted = {}
+        remaining = self.budget - self.overhead
+
+        ordered = sorted(self.sections, key=lambda section: (not section.required, section.priority))
+        for section in ordered:
+            allowance = section.max_tokens if section.max_tokens is not None else float('inf')
+            if not section.required:
+                allowance = min(allowance, max(remaining, 0))
+
+            text = self._fit_section(section, allowance)
+            fitted[section.name] = text
+            self.tokens[section.name] = estimate_tokens(text)
+            remaining -= self.tokens[section.name]
+
+        return fitted
+
+    def _fit_section(self, section, allowance):
+        items = section.items
+        if section.item_max_tokens:
+            items = [truncate_to_tokens(item, section.item_max_tokens) for item in items]
+
+        separator_tokens = estimate_tokens(section.separator)
+        order = items if section.keep == 'head' else list(reversed(items))
+        kept, used = [], 0
+        for item in order:
+            cost = estimate_tokens(item) + (separator_tokens if kept else 0)
+            if used + cost > allowance:
+                break
+            kept.append(item)
+            used += cost
+
+        if len(kept) < len(items) or items != section.items:
+            self.trimmed.append(section.name)
+        if not kept and order and allowance != float('inf'):
+            # Nothing fits whole: keep the most important item, truncated
+            kept = [truncate_to_tokens(order[0], int(allowance))]
+
+        if section.keep != 'head':
+            kept.reverse()
+        return section.separator.join(item for item in kept if item)
+
+    def summary(self):
+        """'1830/7000 tokens (rag=900 history=120 ...), trimmed: knowledge_base' for logs"""
+        parts = " ".join(f"{name}={tokens}" for name, tokens in self.tokens.items())
+        text = f"{self.total_tokens}/{self.budget} tokens ({parts})"
+        if self.trimmed:
+            text += f", trimmed: {', '.join(self.trimmed)}"
+        return text
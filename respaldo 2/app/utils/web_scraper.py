@@ -1,6 +1,8 @@
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import logging
+import threading
 from urllib.parse import urlparse
 from datetime import datetime
 
@@ -17,6 +19,10 @@ class WebScraper:
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
     
+    POOL_SIZE = 16  # keep-alive connections per host
+    _session = None
+    _session_lock = threading.Lock()
+    
     ALLOWED_DOMAINS = {
         'imss.gob.mx',
         'www.imss.gob.mx',
@@ -46,10 +52,29 @@ class WebScraper:
             return False
 
     @staticmethod
-    def fetch_and_clean(url):
+    def get_session():
+        """Shared requests.Session, so repeated fetches to the same sites reuse their connections"""
+        if WebScraper._session is None:
+            with WebScraper._session_lock:
+                if WebScraper._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=WebScraper.POOL_SIZE, pool_maxsize=WebScraper.POOL_SIZE)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    session.headers.update(WebScraper.HEADERS)
+                    WebScraper._session = session
+        return WebScraper._session
+
+    @staticmethod
+    def fetch_and_clean(url, etag=None, last_modified=None):
         """
         Fetches the URL and extracts the main text content.
         Returns a dictionary with success status and content/error.
+
+        With etag/last_modified (from a previous fetch) the request is
+        conditional: an unchanged page returns success with not_modified=True
+        and no content. Successful results carry the new 'etag' and
+        'last_modified' validators.
         """
         try:
             # 1. Validate domain
@@ -61,7 +86,21 @@ class WebScraper:
                 }
 
             # 2. Fetch content
-            response = requests.get(url, headers=WebScraper.HEADERS, timeout=WebScraper.TIMEOUT)
+            headers = {}
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+            response = WebScraper.get_session().get(url, headers=headers, timeout=WebScraper.TIMEOUT)
+            
+            if response.status_code == 304:
+                return {
+                    "success": True,
+                    "not_modified": True,
+                    "etag": response.headers.get('ETag') or etag,
+                    "last_modified": response.headers.get('Last-Modified') or last_modified,
+                    "fetched_at": datetime.utcnow().isoformat()
+                }
             response.raise_for_status()
             
             # 3. Parse and clean
@@ -92,7 +131,10 @@ class WebScraper:
                 
             return {
                 "success": True,
+                "not_modified": False,
                 "content": f"Title: {title}\n\n{text}",
+                "etag": response.headers.get('ETag'),
+                "last_modified": response.headers.get('Last-Modified'),
                 "fetched_at": datetime.utcnow().isoformat()
             }
             
@@ -1,11 +1,9 @@
 import os
 from app import create_app, db
 from app.models import KnowledgeBaseDocument, KnowledgeBaseChunk
-from app.services.rag_service import rag_service
-
-app = create_app()
 
 def reingest():
+    from app.services.rag_service import rag_service # loads the encoder model: main process only
     with app.app_context():
         print("=== RE-INGESTING DOCUMENTS ===")
         
@@ -14,6 +12,7 @@ def reingest():
         num_chunks = KnowledgeBaseChunk.query.delete()
         db.session.commit()
         print(f"Deleted {num_chunks} chunks.")
+        rag_service.reload_index()
         
         # 2. Re-ingest
         docs = KnowledgeBaseDocument.query.all()
@@ -46,4 +45,6 @@ def reingest():
         print("Done!")
 
 if __name__ == "__main__":
+    # Created here, not at import: PDF extraction workers re-import this script
+    app = create_app()
     reingest()
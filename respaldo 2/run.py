@@ -1,6 +1,9 @@
 from app import create_app
 
-app = create_app()
+# Spawned PDF extraction workers re-import this script as '__mp_main__' and
+# only need PyPDF2: they skip creating the app
+if __name__ != '__mp_main__':
+    app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True)
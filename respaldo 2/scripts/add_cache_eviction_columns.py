@@ -0,0 +1,44 @@
+import sys
+import os
+from sqlalchemy import text
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+
+app = create_app()
+
+# LRU bookkeeping used by app/services/cache_service.py
+COLUMNS = {
+    'last_used_at': 'DATETIME',
+    'hit_count': 'INTEGER DEFAULT 0'
+}
+
+def add_cache_eviction_columns():
+    with app.app_context():
+        with db.engine.connect() as conn:
+            result = conn.execute(text("PRAGMA table_info(cached_responses)"))
+            columns = [row[1] for row in result.fetchall()]
+
+            for name, sql_type in COLUMNS.items():
+                if name in columns:
+                    print(f"'{name}' column already exists.")
+                    continue
+
+                print(f"Adding '{name}' column to cached_responses table...")
+                try:
+                    conn.execute(text(f"ALTER TABLE cached_responses ADD COLUMN {name} {sql_type}"))
+                    conn.commit()
+                    print("Column added successfully.")
+                except Exception as e:
+                    print(f"Error adding column: {e}")
+
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_cached_responses_prof_last_used "
+                "ON cached_responses (professional_id, last_used_at)"
+            ))
+            conn.commit()
+
+if __name__ == '__main__':
+    add_cache_eviction_columns()
@@ -0,0 +1,42 @@
+import sys
+import os
+from sqlalchemy import text
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.services.cache_service import query_fingerprint
+
+app = create_app()
+
+def add_cache_query_hash():
+    with app.app_context():
+        with db.engine.connect() as conn:
+            result = conn.execute(text("PRAGMA table_info(cached_responses)"))
+            columns = [row[1] for row in result.fetchall()]
+
+            if 'query_hash' not in columns:
+                print("Adding 'query_hash' column to cached_responses table...")
+                conn.execute(text("ALTER TABLE cached_responses ADD COLUMN query_hash VARCHAR(40)"))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS idx_cached_responses_prof_hash "
+                    "ON cached_responses (professional_id, query_hash)"
+                ))
+                conn.commit()
+                print("Column added successfully.")
+            else:
+                print("'query_hash' column already exists.")
+
+            # Backfill existing entries so they are reachable by the exact-match tier
+            rows = conn.execute(text("SELECT id, query FROM cached_responses WHERE query_hash IS NULL")).fetchall()
+            for row_id, query in rows:
+                conn.execute(
+                    text("UPDATE cached_responses SET query_hash = :hash WHERE id = :id"),
+                    {'hash': query_fingerprint(query), 'id': row_id}
+                )
+            conn.commit()
+            print(f"✅ {len(rows)} cached responses hashed.")
+
+if __name__ == '__main__':
+    add_cache_query_hash()
@@ -0,0 +1,59 @@
+import sys
+import os
+from sqlalchemy import text
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.utils.legal_chunker import normalize_article
+
+app = create_app()
+
+# Structure metadata written by app/utils/legal_chunker.py
+COLUMNS = {
+    'article': 'VARCHAR(50)',
+    'page': 'INTEGER',
+    'heading': 'VARCHAR(255)'
+}
+
+def add_chunk_structure_columns():
+    with app.app_context():
+        with db.engine.connect() as conn:
+            result = conn.execute(text("PRAGMA table_info(knowledge_base_chunks)"))
+            columns = [row[1] for row in result.fetchall()]
+
+            for name, sql_type in COLUMNS.items():
+                if name in columns:
+                    print(f"'{name}' column already exists.")
+                    continue
+
+                print(f"Adding '{name}' column to knowledge_base_chunks table...")
+                try:
+                    conn.execute(text(f"ALTER TABLE knowledge_base_chunks ADD COLUMN {name} {sql_type}"))
+                    conn.commit()
+                    print("Column added successfully.")
+                except Exception as e:
+                    print(f"Error adding column: {e}")
+
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_kb_chunks_article ON knowledge_base_chunks (article)"))
+            conn.commit()
+
+            # Articles stored by an older normalize_article ('1o', 'primero')
+            rows = conn.execute(text("SELECT id, article FROM knowledge_base_chunks WHERE article IS NOT NULL")).fetchall()
+            updated = 0
+            for row_id, article in rows:
+                normalized = normalize_article(article)
+                if normalized != article:
+                    conn.execute(
+                        text("UPDATE knowledge_base_chunks SET article = :article WHERE id = :id"),
+                        {'article': normalized, 'id': row_id}
+                    )
+                    updated += 1
+            conn.commit()
+            print(f"✅ {updated} chunk articles re-normalized.")
+
+        print("Existing chunks keep NULL metadata; run reingest_all.py to re-chunk documents by article.")
+
+if __name__ == '__main__':
+    add_chunk_structure_columns()
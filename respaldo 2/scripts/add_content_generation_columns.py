@@ -0,0 +1,38 @@
+import sys
+import os
+from sqlalchemy import text
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+
+app = create_app()
+
+# Content generation numbers (see app/services/content_generation.py)
+COLUMNS = {
+    'professionals': ('content_generation', 'INTEGER DEFAULT 0'),
+    'cached_responses': ('generation', 'INTEGER DEFAULT 0')
+}
+
+def add_content_generation_columns():
+    with app.app_context():
+        with db.engine.connect() as conn:
+            for table, (name, sql_type) in COLUMNS.items():
+                result = conn.execute(text(f"PRAGMA table_info({table})"))
+                columns = [row[1] for row in result.fetchall()]
+
+                if name in columns:
+                    print(f"'{name}' column already exists in {table}.")
+                    continue
+
+                print(f"Adding '{name}' column to {table} table...")
+                try:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}"))
+                    conn.commit()
+                    print("Column added successfully.")
+                except Exception as e:
+                    print(f"Error adding column: {e}")
+
+if __name__ == '__main__':
+    add_content_generation_columns()
@@ -0,0 +1,38 @@
+import sys
+import os
+from sqlalchemy import text
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+
+app = create_app()
+
+# Conditional GET validators used by app/services/url_refresher.py
+COLUMNS = {
+    'etag': 'VARCHAR(255)',
+    'last_modified': 'VARCHAR(64)'
+}
+
+def add_url_validator_columns():
+    with app.app_context():
+        with db.engine.connect() as conn:
+            result = conn.execute(text("PRAGMA table_info(professional_urls)"))
+            columns = [row[1] for row in result.fetchall()]
+
+            for name, sql_type in COLUMNS.items():
+                if name in columns:
+                    print(f"'{name}' column already exists.")
+                    continue
+
+                print(f"Adding '{name}' column to professional_urls table...")
+                try:
+                    conn.execute(text(f"ALTER TABLE professional_urls ADD COLUMN {name} {sql_type}"))
+                    conn.commit()
+                    print("Column added successfully.")
+                except Exception as e:
+                    print(f"Error adding column: {e}")
+
+if __name__ == '__main__':
+    add_url_validator_columns()
@@ -0,0 +1,29 @@
+import sys
+import os
+from sqlalchemy import text
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import TryOnAttempt
+
+app = create_app()
+with app.app_context():
+    print("Creating tryon_attempts table...")
+    try:
+        TryOnAttempt.__table__.create(db.engine)
+        print("Table created successfully.")
+    except Exception as e:
+        print(f"Error creating table (might already exist): {e}")
+
+    # Tables created before the payer was recorded
+    with db.engine.connect() as conn:
+        result = conn.execute(text("PRAGMA table_info(tryon_attempts)"))
+        columns = [row[1] for row in result.fetchall()]
+
+        if 'professional_id' not in columns:
+            print("Adding 'professional_id' column to tryon_attempts table...")
+            conn.execute(text("ALTER TABLE tryon_attempts ADD COLUMN professional_id INTEGER REFERENCES professionals(id)"))
+            conn.commit()
+            print("Column added successfully.")
+        else:
+            print("'professional_id' column already exists.")
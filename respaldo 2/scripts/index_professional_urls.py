@@ -0,0 +1,63 @@
+import sys
+import os
+from sqlalchemy import text
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import ProfessionalURL, KnowledgeBaseDocument
+from app.services.rag_service import rag_service
+
+app = create_app()
+
+def add_source_url_column():
+    with db.engine.connect() as conn:
+        result = conn.execute(text("PRAGMA table_info(knowledge_base_documents)"))
+        columns = [row[1] for row in result.fetchall()]
+
+        if 'source_url_id' in columns:
+            print("'source_url_id' column already exists.")
+        else:
+            print("Adding 'source_url_id' column to knowledge_base_documents table...")
+            conn.execute(text(
+                "ALTER TABLE knowledge_base_documents ADD COLUMN source_url_id INTEGER REFERENCES professional_urls(id)"
+            ))
+            print("Column added successfully.")
+
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_kbdoc_source_url_id ON knowledge_base_documents (source_url_id)"))
+        conn.commit()
+
+def index_professional_urls():
+    """Chunk and embed the cached content of URLs that are not in the RAG index yet"""
+    with app.app_context():
+        add_source_url_column()
+        rag_service.load_index()
+
+        indexed = db.session.query(KnowledgeBaseDocument.source_url_id).filter(
+            KnowledgeBaseDocument.source_url_id.isnot(None)
+        )
+        urls = ProfessionalURL.query.filter(
+            ProfessionalURL.is_active == True,
+            ProfessionalURL.cached_content.isnot(None),
+            ProfessionalURL.id.notin_(indexed)
+        ).all()
+
+        print(f"Found {len(urls)} URLs to index.")
+
+        success_count = 0
+        for p_url in urls:
+            print(f"Processing: {p_url.url} (ID: {p_url.id})...")
+            doc = rag_service.replace_url_content(p_url)
+            db.session.commit()
+
+            if rag_service.ingest_document(doc.id, doc.text_content):
+                print(f"   [OK] Ingested successfully.")
+                success_count += 1
+            else:
+                print(f"   [FAIL] Failed to ingest.")
+
+        print(f"\n[DONE] {success_count}/{len(urls)} URLs indexed.")
+
+if __name__ == '__main__':
+    index_professional_urls()
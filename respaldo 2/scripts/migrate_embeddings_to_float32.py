@@ -0,0 +1,63 @@
+import sys
+import os
+import pickle
+from sqlalchemy import text
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.utils.embedding_codec import encode_embedding, decode_embedding
+
+# Tables that used to store embeddings as db.PickleType
+TABLES = ['knowledge_base_chunks', 'cached_responses']
+
+def legacy_to_vector(blob):
+    """Unpickle a legacy value (the old code pickled twice: pickle.dumps + PickleType)"""
+    value = blob
+    while isinstance(value, (bytes, bytearray, memoryview)):
+        value = pickle.loads(bytes(value))
+    return value
+
+def migrate_embeddings():
+    app = create_app()
+    with app.app_context():
+        print("🚀 Migrating embeddings from pickle to float32 bytes...")
+
+        for table in TABLES:
+            rows = db.session.execute(text(f"SELECT id, embedding FROM {table} WHERE embedding IS NOT NULL")).fetchall()
+            converted = 0
+            skipped = 0
+            failed = 0
+
+            for row_id, blob in rows:
+                if decode_embedding(blob) is not None:
+                    skipped += 1
+                    continue
+
+                try:
+                    vector = legacy_to_vector(blob)
+                    db.session.execute(
+                        text(f"UPDATE {table} SET embedding = :embedding WHERE id = :id"),
+                        {'embedding': encode_embedding(vector), 'id': row_id}
+                    )
+                    converted += 1
+                except Exception as e:
+                    print(f"   ❌ {table} #{row_id}: {e}")
+                    failed += 1
+
+            db.session.commit()
+            print(f"   {table}: {converted} converted, {skipped} already migrated, {failed} failed")
+
+        # The app mapped the pre-migration snapshots at startup: rebuild them
+        # from the converted rows. Running workers switch to the new snapshot
+        # generation on their next search, restarted ones map it.
+        from app.services.rag_service import rag_service
+        from app.services.cache_service import cache_service
+        rag_service.reload_index()
+        cache_service.reload_index()
+
+        print("✅ Migration completed. Snapshots rebuilt.")
+
+if __name__ == '__main__':
+    migrate_embeddings()
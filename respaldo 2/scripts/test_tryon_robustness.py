@@ -1,13 +1,16 @@
 import sys
 import os
+import time
 import base64
 import json
+import asyncio
 
 # Add parent dir to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import create_app
 from app.services.tryon_service import VirtualTryOnManager, TryOnStatus
+from app.utils.image_payload import ImageBlob
 
 def test_robust_tryon():
     app = create_app()
@@ -19,7 +22,8 @@ def test_robust_tryon():
         # A tiny white pixel
         pixel_b64 = "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
         
-        items = [{"id": 101, "category": "Dress", "image": pixel_b64}]
+        items = [{"id": 101, "category": "Dress", "image": ImageBlob.from_base64(pixel_b64)}]
+        person = ImageBlob.from_base64(pixel_b64)
         
         # Initialize Manager
         manager = VirtualTryOnManager("test_client_001")
@@ -31,19 +35,19 @@ def test_robust_tryon():
         # If we don't want to burn credits or need API keys, we should mock gemini_service.
         # But for integration testing, we might want to see it fail or succeed.
         # Given we might not have a valid API key or want to spend money, 
-        # let's mock the gemini_service.generate_try_on method temporarily.
+        # let's mock the gemini_service.generate_try_on_async method temporarily.
         
-        from unittest.mock import MagicMock
+        from unittest.mock import AsyncMock
         from app.services.gemini_service import gemini_service
         
         # Mock SUCCESS on 1st attempt
-        gemini_service.generate_try_on = MagicMock(return_value={
+        gemini_service.generate_try_on_async = AsyncMock(return_value={
             'success': True,
             'description': "A beautiful dress on the person.",
             'image': pixel_b64 # Return same image to pass SSIM (Perfect match)
         })
         
-        result = manager.virtual_tryon(pixel_b64, items)
+        result = asyncio.run(manager.virtual_tryon(person, items))
         print(f"Status: {result['status']}")
         print(f"Attempts: {result['attempts']}")
         print(f"Logs: {result['logs']}")
@@ -60,13 +64,13 @@ def test_robust_tryon():
         # We simulate failure by returning success=False OR by returning an image with low SSIM.
         # Let's simulate API Failure first.
         
-        gemini_service.generate_try_on = MagicMock(side_effect=[
+        gemini_service.generate_try_on_async = AsyncMock(side_effect=[
             {'success': False, 'error': 'API Error 1'},
             {'success': False, 'error': 'API Error 2'},
             {'success': True, 'description': 'Success on 3rd', 'image': pixel_b64}
         ])
         
-        result = manager.virtual_tryon(pixel_b64, items)
+        result = asyncio.run(manager.virtual_tryon(person, items))
         print(f"Status: {result['status']}")
         print(f"Attempts: {result['attempts']}")
         print(f"Logs: {result['logs']}")
@@ -76,10 +80,53 @@ def test_robust_tryon():
         else:
             print("❌ Test 2 Failed.")
 
-        # 3. Test Billing Logic (Simulated via API Route)
-        # We can't easily test the API route here without running the server, 
-        # but we can verify the 'platform_absorbed' calculation logic manually or via unit test.
-        # Let's trust the logic we wrote in api.py for now based on the manager results.
+        # 3. Test Speculative Mode (3 attempts in flight, 2nd finishes first and passes)
+        print("\n--- Test 3: Speculative Mode (fan-out 3) ---")
+        
+        async def slow_attempt(person_image, item_images, prompt, seed=None):
+            # seed 12347 = attempt 2: fastest; the others are still running when it passes
+            await asyncio.sleep(0.1 if seed == 12347 else 2)
+            return {'success': True, 'description': f'seed {seed}', 'image': pixel_b64}
+        
+        gemini_service.generate_try_on_async = slow_attempt
+        gemini_service.TRY_ON_RETURNS_IMAGE = True # results can be validated: speculation allowed
+        manager = VirtualTryOnManager("test_client_001", speculative_fanout=3)
+        started = time.perf_counter()
+        result = asyncio.run(manager.virtual_tryon(person, items))
+        elapsed = time.perf_counter() - started
+        print(f"Status: {result['status']} in {elapsed:.2f}s (winning attempt {result.get('winning_attempt')})")
+        for record in result['attempt_records']:
+            print(f"   Attempt {record['attempt']}: {record['status']} -> {record['billed_to']} ${record['cost_usd']:.2f}")
+        
+        statuses = [record['status'] for record in result['attempt_records']]
+        if result.get('winning_attempt') == 2 and statuses == ['cancelled', 'passed', 'cancelled'] and elapsed < 1:
+            print("✅ Test 3 Passed: First valid result won, the rest were cancelled.")
+        else:
+            print("❌ Test 3 Failed.")
+
+        # 4. Test Cost Cap (platform absorbs at most one extra attempt)
+        print("\n--- Test 4: Cost Cap ---")
+        manager = VirtualTryOnManager("test_client_001", speculative_fanout=3)
+        manager.MAX_ABSORBED_COST = manager.COST_PER_ATTEMPT
+        print(f"Max attempts: {manager.max_attempts()}")
+        if manager.max_attempts() == 2:
+            print("✅ Test 4 Passed: Attempts capped by absorbed cost.")
+        else:
+            print("❌ Test 4 Failed.")
+
+        # 5. Test Fan-out Clamp (text-only results: nothing to validate, no speculation)
+        print("\n--- Test 5: Fan-out Clamp without Images ---")
+        gemini_service.TRY_ON_RETURNS_IMAGE = False
+        gemini_service.generate_try_on_async = AsyncMock(return_value={
+            'success': True, 'description': "Text only", 'image': None
+        })
+        manager = VirtualTryOnManager("test_client_001", speculative_fanout=3)
+        result = asyncio.run(manager.virtual_tryon(person, items))
+        print(f"Status: {result['status']}, launched: {result['attempts']}")
+        if result['status'] == TryOnStatus.SUCCESS.value and gemini_service.generate_try_on_async.await_count == 1:
+            print("✅ Test 5 Passed: One paid call, no speculative attempts.")
+        else:
+            print("❌ Test 5 Failed.")
 
 if __name__ == "__main__":
     test_robust_tryon()
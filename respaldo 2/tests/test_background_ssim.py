@@ -0,0 +1,94 @@
+"""
+Unit tests for BackgroundSSIM in app/services/tryon_service.py (no server needed)
+
+Run with: python -m pytest tests/test_background_ssim.py -v
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('cv2')
+
+# Importing the service builds gemini_service, which requires a key (never used here)
+os.environ.setdefault('GEMINI_API_KEY', 'test-key')
+
+from app.services.tryon_service import BackgroundSSIM
+
+THRESHOLD = 0.85
+
+
+def photo(size=64, seed=0):
+    """Smooth random 'photo': low-frequency noise upsampled, 0-255 uint8"""
+    import cv2
+    coarse = np.random.default_rng(seed).uniform(0, 255, (8, 8)).astype(np.float32)
+    return cv2.resize(coarse, (size, size), interpolation=cv2.INTER_CUBIC).clip(0, 255).astype(np.uint8)
+
+
+def noisy(image, sigma, seed=1):
+    noise = np.random.default_rng(seed).normal(0, sigma, image.shape)
+    return (image + noise).clip(0, 255).astype(np.uint8)
+
+
+class TestAgainstReference:
+    """Same formula and 7x7 window as skimage's structural_similarity"""
+
+    @pytest.mark.parametrize("sigma", [5, 20, 60])
+    def test_matches_skimage(self, sigma):
+        metrics = pytest.importorskip('skimage.metrics')
+        x = photo(64)
+        y = noisy(x, sigma)
+
+        # At the 64 px level the images are not resized; skimage leaves out a
+        # 3 px border, so the mask does too
+        mask = np.zeros(x.shape, dtype=bool)
+        mask[3:-3, 3:-3] = True
+        ssim = BackgroundSSIM(x, mask)
+        ours = ssim._ssim(ssim.levels[0], y)
+
+        _, ssim_map = metrics.structural_similarity(x, y, win_size=7, data_range=255, full=True)
+        reference = ssim_map[3:-3, 3:-3].mean()
+
+        assert ours == pytest.approx(reference, abs=1e-3)
+
+
+class TestBackgroundScore:
+    """score(): masked to the background, early exit on the coarse level"""
+
+    def test_identical_image(self):
+        x = photo(256)
+        assert BackgroundSSIM(x).score(x, THRESHOLD) == pytest.approx(1.0, abs=1e-4)
+
+    def test_only_background_counts(self):
+        x = photo(256)
+        mask = np.zeros(x.shape, dtype=bool)
+        mask[:, :128] = True  # left half is background
+
+        subject_changed = x.copy()
+        subject_changed[:, 128:] = 255 - subject_changed[:, 128:]
+        background_changed = x.copy()
+        background_changed[:, :128] = 255 - background_changed[:, :128]
+
+        ssim = BackgroundSSIM(x, mask)
+        assert ssim.score(subject_changed, THRESHOLD) > THRESHOLD
+        assert ssim.score(background_changed, THRESHOLD) < THRESHOLD
+
+    def test_coarse_level_decides_clear_cases(self, monkeypatch):
+        x = photo(256)
+        ssim = BackgroundSSIM(x)
+        calls = []
+        original = BackgroundSSIM._ssim
+
+        def spy(self, level, gray_out):
+            calls.append(level['dsize'])
+            return original(self, level, gray_out)
+
+        monkeypatch.setattr(BackgroundSSIM, '_ssim', spy)
+        ssim.score(x, THRESHOLD)
+        assert calls == [ssim.levels[0]['dsize']]
+
+    def test_default_mask_excludes_center(self):
+        mask = BackgroundSSIM.default_mask((100, 80))
+        assert mask[0, 0] and mask[-1, -1]
+        assert not mask[55, 40]
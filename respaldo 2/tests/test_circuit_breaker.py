@@ -0,0 +1,80 @@
+"""
+Unit tests for CircuitBreaker in app/services/gemini_client.py (no server needed)
+
+Run with: python -m pytest tests/test_circuit_breaker.py -v
+"""
+
+from app.services.gemini_client import CircuitBreaker
+
+
+def open_breaker(threshold=3, cooldown=30):
+    breaker = CircuitBreaker(threshold, cooldown)
+    for _ in range(threshold):
+        breaker.record_failure()
+    return breaker
+
+
+def expire_cooldown(breaker):
+    breaker.opened_at -= breaker.cooldown
+
+
+class TestCircuitBreaker:
+    """closed -> open -> half-open -> closed/open"""
+
+    def test_stays_closed_below_threshold(self):
+        breaker = CircuitBreaker(3, 30)
+        breaker.record_failure()
+        breaker.record_failure()
+
+        assert breaker.state == 'closed'
+        assert breaker.allow()
+
+    def test_success_resets_failure_count(self):
+        breaker = CircuitBreaker(3, 30)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.state == 'closed'
+
+    def test_opens_at_threshold(self):
+        breaker = open_breaker()
+
+        assert breaker.state == 'open'
+        assert not breaker.allow()
+
+    def test_half_open_allows_a_single_trial(self):
+        breaker = open_breaker()
+        expire_cooldown(breaker)
+
+        assert breaker.state == 'half-open'
+        assert breaker.allow()
+        assert not breaker.allow()  # concurrent calls wait for the trial
+
+    def test_trial_success_closes(self):
+        breaker = open_breaker()
+        expire_cooldown(breaker)
+        breaker.allow()
+        breaker.record_success()
+
+        assert breaker.state == 'closed'
+        assert breaker.allow() and breaker.allow()
+
+    def test_trial_failure_reopens(self):
+        breaker = open_breaker()
+        expire_cooldown(breaker)
+        breaker.allow()
+        breaker.record_failure()
+
+        assert breaker.state == 'open'
+        assert not breaker.allow()
+
+    def test_released_trial_lets_the_next_call_try(self):
+        breaker = open_breaker()
+        expire_cooldown(breaker)
+        breaker.allow()
+        breaker.release()  # trial call cancelled without an outcome
+
+        assert breaker.state == 'half-open'
+        assert breaker.allow()
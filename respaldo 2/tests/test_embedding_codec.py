@@ -0,0 +1,68 @@
+"""
+Unit tests for app/utils/embedding_codec.py (no server needed)
+
+Run with: python -m pytest tests/test_embedding_codec.py -v
+"""
+
+import pickle
+
+import numpy as np
+
+from app.utils.embedding_codec import decode_embedding, decode_embeddings, encode_embedding
+
+
+class TestSingleVector:
+    """encode_embedding / decode_embedding"""
+
+    def test_round_trip(self):
+        vector = np.random.default_rng(0).standard_normal(384).astype('float32')
+        blob = encode_embedding(vector)
+
+        assert len(blob) == 8 + 384 * 4
+        decoded = decode_embedding(blob)
+        assert decoded.dtype == np.float32
+        np.testing.assert_array_equal(decoded, vector)
+
+    def test_accepts_lists_and_float64(self):
+        decoded = decode_embedding(encode_embedding([0.5, -1.0, 2.0]))
+        np.testing.assert_array_equal(decoded, np.array([0.5, -1.0, 2.0], dtype='float32'))
+
+    def test_decoded_vector_is_writable(self):
+        decoded = decode_embedding(encode_embedding([1.0, 2.0]))
+        decoded[0] = 3.0  # not a view over the immutable blob
+
+    def test_legacy_and_invalid_blobs(self):
+        vector = np.ones(4, dtype='float32')
+        # Legacy rows: pickled twice (pickle.dumps + db.PickleType)
+        assert decode_embedding(pickle.dumps(pickle.dumps(vector))) is None
+        assert decode_embedding(None) is None
+        assert decode_embedding(b'') is None
+        assert decode_embedding(b'EV') is None
+        # Truncated: the header announces more floats than the blob holds
+        assert decode_embedding(encode_embedding(vector)[:-4]) is None
+
+
+class TestBatchDecode:
+    """decode_embeddings: one np.frombuffer over many blobs, legacy rows masked out"""
+
+    def test_mixed_batch(self):
+        rng = np.random.default_rng(1)
+        vectors = rng.standard_normal((3, 8)).astype('float32')
+        blobs = [
+            encode_embedding(vectors[0]),
+            pickle.dumps(vectors[1]),             # legacy
+            None,                                  # missing
+            encode_embedding(vectors[2]),
+            encode_embedding(np.ones(4, dtype='float32')),  # wrong dimension
+        ]
+
+        matrix, valid = decode_embeddings(blobs, 8)
+
+        assert valid.tolist() == [True, False, False, True, False]
+        assert matrix.shape == (2, 8)
+        np.testing.assert_array_equal(matrix, vectors[[0, 2]])
+
+    def test_nothing_valid(self):
+        matrix, valid = decode_embeddings([None, b'x'], 8)
+        assert matrix.shape == (0, 8)
+        assert not valid.any()
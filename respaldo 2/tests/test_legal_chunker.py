@@ -0,0 +1,100 @@
+"""
+Unit tests for app/utils/legal_chunker.py (no server needed)
+
+Run with: python -m pytest tests/test_legal_chunker.py -v
+"""
+
+import pytest
+
+from app.utils.legal_chunker import ARTICLE_RE, iter_chunks, normalize_article
+
+
+def article_of(line):
+    match = ARTICLE_RE.match(line)
+    return normalize_article(match.group(1)) if match else None
+
+
+class TestNormalizeArticle:
+    """normalize_article: the one form article numbers are stored in"""
+
+    @pytest.mark.parametrize("value, expected", [
+        ("5", "5"),
+        ("1o", "1"),
+        ("1º", "1"),
+        ("1 °", "1"),
+        ("2do", "2"),
+        ("Primero", "1"),
+        ("décimo", "10"),
+        ("27-Bis", "27 bis"),
+        ("27 BIS", "27 bis"),
+        ("27bis", "27 bis"),
+        ("5 A", "5 a"),
+        ("5-A", "5 a"),
+        ("5A", "5 a"),
+        ("Único", "unico"),
+    ])
+    def test_forms(self, value, expected):
+        assert normalize_article(value) == expected
+
+    def test_idempotent(self):
+        for value in ("1", "27 bis", "5 a", "unico"):
+            assert normalize_article(value) == value
+
+
+class TestArticleHeadings:
+    """ARTICLE_RE + normalize_article on the lines of a law"""
+
+    @pytest.mark.parametrize("line, expected", [
+        ("Artículo 5.- Las cuotas se pagan cada mes.", "5"),
+        ("Artículo 1o.- Esta Ley es de observancia general.", "1"),
+        ("Artículo 1º.- Esta Ley es de observancia general.", "1"),
+        ("Artículo Primero.- El presente Decreto entrará en vigor.", "1"),
+        ("Artículo 5 A.- Para los efectos de esta Ley.", "5 a"),
+        ("ARTICULO 27 Bis.- Texto.", "27 bis"),
+        ("Artículo Único.- Se reforma.", "unico"),
+    ])
+    def test_heading(self, line, expected):
+        assert article_of(line) == expected
+
+    def test_not_a_heading(self):
+        assert article_of("El artículo 5 establece las cuotas.") is None
+        assert article_of("Artículo 5 de la Ley del Seguro Social") is None
+
+
+class TestIterChunks:
+    """iter_chunks: one chunk per article, pages and headings carried along"""
+
+    def test_one_chunk_per_article(self):
+        text = (
+            "=== PÁGINA 1 ===\n"
+            "CAPÍTULO I\n"
+            "Artículo 1o.- Esta Ley es de observancia general.\n"
+            "Artículo 2.- El seguro social tiene por finalidad garantizar la salud.\n"
+            "=== PÁGINA 2 ===\n"
+            "Artículo 3.- La realización de la seguridad social está a cargo del Estado.\n"
+        )
+        chunks = list(iter_chunks(text))
+
+        assert [c.article for c in chunks] == ["1", "2", "3"]
+        assert [c.page for c in chunks] == [1, 1, 2]
+        assert chunks[0].content.startswith("CAPÍTULO I")
+        assert chunks[0].heading == "CAPÍTULO I"
+
+    def test_long_article_split_at_fractions(self):
+        fractions = "\n".join(f"{numeral}. " + "texto de la fracción " * 20 for numeral in ("I", "II", "III", "IV"))
+        text = "Artículo 5.- Son obligaciones del patrón:\n" + fractions
+        chunks = list(iter_chunks(text, max_tokens=120))
+
+        assert len(chunks) > 1
+        assert all(c.article == "5" for c in chunks)
+        assert all(len(c.content) <= 120 * 4 + 40 for c in chunks)
+        # Continuation chunks repeat the article so they stand on their own
+        assert all("Artículo 5" in c.content for c in chunks[1:])
+
+    def test_unstructured_text_packed_by_lines(self):
+        text = "\n".join(f"Renglón {i} de una nota sin estructura." for i in range(200))
+        chunks = list(iter_chunks(text, max_tokens=100))
+
+        assert len(chunks) > 1
+        assert all(c.article is None for c in chunks)
+        assert "".join(c.content.replace("\n", "") for c in chunks) == text.replace("\n", "")
@@ -0,0 +1,61 @@
+"""
+Unit tests for the query side of hybrid retrieval in app/services/lexical_index.py
+(no server needed)
+
+Run with: python -m pytest tests/test_lexical_index.py -v
+"""
+
+import pytest
+
+from app.services.lexical_index import parse_references, reciprocal_rank_fusion
+from app.utils.legal_chunker import ARTICLE_RE, normalize_article
+
+
+class TestParseReferences:
+    """parse_references: cited provisions in a user question"""
+
+    def test_article_and_fraction(self):
+        assert parse_references("¿Qué dice el artículo quinto, fracción II?") == [
+            ("artículo", "5"), ("fracción", "ii")
+        ]
+
+    def test_suffixes(self):
+        assert parse_references("articulo 27 bis") == [("articulo", "27 bis")]
+        assert parse_references("el artículo 5 A de la ley") == [("artículo", "5 a")]
+        # A lowercase 'a' after the number is the preposition
+        assert parse_references("aplica el artículo 10 a los trabajadores") == [("artículo", "10")]
+
+    def test_no_reference(self):
+        assert parse_references("¿Cómo me registro en el IMSS?") == []
+
+    @pytest.mark.parametrize("heading, query", [
+        ("Artículo 1o.- Texto.", "¿qué dice el artículo 1o?"),
+        ("Artículo 1º.- Texto.", "artículo 1°"),
+        ("Artículo Primero.- Entra en vigor.", "artículo primero transitorio"),
+        ("Artículo 5 A.- Texto.", "artículo 5 A"),
+        ("Artículo 5-A.- Texto.", "artículo 5-A"),
+        ("Artículo 27 Bis.- Texto.", "artículo 27 BIS"),
+        ("Artículo Único.- Texto.", "artículo único"),
+    ])
+    def test_round_trip_with_chunker(self, heading, query):
+        """What the chunker stores is what a question citing it looks up"""
+        stored = normalize_article(ARTICLE_RE.match(heading).group(1))
+        cited = [value for marker, value in parse_references(query) if marker in ("artículo", "articulo")]
+        assert cited[0] == stored
+
+
+class TestReciprocalRankFusion:
+    """reciprocal_rank_fusion: score(id) = sum(1 / (k + rank))"""
+
+    def test_agreement_wins(self):
+        fused = reciprocal_rank_fusion([[1, 2, 3], [3, 2, 4]])
+        # 3: 1/63 + 1/61 > 2: 2/62 > 1: 1/61 > 4: 1/63
+        assert fused == [3, 2, 1, 4]
+
+    def test_scores(self):
+        fused = reciprocal_rank_fusion([[10, 20], [20]], k=1)
+        # 20: 1/3 + 1/2 > 10: 1/2
+        assert fused == [20, 10]
+
+    def test_empty(self):
+        assert reciprocal_rank_fusion([[], []]) == []
@@ -0,0 +1,112 @@
+"""
+Unit tests for app/utils/prompt_builder.py (no server needed)
+
+Run with: python -m pytest tests/test_prompt_builder.py -v
+"""
+
+from app.utils.prompt_builder import TRUNCATED_MARK, PromptBuilder, estimate_tokens, truncate_to_tokens
+
+
+def words(n, word="palabra"):
+    """n words of 8 chars each with their space: about 2 tokens per word"""
+    return " ".join([word] * n)
+
+
+class TestTruncate:
+    """truncate_to_tokens: cut at a boundary, marked"""
+
+    def test_short_text_untouched(self):
+        assert truncate_to_tokens("hola mundo", 10) == "hola mundo"
+
+    def test_cut_at_paragraph(self):
+        text = words(30) + "\n\n" + words(30)
+        cut = truncate_to_tokens(text, 80)
+
+        assert cut == words(30) + "\n" + TRUNCATED_MARK
+        assert estimate_tokens(cut) <= 80
+
+    def test_cut_at_word(self):
+        cut = truncate_to_tokens(words(100), 20)
+        assert cut.endswith("palabra\n" + TRUNCATED_MARK)
+        assert estimate_tokens(cut) <= 20
+
+    def test_no_room(self):
+        assert truncate_to_tokens(words(10), 1) == ""
+
+
+class TestPromptBuilder:
+    """PromptBuilder.fit: required sections first, the rest by priority within the budget"""
+
+    def test_everything_fits(self):
+        builder = PromptBuilder(1000)
+        builder.add('system', "Eres un asesor.", required=True)
+        builder.add('rag', ["uno", "dos"], priority=1)
+        fitted = builder.fit()
+
+        assert fitted == {'system': "Eres un asesor.", 'rag': "uno\ndos"}
+        assert builder.trimmed == []
+
+    def test_total_within_budget(self):
+        builder = PromptBuilder(200, overhead_tokens=20)
+        builder.add('message', words(10), required=True)
+        builder.add('rag', [words(20) for _ in range(5)], priority=1)
+        builder.add('history', [words(5) for _ in range(10)], priority=2, keep='tail')
+        builder.fit()
+
+        assert builder.total_tokens <= 200
+        assert 'rag' in builder.trimmed
+
+    def test_priority_order(self):
+        builder = PromptBuilder(100)
+        builder.add('low', [words(30)], priority=2)
+        builder.add('high', [words(30)], priority=1)
+        fitted = builder.fit()
+
+        assert fitted['high'] == words(30)
+        # 'low' does not fit whole: it gets the leftover, truncated
+        assert fitted['low'].endswith(TRUNCATED_MARK)
+        assert builder.total_tokens <= 100
+
+    def test_history_keeps_newest(self):
+        history = [f"mensaje {i} " + words(4) for i in range(10)]
+        builder = PromptBuilder(60)
+        builder.add('history', history, keep='tail')
+        fitted = builder.fit()['history']
+
+        kept = fitted.split("\n")
+        assert kept == history[-len(kept):]
+        assert len(kept) < len(history)
+
+    def test_section_cap(self):
+        builder = PromptBuilder(10000)
+        builder.add('knowledge_base', [words(50) for _ in range(10)], max_tokens=250)
+        builder.add('services', ["corte", "tinte"], priority=1)
+        fitted = builder.fit()
+
+        assert builder.tokens['knowledge_base'] <= 250
+        assert fitted['services'] == "corte\ntinte"
+
+    def test_item_cap(self):
+        builder = PromptBuilder(10000)
+        builder.add('history', [words(100), "corto"], item_max_tokens=20)
+        fitted = builder.fit()['history']
+
+        first, second = fitted.split("\n" + TRUNCATED_MARK + "\n")
+        assert estimate_tokens(first + "\n" + TRUNCATED_MARK) <= 20
+        assert second == "corto"
+        assert builder.trimmed == ['history']
+
+    def test_required_section_ignores_budget(self):
+        builder = PromptBuilder(10)
+        builder.add('message', words(50), required=True)
+        builder.add('rag', ["contexto"], priority=1)
+        fitted = builder.fit()
+
+        assert fitted['message'] == words(50)
+        assert fitted['rag'] == ""
+
+    def test_summary(self):
+        builder = PromptBuilder(100, overhead_tokens=10)
+        builder.add('message', "hola", required=True)
+        builder.fit()
+        assert builder.summary() == "11/100 tokens (message=1)"
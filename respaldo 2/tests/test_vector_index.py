@@ -0,0 +1,115 @@
+"""
+Unit tests for app/services/vector_index.py (no server needed)
+
+Run with: python -m pytest tests/test_vector_index.py -v
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('faiss')
+
+from app.services.vector_index import PartitionedIndex
+from app.services.vector_snapshot import VectorSnapshot
+
+DIM = 8
+
+
+def unit_vectors(n, seed):
+    vectors = np.random.default_rng(seed).standard_normal((n, DIM)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    """Snapshot with ids 1-5 in partition 1 and ids 6-8 in partition 2"""
+    store = VectorSnapshot('test', DIM)
+    store.configure(str(tmp_path))
+    vectors = unit_vectors(8, seed=0)
+    store.write(np.arange(1, 9), [1, 1, 1, 1, 1, 2, 2, 2], vectors)
+    return store.load(), vectors
+
+
+class TestPartitions:
+    """In-memory FAISS partitions"""
+
+    def test_search_stays_in_partition(self):
+        index = PartitionedIndex(DIM)
+        vectors = unit_vectors(6, seed=1)
+        index.add(1, [10, 11, 12], vectors[:3])
+        index.add(2, [20, 21, 22], vectors[3:])
+
+        scores, ids = index.search(1, vectors[4], 10)
+
+        assert set(ids.tolist()) == {10, 11, 12}
+        assert list(scores) == sorted(scores, reverse=True)
+        assert index.size(1) == 3 and index.ntotal == 6
+
+    def test_remove(self):
+        index = PartitionedIndex(DIM)
+        vectors = unit_vectors(3, seed=2)
+        index.add(1, [1, 2, 3], vectors)
+
+        assert index.remove(1, [2, 99]) == 1
+        _, ids = index.search(1, vectors[1], 10)
+        assert 2 not in ids.tolist()
+        assert index.size(1) == 2
+
+
+class TestSnapshotBase:
+    """Mapped snapshot as the base of every partition, with tombstones"""
+
+    def test_base_search(self, snapshot):
+        data, vectors = snapshot
+        index = PartitionedIndex(DIM)
+        index.attach(data)
+
+        scores, ids = index.search(1, vectors[2], 1)
+        assert ids.tolist() == [3]
+        assert scores[0] == pytest.approx(1.0, abs=1e-5)
+        assert index.size(1) == 5 and index.size(2) == 3
+
+    def test_tombstones_hide_base_rows(self, snapshot):
+        data, vectors = snapshot
+        index = PartitionedIndex(DIM)
+        index.attach(data)
+
+        # 7 belongs to partition 2: removing it from partition 1 is a no-op
+        assert index.remove(1, [3, 7]) == 1
+        assert index.remove(1, [3]) == 0  # already tombstoned
+
+        _, ids = index.search(1, vectors[2], 10)
+        assert 3 not in ids.tolist()
+        assert index.size(1) == 4
+        _, ids = index.search(2, vectors[6], 10)
+        assert 7 in ids.tolist()
+
+    def test_new_vectors_merge_with_base(self, snapshot):
+        data, vectors = snapshot
+        index = PartitionedIndex(DIM)
+        index.attach(data)
+        index.add(1, [100], vectors[0:1])
+
+        _, ids = index.search(1, vectors[0], 2)
+        assert set(ids.tolist()) == {1, 100}
+        assert index.size(1) == 6
+
+    def test_reattach_drops_covered_state(self, tmp_path, snapshot):
+        data, vectors = snapshot
+        index = PartitionedIndex(DIM)
+        index.attach(data)
+        index.remove(1, [3])
+        index.add(1, [9], vectors[0:1])
+
+        # Next generation already reflects the removal of 3 and the addition of 9
+        store = VectorSnapshot('next', DIM)
+        store.configure(str(tmp_path))
+        ids = [1, 2, 4, 5, 9, 6, 7, 8]
+        store.write(ids, [1, 1, 1, 1, 1, 2, 2, 2], vectors[[0, 1, 3, 4, 0, 5, 6, 7]])
+        index.attach(store.load())
+
+        assert index.removed == {}
+        assert index.partitions == {}
+        assert index.size(1) == 5
+        _, found = index.search(1, vectors[0], 10)
+        assert sorted(found.tolist()) == [1, 2, 4, 5, 9]